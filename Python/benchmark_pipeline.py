@@ -0,0 +1,191 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+
+import polars as pl
+
+from fetch_sportappfi_api import build_game_frame, extract_players_from_summary_pl, iter_drive_plays, transform_games
+from helper_add_ep_wp import add_ep_variables, add_wp_variables, enrich_by_game
+from helper_add_hudl_mutations import make_hudl_mutations, prepare_ep_data, prepare_model_data
+from helper_model_scoring import score_ep, score_wp
+from synthetic_pbp import synthetic_hudl, synthetic_season
+
+DEFAULT_SCALES = [10, 100]
+HISTORY_PATH = "benchmarks/history.jsonl"
+
+def _reset_peak_rss() -> bool:
+    # Setzt VmHWM zurueck (Linux), sonst bleibt der Peak des ganzen Prozesses
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss ist unter Linux in KB, unter macOS in Bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if platform.system() == "Darwin" else 1024)
+
+def _parse_games(season: list) -> pl.DataFrame:
+    # Wie process_games_pl zusammenhaengend, die Stages danach laufen sonst ueber Hunderte Chunks
+    frames = [build_game_frame(game_id, iter_drive_plays(drives), match) for game_id, drives, match in season]
+    return pl.concat([frame for frame in frames if frame is not None], how="vertical_relaxed", rechunk=True)
+
+def _scored(plays: pl.DataFrame) -> pl.DataFrame:
+    return score_wp(score_ep(prepare_model_data(plays)))
+
+def _enriched(scored: pl.DataFrame) -> pl.DataFrame:
+    return add_wp_variables(add_ep_variables(scored))
+
+# Stage -> (Input der Stage aus den vorherigen Outputs, Funktion); die Reihenfolge ist die der Pipeline
+STAGES = {
+    "parse_games": (lambda data: data["season"], _parse_games),
+    "extract_players": (lambda data: data["raw"], extract_players_from_summary_pl),
+    "transform_games": (lambda data: data["raw"], transform_games),
+    "make_hudl_mutations": (lambda data: data["hudl_raw"], make_hudl_mutations),
+    "prepare_ep_data": (lambda data: data["plays"], prepare_ep_data),
+    "prepare_model_data": (lambda data: data["plays"], prepare_model_data),
+    "score_ep": (lambda data: data["prepared"], score_ep),
+    "score_wp": (lambda data: data["prepared"], score_wp),
+    "add_ep_variables": (lambda data: data["scored"], add_ep_variables),
+    "add_wp_variables": (lambda data: data["scored"], add_wp_variables),
+    "enrich_by_game": (lambda data: data["scored"], lambda scored: enrich_by_game(scored, _enriched)),
+}
+
+def _inputs(scale: int, stages: list) -> dict:
+    # Nur die Inputs erzeugen, die die gewaehlten Stages brauchen
+    data = {}
+    if {"parse_games", "extract_players", "transform_games"} & set(stages):
+        data["season"] = list(synthetic_season(scale))
+        data["raw"] = _parse_games(data["season"])
+    if set(stages) - {"parse_games", "extract_players", "transform_games"}:
+        data["hudl_raw"] = synthetic_hudl(scale)
+        data["plays"] = make_hudl_mutations(data["hudl_raw"])
+        data["prepared"] = prepare_model_data(data["plays"])
+        data["scored"] = _scored(data["plays"])
+    return data
+
+def _rows(value) -> int:
+    if isinstance(value, list):
+        # Plays der Payloads von synthetic_season
+        return sum(len(drive["eventGroups"]) for _, halves, _ in value for half in halves for drive in half["drives"])
+    return value.height
+
+def time_stage(func, value, repeat: int = 3) -> dict:
+    """Runs func(value) repeat times and returns the best wall time and the peak RSS of the runs.
+
+    Returns:
+        dict: 'seconds' (best run), 'peak_rss_mb' and whether the peak could be isolated ('rss_isolated').
+    """
+    isolated = _reset_peak_rss()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(value)
+        best = min(best, time.perf_counter() - start)
+    return {"seconds": best, "peak_rss_mb": _peak_rss_mb(), "rss_isolated": isolated}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(scales: list = DEFAULT_SCALES, stages: list = None, repeat: int = 3, verbose: bool = True) -> list:
+    """Times every stage on synthetic data at every scale (multiples of data_raw.csv, see synthetic_pbp).
+
+    Args:
+        scales (list, optional): Data sizes, e.g. [10, 100, 1000].
+        stages (list, optional): Names from STAGES, defaults to all.
+        repeat (int, optional): Runs per stage, the best run counts.
+
+    Returns:
+        list: One record per stage and scale with rows, seconds, rows_per_s and peak_rss_mb.
+    """
+    stages = stages or list(STAGES)
+    run = {
+        "run_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+    records = []
+    for scale in scales:
+        data = _inputs(scale, stages)
+        for stage in stages:
+            select, func = STAGES[stage]
+            value = select(data)
+            rows = _rows(value)
+            result = time_stage(func, value, repeat)
+            record = {**run, "stage": stage, "scale": scale, "rows": rows, **result,
+                      "rows_per_s": rows / result["seconds"] if result["seconds"] else None}
+            records.append(record)
+            if verbose:
+                print(f"{stage:<20} {scale:>5}x {rows:>9} rows {result['seconds']:8.3f}s "
+                      f"{record['rows_per_s']:>12,.0f} rows/s {result['peak_rss_mb']:8.0f} MB")
+        del data
+    return records
+
+def append_history(records: list, path: str = HISTORY_PATH):
+    """Appends the records to the JSON Lines history."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+def read_history(path: str = HISTORY_PATH) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def find_regressions(records: list, history: list, tolerance: float = 0.2, window: int = 5) -> list:
+    """Compares the throughput of every record with the median of the last `window` runs of the same
+    stage and scale in the history.
+
+    Returns:
+        list: (stage, scale, rows_per_s, median rows_per_s) of the records more than tolerance slower.
+    """
+    regressions = []
+    for record in records:
+        previous = [r["rows_per_s"] for r in history
+                    if r["stage"] == record["stage"] and r["scale"] == record["scale"] and r["run_at"] != record["run_at"]]
+        if not previous:
+            continue
+        median = statistics.median(previous[-window:])
+        if record["rows_per_s"] < (1 - tolerance) * median:
+            regressions.append((record["stage"], record["scale"], record["rows_per_s"], median))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the ingest, enrich and score stages")
+    parser.add_argument("--scales", type=int, nargs="*", default=DEFAULT_SCALES, help="Multiples of data_raw.csv, e.g. 10 100 1000")
+    parser.add_argument("--stages", nargs="*", choices=list(STAGES), default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop against the history")
+    args = parser.parse_args()
+
+    history = read_history(args.history)
+    records = run_benchmarks(args.scales, args.stages, args.repeat)
+    append_history(records, args.history)
+    regressions = find_regressions(records, history, args.tolerance)
+    for stage, scale, rows_per_s, median in regressions:
+        print(f"Regression: {stage} at {scale}x {rows_per_s:,.0f} rows/s, median before {median:,.0f} rows/s")
+    raise SystemExit(1 if regressions else 0)
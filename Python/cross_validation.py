@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import polars as pl
+import xgboost as xgb
+from sklearn.model_selection import GroupKFold, LeaveOneGroupOut
+
+from training_pipeline import MODEL_CONFIGS, StageCache, load_feature_matrix
+
+# Parameter der Modelle in models/ep_model.ipynb und models/wp_model.ipynb (n_estimators Default 100)
+DEFAULT_PARAMS = {
+    "ep": {"eta": 0.025, "gamma": 1, "subsample": 0.8, "colsample_bytree": 0.8, "max_depth": 5, "min_child_weight": 1},
+    "wp": {"eta": 0.2, "gamma": 0, "subsample": 0.8, "colsample_bytree": 0.8, "max_depth": 4, "min_child_weight": 1},
+}
+DEFAULT_ROUNDS = 100
+CALIBRATION_BINS = 10
+
+# Im Worker: Views auf die geteilten Arrays, werden im Initializer gesetzt
+_shared = {}
+
+def _share(arrays: dict) -> tuple:
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def _attach(specs: dict):
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _shared[name] = (block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf))
+
+def game_folds(groups: np.ndarray, n_folds: int = None) -> list:
+    """Splits the rows by game, no game is ever on both sides of a fold.
+
+    Args:
+        groups (np.ndarray): The game_id of every row.
+        n_folds (int, optional): Number of folds (GroupKFold), None leaves one game out per fold.
+
+    Returns:
+        list: (train indices, test indices) per fold.
+    """
+    splitter = LeaveOneGroupOut() if n_folds is None else GroupKFold(n_splits=n_folds)
+    return list(splitter.split(np.zeros(len(groups)), groups=groups))
+
+def fold_metrics(kind: str, y: np.ndarray, pred: np.ndarray, bins: int = CALIBRATION_BINS) -> tuple:
+    """Log loss, Brier score and calibration of one fold's predictions.
+    For the EP model the Brier score sums over the classes and the calibration pools the one-vs-rest
+    probabilities of all classes.
+
+    Returns:
+        tuple: (dict of 'logloss', 'brier', 'ece', list of (bin, mean prediction, observed rate, rows)).
+    """
+    eps = 1e-15
+    if kind == "ep":
+        onehot = np.eye(pred.shape[1])[y.astype(int)]
+        logloss = -np.mean(np.log(np.clip(pred[np.arange(len(y)), y.astype(int)], eps, 1)))
+        brier = np.mean(np.sum((pred - onehot) ** 2, axis=1))
+        probs, outcomes = pred.ravel(), onehot.ravel()
+    else:
+        p = np.clip(pred, eps, 1 - eps)
+        logloss = -np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))
+        brier = np.mean((pred - y) ** 2)
+        probs, outcomes = pred, y
+
+    index = np.minimum((probs * bins).astype(int), bins - 1)
+    calibration, ece = [], 0.0
+    for b in range(bins):
+        mask = index == b
+        if mask.any():
+            mean_pred, observed = float(probs[mask].mean()), float(outcomes[mask].mean())
+            calibration.append((b, mean_pred, observed, int(mask.sum())))
+            ece += mask.sum() / len(probs) * abs(mean_pred - observed)
+    return {"logloss": float(logloss), "brier": float(brier), "ece": float(ece)}, calibration
+
+def _run_fold(kind, fold, train_index, test_index, params, rounds, features):
+    X, y, weight = _shared["X"][1], _shared["y"][1], _shared["weight"][1]
+    dtrain = xgb.DMatrix(X[train_index], y[train_index], weight=weight[train_index], feature_names=features)
+    booster = xgb.train(params, dtrain, num_boost_round=rounds)
+    pred = booster.inplace_predict(X[test_index])
+    metrics, calibration = fold_metrics(kind, y[test_index], pred)
+    games = np.unique(_shared["groups"][1][test_index])
+    return {"fold": fold, "games": games.tolist(), "rows": len(test_index), **metrics}, calibration
+
+def cross_validate(kind: str, data: dict, params: dict = None, rounds: int = DEFAULT_ROUNDS, n_folds: int = None,
+                   workers: int = None) -> dict:
+    """Grouped cross-validation by game: every fold trains in a worker process, the feature matrix,
+    labels, weights and game ids are put into shared memory once and the workers only map them.
+
+    Args:
+        kind (str): 'ep' or 'wp'.
+        data (dict): The output of load_feature_matrix.
+        params (dict, optional): XGBoost parameters, defaults to DEFAULT_PARAMS of the notebooks.
+        rounds (int, optional): Boosting rounds.
+        n_folds (int, optional): Number of folds, None leaves one game out per fold.
+        workers (int, optional): Worker processes, defaults to the number of cores.
+
+    Returns:
+        dict: 'folds' (pl.DataFrame with games, rows, logloss, brier and ece per fold) and
+            'calibration' (pl.DataFrame with mean prediction and observed rate per fold and bin).
+    """
+    workers = workers or os.cpu_count() or 1
+    params = {"booster": "gbtree", "tree_method": "hist", "seed": 0, **MODEL_CONFIGS[kind]["params"],
+              **DEFAULT_PARAMS[kind], **(params or {}), "nthread": max(1, (os.cpu_count() or 1) // workers)}
+    folds = game_folds(data["groups"], n_folds)
+
+    blocks, specs = _share({name: data[name] for name in ("X", "y", "weight", "groups")})
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(specs,)) as executor:
+            futures = [executor.submit(_run_fold, kind, fold, train_index, test_index, params, rounds, data["features"])
+                       for fold, (train_index, test_index) in enumerate(folds)]
+            results = [future.result() for future in futures]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    calibration = [(fold["fold"], *row) for fold, rows in results for row in rows]
+    return {
+        "folds": pl.DataFrame([fold for fold, _ in results]),
+        "calibration": pl.DataFrame(calibration, schema=["fold", "bin", "mean_pred", "observed", "rows"], orient="row"),
+    }
+
+def summarize(folds: pl.DataFrame) -> dict:
+    """Row weighted mean of the fold metrics."""
+    return folds.select(
+        [(pl.col(metric) * pl.col("rows")).sum() / pl.col("rows").sum() for metric in ("logloss", "brier", "ece")]
+    ).row(0, named=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validation of the EP and WP models grouped by game")
+    parser.add_argument("model", choices=sorted(MODEL_CONFIGS))
+    parser.add_argument("--data", default="data_raw.csv")
+    parser.add_argument("--extra", nargs="*", default=[], help="Mutated play-by-play CSVs, e.g. data/wc24_pbp.csv")
+    parser.add_argument("--params", default=None, help="JSON of a tune_models artifact, e.g. models/ep_model.<version>.json")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument("--folds", type=int, default=None, help="Number of folds, default leaves one game out")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default="cache/training")
+    parser.add_argument("--out", default=None, help="Write the per fold metrics to this CSV")
+    args = parser.parse_args()
+
+    params, rounds = None, args.rounds
+    if args.params:
+        with open(args.params) as f:
+            artifact = json.load(f)
+        params, rounds = artifact["params"], artifact["num_boost_round"]
+
+    data = load_feature_matrix(args.model, args.data, args.extra, StageCache(args.cache_dir))
+    result = cross_validate(args.model, data, params, rounds, args.folds, args.workers)
+    print(result["folds"])
+    print(summarize(result["folds"]))
+    if args.out:
+        result["folds"].with_columns(pl.col("games").cast(pl.List(pl.String)).list.join(",")).write_csv(args.out)
@@ -1,112 +1,280 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import polars as pl
 
-# Funktion zum Abrufen und Verarbeiten der Spieldaten
-def process_game(game_id, api_key):
+from helper_pbp_sources import add_scoring_play_team, add_team_points
+from json_stream import JSONStreamReader
+from pipeline_profiler import profiled
+
+BASE_URL = "https://main-api-1.sportapp.fi/api/v1/public"
+
+class HostRateLimiter:
+    """
+    Thread-safe rate limiter that spaces requests to the same host evenly.
+
+    Parameters:
+    requests_per_second (float): Maximum number of requests per second and host.
+    """
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def make_session(pool_size: int = 10) -> requests.Session:
+    """
+    Creates a requests Session whose connection pool is large enough for pool_size parallel workers.
+    
+    Parameters:
+    pool_size (int): Number of connections kept alive per host.
+    
+    Returns:
+    requests.Session: The pooled session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _get(url, session=None, rate_limiter=None, headers=None):
+    if rate_limiter is not None:
+        rate_limiter.wait(url)
+    return (session or requests).get(url, headers=headers)
+
+def _fetch_json(endpoint, key, url, session=None, rate_limiter=None, cache=None, final=False):
+    # Ohne Cache direkt abrufen, sonst über den ResponseCache (inkl. bedingtem Re-Fetch)
+    if cache is None:
+        response = _get(url, session, rate_limiter)
+        return response.status_code, response.json() if response.status_code == 200 else None
+    return cache.fetch_json(endpoint, key, url, lambda u, headers: _get(u, session, rate_limiter, headers), final)
+
+def fetch_game_payloads(game_id, api_key, session=None, rate_limiter=None, base_url=BASE_URL, cache=None):
     # Endpunkte definieren
-    drives_url = f"https://main-api-1.sportapp.fi/api/v1/public/match-drives?id={game_id}&apikey={api_key}"
-    match_url = f"https://main-api-1.sportapp.fi/api/v1/public/match-v1?id={game_id}&apikey={api_key}"
+    drives_url = f"{base_url}/match-drives?id={game_id}&apikey={api_key}"
+    match_url = f"{base_url}/match-v1?id={game_id}&apikey={api_key}"
+    
+    # Match-Daten abrufen, ob das Spiel abgeschlossen ist entscheidet der Cache (final_games)
+    match_status, match_data = _fetch_json("match-v1", game_id, match_url, session, rate_limiter, cache)
+    if match_status != 200:
+        print(f"Fehler beim Abrufen der Match-Daten für Spiel {game_id}")
+        return None
     
     # Drives-Daten abrufen
-    drives_response = requests.get(drives_url)
-    if drives_response.status_code != 200:
+    drives_status, drives_data = _fetch_json("match-drives", game_id, drives_url, session, rate_limiter, cache)
+    if drives_status != 200:
         print(f"Fehler beim Abrufen der Drives-Daten für Spiel {game_id}")
         return None
     
-    # Match-Daten abrufen
-    match_response = requests.get(match_url)
-    if match_response.status_code != 200:
-        print(f"Fehler beim Abrufen der Match-Daten für Spiel {game_id}")
+    return drives_data, match_data
+
+# Funktion zum Abrufen und Verarbeiten der Spieldaten
+@profiled
+def process_game(game_id, api_key, session=None, rate_limiter=None, base_url=BASE_URL, cache=None):
+    payloads = fetch_game_payloads(game_id, api_key, session, rate_limiter, base_url, cache)
+    if payloads is None:
         return None
     
-    drives_data = drives_response.json()
-    match_data = match_response.json()
-    
+    drives_data, match_data = payloads
+    return parse_game_plays(game_id, drives_data, match_data)
+
+GAME_FIELDS = ["season", "competition_id", "competition_name", "competition_league", "gender", "game_id", "game_type",
+               "game_group_id", "game_group", "home_team", "away_team", "home_score", "away_score", "stream_url"]
+
+PLAY_FIELDS = ["half", "drive_id_half", "play_id_drive", "posteam_id", "posteam_abb", "summary", "action_title",
+               "down", "down_desc", "down_after", "down_after_desc", "yards_to_go", "yards_to_go_after", "yards",
+               "start_yard_line", "start_yard_line_team_half_id", "end_yard_line", "end_yard_line_team_half_id", "possession_time"]
+
+# Spaltenreihenfolge der Rohdaten je Play
+RAW_COLUMNS = GAME_FIELDS[:9] + PLAY_FIELDS + GAME_FIELDS[9:]
+
+def parse_game_fields(game_id, match_data):
     # Home- und Away-Team-Informationen extrahieren
-    series_id = match_data.get("series", {}).get("id", 0)
-    series_region = match_data.get("series", {}).get("region", 0)
-    series_level = match_data.get("series", {}).get("level", 0)
-    season = match_data.get("series", {}).get("seasonName", 0)
-    gender = match_data.get("series", {}).get("id", 0)
-    game_type = match_data.get("series", {}).get("phase", 0)
-    game_group_id = match_data.get("series", {}).get("groupId", 0)
-    game_group = match_data.get("series", {}).get("groupName", 0)
-    game_type = match_data.get("series", {}).get("phase", 0)
-    stream_url = match_data.get("streams", [{}])[0].get("url", "Unknown") if match_data.get("streams") else "Unknown"
-    home_team = match_data.get("home", {}).get("id", "Unknown")
-    away_team = match_data.get("away", {}).get("id", "Unknown")
+    series = match_data.get("series", {})
+    game = {
+        "season": series.get("seasonName", 0),
+        "competition_id": series.get("id", 0),
+        "competition_name": series.get("region", 0),
+        "competition_league": series.get("level", 0),
+        "gender": series.get("id", 0),
+        "game_id": game_id,
+        "game_type": series.get("phase", 0),
+        "game_group_id": series.get("groupId", 0),
+        "game_group": series.get("groupName", 0),
+        "home_team": match_data.get("home", {}).get("id", "Unknown"),
+        "away_team": match_data.get("away", {}).get("id", "Unknown"),
+        "stream_url": match_data.get("streams", [{}])[0].get("url", "Unknown") if match_data.get("streams") else "Unknown",
+    }
     
     # Ergebnisdaten überprüfen und abrufen
     result_data = match_data.get("result")
     if result_data is None:
         print(f"Keine Ergebnisdaten verfügbar für Spiel {game_id}.")
-        home_score = 0
-        away_score = 0
+        game["home_score"] = 0
+        game["away_score"] = 0
     else:
-        home_score = result_data.get("details", {}).get("points_total_home", 0)
-        away_score = result_data.get("details", {}).get("points_total_away", 0)
+        game["home_score"] = result_data.get("details", {}).get("points_total_home", 0)
+        game["away_score"] = result_data.get("details", {}).get("points_total_away", 0)
     
-    plays_data = []
+    return game
+
+def _play_values(half, drive_id, event_group, play_id, play):
+    return (
+        half,
+        drive_id,
+        play_id,
+        event_group.get("team", {}).get("id", "Unknown"),
+        event_group.get("team", {}).get("threeLetters", "Unknown"),
+        play.get("summary"),
+        play.get("actionTitle"),
+        play.get("down"),
+        play.get("downLabel"),
+        play.get("nextDown"),
+        play.get("nextDownLabel"),
+        play.get("target"),
+        play.get("nextTarget"),
+        event_group.get("yards"),
+        play.get("startYardLine", {}).get("yardLine", 0),
+        play.get("startYardLine", {}).get("team", 0),
+        play.get("endYardLine", {}).get("yardLine", 0),
+        play.get("endYardLine", {}).get("team", 0),
+        event_group.get("timeOfPossession"),
+    )
+
+def iter_drive_plays(drives_data):
+    """
+    Walks the drives -> drives -> eventGroups tree of a match-drives payload.
     
-    # Verarbeitung der Drives und Plays
+    Yields:
+    tuple: The values of one play in the order of PLAY_FIELDS.
+    """
     for drive in drives_data:
         half = drive.get("num") + 1
         for event_group_index, event_group in enumerate(drive.get("drives", [])):
-            drive_id = event_group_index + 1
-            team_id = event_group.get("team", {}).get("id", "Unknown")
-            team_abb = event_group.get("team", {}).get("threeLetters", "Unknown")
             for play_index, play in enumerate(event_group.get("eventGroups", [])):
-                play_id = play_index + 1
-                plays_data.append({
-                    "season": season,
-                    "competition_id": series_id,
-                    "competition_name": series_region,
-                    "competition_league": series_level,
-                    "gender": gender,
-                    "game_id": game_id,
-                    "game_type": game_type,
-                    "game_group_id": game_group_id,
-                    "game_group": game_group,
-                    "half": half,
-                    "drive_id_half": drive_id,
-                    "play_id_drive": play_id,
-                    "posteam_id": team_id,
-                    "posteam_abb": team_abb,
-                    "summary": play.get("summary"),
-                    "action_title": play.get("actionTitle"),
-                    "down": play.get("down"),
-                    "down_desc": play.get("downLabel"),
-                    "down_after": play.get("nextDown"),
-                    "down_after_desc": play.get("nextDownLabel"),
-                    "yards_to_go": play.get("target"),
-                    "yards_to_go_after": play.get("nextTarget"),
-                    "yards": event_group.get("yards"),
-                    "start_yard_line": play.get("startYardLine", {}).get("yardLine", 0),
-                    "start_yard_line_team_half_id": play.get("startYardLine", {}).get("team", 0),
-                    "end_yard_line": play.get("endYardLine", {}).get("yardLine", 0),
-                    "end_yard_line_team_half_id": play.get("endYardLine", {}).get("team", 0),
-                    "possession_time": event_group.get("timeOfPossession"),
-                    "home_team": home_team,
-                    "away_team": away_team,
-                    "home_score": home_score,
-                    "away_score": away_score,
-                    "stream_url": stream_url
-                })
+                yield _play_values(half, event_group_index + 1, event_group, play_index + 1, play)
+
+def iter_drive_plays_stream(chunks):
+    """
+    Streaming version of iter_drive_plays: parses the match-drives payload incrementally from byte chunks,
+    e.g. response.iter_content(), and yields the plays of every drive as soon as the drive is read.
+    Only one drive is decoded at a time instead of the whole tree. If a half lists its 'num' after its
+    drives, the drives of that half are held back until the half is complete.
+    
+    Parameters:
+    chunks (iterable): The raw payload as byte chunks.
+    
+    Yields:
+    tuple: The values of one play in the order of PLAY_FIELDS, in the order of iter_drive_plays.
+    """
+    reader = JSONStreamReader(chunks)
+    for _ in reader.items():
+        num, pending = None, []
+        for key in reader.keys():
+            if key != "drives":
+                value = reader.value()
+                if key == "num":
+                    num = value
+                continue
+            for event_group_index, _ in enumerate(reader.items()):
+                event_group, plays = {}, []
+                for drive_key in reader.keys():
+                    if drive_key == "eventGroups":
+                        plays = [reader.value() for _ in reader.items()]
+                    else:
+                        event_group[drive_key] = reader.value()
+                if num is None:
+                    pending.append((event_group_index, event_group, plays))
+                    continue
+                for play_index, play in enumerate(plays):
+                    yield _play_values(num + 1, event_group_index + 1, event_group, play_index + 1, play)
+        for event_group_index, event_group, plays in pending:
+            for play_index, play in enumerate(plays):
+                yield _play_values(num + 1, event_group_index + 1, event_group, play_index + 1, play)
+
+@profiled
+def parse_game_plays(game_id, drives_data, match_data):
+    game = parse_game_fields(game_id, match_data)
+    
+    # Verarbeitung der Drives und Plays
+    plays_data = []
+    for values in iter_drive_plays(drives_data):
+        play = {**game, **dict(zip(PLAY_FIELDS, values))}
+        plays_data.append({column: play[column] for column in RAW_COLUMNS})
     
     return plays_data
 
-def fetch_team_players(team_ids, api_key):
+def _literal(value):
+    # Ganzzahlen wie bei pandas als Int64 statt Int32-Literal
+    if isinstance(value, int) and not isinstance(value, bool):
+        return pl.lit(value, dtype=pl.Int64)
+    return pl.lit(value)
+
+@profiled
+def build_game_frame(game_id, plays, match_data) -> pl.DataFrame | None:
+    """
+    Builds the raw play table of one game column by column, without one dict per play.
+    The game-level fields are broadcast as literals instead of being copied into every row.
+    'yards_to_go' and 'yards_to_go_after' are String columns like in convert_to_polars, missing
+    values stay null instead of becoming the string "None".
+    
+    Parameters:
+    game_id (int): The game id.
+    plays (iterable): Play tuples in the order of PLAY_FIELDS, e.g. iter_drive_plays(drives_data).
+    match_data (dict): The parsed match-v1 payload.
+    
+    Returns:
+    pl.DataFrame: One row per play with the columns of RAW_COLUMNS, None if the game has no plays.
+    """
+    # Spaltenweise aufbauen, die Plays werden nicht erst als Liste von Tupeln gesammelt
+    columns = [[] for _ in PLAY_FIELDS]
+    appends = [column.append for column in columns]
+    for values in plays:
+        for append, value in zip(appends, values):
+            append(value)
+    if not columns[0]:
+        return None
+    
+    data = dict(zip(PLAY_FIELDS, columns))
+    for column in ["yards_to_go", "yards_to_go_after"]:
+        data[column] = [None if value is None else str(value) for value in data[column]]
+    
+    game = parse_game_fields(game_id, match_data)
+    df = (
+        pl.DataFrame(data, strict=False, schema_overrides={"yards_to_go": pl.String, "yards_to_go_after": pl.String})
+        .with_columns(_literal(value).alias(column) for column, value in game.items())
+        .select(RAW_COLUMNS)
+    )
+    return df
+
+@profiled
+def fetch_team_players(team_ids, api_key, session=None, base_url=BASE_URL, cache=None):
     all_players_data = []
+    session = session or make_session()
     
     for team_id in team_ids:
-        api_url = f"https://main-api-1.sportapp.fi/api/v1/public/teams-players?team={team_id}&apikey={api_key}"
+        api_url = f"{base_url}/teams-players?team={team_id}&apikey={api_key}"
         print(f"Fetching data for team ID: {team_id}")
 
         try:
-            response = requests.get(api_url)
-            response.raise_for_status()  # Check for HTTP request errors
-            data = response.json()  # Attempt to parse JSON
+            status_code, data = _fetch_json("teams-players", team_id, api_url, session, cache=cache)  # Attempt to parse JSON
+            if status_code != 200:  # Check for HTTP request errors
+                raise requests.HTTPError(f"{status_code} Error for team ID: {team_id}")
 
             if isinstance(data, list) and len(data) > 0 and "players" in data[0]:  # Ensure 'players' key exists in response
                 team_id = data[0]["id"]
@@ -136,21 +304,121 @@ def fetch_team_players(team_ids, api_key):
     players_df = pl.DataFrame(all_players_data)
     return players_df
 
-# Mehrere Spiele abrufen
-def process_games(game_ids, api_key):
-    all_plays = []
-    for game_id in game_ids:
+@profiled
+def fetch_games(game_ids, api_key, max_workers=1, requests_per_second=None, base_url=BASE_URL, cache=None):
+    """
+    Fetches the raw payloads of several games. With max_workers > 1 the games are fetched in a thread pool
+    that shares one pooled session; the result keeps the order of game_ids either way.
+    
+    Parameters:
+    game_ids (iterable): The game ids to fetch.
+    api_key (str): The sportapp.fi API key.
+    max_workers (int): Number of games fetched in parallel.
+    requests_per_second (float): Optional upper bound for requests per second and host.
+    base_url (str): Base URL of the public API.
+    cache (ResponseCache): Optional on-disk cache for the raw payloads.
+    
+    Returns:
+    list: (game_id, (drives_data, match_data)) tuples, the payloads are None if the game could not be fetched.
+    """
+    return _map_games(game_ids, max_workers, requests_per_second,
+                      lambda game_id, session, rate_limiter: fetch_game_payloads(game_id, api_key, session, rate_limiter, base_url, cache))
+
+def _map_games(game_ids, max_workers, requests_per_second, fetch):
+    session = make_session(pool_size=max(max_workers, 1))
+    rate_limiter = HostRateLimiter(requests_per_second) if requests_per_second else None
+
+    def run(game_id):
         print(f"Verarbeite Spiel ID: {game_id}")
-        game_plays = process_game(game_id, api_key)
-        if game_plays:
-            all_plays.extend(game_plays)
+        result = fetch(game_id, session, rate_limiter)
         print(f"Fertig mit Spiel ID: {game_id}")
+        return game_id, result
+
+    with session:
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(run, game_ids))
+        return [run(game_id) for game_id in game_ids]
+
+@profiled
+def fetch_game_frame_stream(game_id, api_key, session=None, rate_limiter=None, base_url=BASE_URL, chunk_size=64 * 1024):
+    """
+    Fetches one game and builds its raw play table while the match-drives body is downloaded:
+    the plays come from iter_drive_plays_stream and go straight into build_game_frame, the payload is
+    never held as a whole, neither as bytes nor as a parsed tree. Bypasses the ResponseCache.
+    
+    Parameters:
+    game_id (int): The game id.
+    api_key (str): The sportapp.fi API key.
+    chunk_size (int): Bytes read from the response per step.
+    
+    Returns:
+    pl.DataFrame: The play table like build_game_frame, None if the game could not be fetched or has no plays.
+    """
+    match_url = f"{base_url}/match-v1?id={game_id}&apikey={api_key}"
+    match_status, match_data = _fetch_json("match-v1", game_id, match_url, session, rate_limiter)
+    if match_status != 200:
+        print(f"Fehler beim Abrufen der Match-Daten für Spiel {game_id}")
+        return None
+    
+    drives_url = f"{base_url}/match-drives?id={game_id}&apikey={api_key}"
+    if rate_limiter is not None:
+        rate_limiter.wait(drives_url)
+    with (session or requests).get(drives_url, stream=True) as response:
+        if response.status_code != 200:
+            print(f"Fehler beim Abrufen der Drives-Daten für Spiel {game_id}")
+            return None
+        return build_game_frame(game_id, iter_drive_plays_stream(response.iter_content(chunk_size)), match_data)
+
+# Mehrere Spiele abrufen
+@profiled
+def process_games(game_ids, api_key, max_workers=1, requests_per_second=None, base_url=BASE_URL, cache=None):
+    """
+    Fetches and parses several games, see fetch_games for the parameters.
+    
+    Returns:
+    pd.DataFrame: One row per play of all fetched games.
+    """
+    all_plays = []
+    for game_id, payloads in fetch_games(game_ids, api_key, max_workers, requests_per_second, base_url, cache):
+        if payloads is not None:
+            all_plays.extend(parse_game_plays(game_id, *payloads))
     
     # DataFrame erstellen
     return pd.DataFrame(all_plays)
 
+@profiled
+def process_games_pl(game_ids, api_key, max_workers=1, requests_per_second=None, base_url=BASE_URL, cache=None, stream=False):
+    """
+    Like process_games, but builds the play table directly in Polars with build_game_frame.
+    
+    Parameters:
+    stream (bool): Parse the match-drives bodies while they are downloaded (fetch_game_frame_stream),
+        for bulk backfills; cannot be combined with a cache.
+    
+    Returns:
+    pl.DataFrame: One row per play of all fetched games.
+    """
+    if stream:
+        if cache is not None:
+            raise ValueError("stream=True reads the payloads directly from the API and cannot use a cache")
+        frames = [frame for _, frame in _map_games(game_ids, max_workers, requests_per_second,
+            lambda game_id, session, rate_limiter: fetch_game_frame_stream(game_id, api_key, session, rate_limiter, base_url))]
+    else:
+        frames = []
+        for game_id, payloads in fetch_games(game_ids, api_key, max_workers, requests_per_second, base_url, cache):
+            if payloads is not None:
+                drives_data, match_data = payloads
+                frames.append(build_game_frame(game_id, iter_drive_plays(drives_data), match_data))
+    
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return pl.DataFrame(schema=RAW_COLUMNS)
+    return pl.concat(frames, how="vertical_relaxed", rechunk=True)
+
 ### utils
 
+@profiled
 def convert_to_polars(df: pd.DataFrame) -> pl.DataFrame:
     df['yards_to_go'] = df['yards_to_go'].astype(str)
     df['yards_to_go_after'] = df['yards_to_go_after'].astype(str)
@@ -159,6 +427,7 @@ def convert_to_polars(df: pd.DataFrame) -> pl.DataFrame:
 
     return df
 
+@profiled
 def extract_players_from_summary(df: pd.DataFrame) -> pd.DataFrame:
     # Regular Expressions für die verschiedenen Fälle
     passer_pattern = r'#(\d+)\s+(\w+\s\w+)\s+pass'  # Identifikation des Passers
@@ -221,19 +490,53 @@ def extract_players_from_summary(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
+SUMMARY_PATTERNS = {
+    "passer": r'#(\d+)\s+(\w+\s\w+)\s+pass',
+    "receiver": r'pass complete to #(\d+)\s+(\w+\s\w+)',
+    "rusher": r'#(\d+)\s+(\w+\s\w+)\s+rush',
+    "tackle_player": r'tackled by #(\d+)\s+(\w+\s\w+)',
+    "interception_player": r'pass intercepted to #(\d+)\s+(\w+\s\w+)',
+    "sack_player": r'sacked by #(\d+)\s+(\w+\s\w+)',
+    "play_result": r'(rush|complete|incomplete|touchdown|first down|intercepted|sack|fumble|good|miss|timeout)',
+    "penalty": r'(penalty)',
+    "safety": r'(safety)',
+}
+
+@profiled
+def extract_players_from_summary_pl(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Polars version of extract_players_from_summary: extracts all player and result columns
+    from 'summary' in a single vectorized with_columns instead of one Python regex per row and column.
+    
+    Parameters:
+    df (pl.DataFrame): The DataFrame with the 'summary' column.
+    
+    Returns:
+    pl.DataFrame: The DataFrame with the columns of SUMMARY_PATTERNS added.
+    """
+    df = df.with_columns(
+        pl.col("summary").str.extract(pattern, group_index=1).alias(column)
+        for column, pattern in SUMMARY_PATTERNS.items()
+    )
+    return df
+
+@profiled
 def clean_sort(df: pd.DataFrame) -> pd.DataFrame:
     """
     Sorts the DataFrame based on the specified columns with the given order.
     
     Parameters:
-    df (pd.DataFrame): The DataFrame to be sorted.
+    df (pd.DataFrame, pl.DataFrame or pl.LazyFrame): The DataFrame to be sorted.
     
     Returns:
-    pd.DataFrame: The sorted DataFrame.
+    pd.DataFrame, pl.DataFrame or pl.LazyFrame: The sorted DataFrame of the same type.
     """
+    if isinstance(df, (pl.DataFrame, pl.LazyFrame)):
+        return df.sort(['game_id','half', 'drive_id_half', 'play_id_drive'], descending=[False, False, True, True], maintain_order=True)
     df = df.sort_values(by=['game_id','half', 'drive_id_half', 'play_id_drive'], ascending=[True, True, False, False])
     return df
 
+@profiled
 def clean_yardage(df: pl.DataFrame) -> pl.DataFrame:
     """
     Computes the 'yardline_50' column based on the 'start_yard_line_team_half_desc' and 'start_yard_line' columns and the yards_to_go column based on original column.
@@ -305,11 +608,13 @@ def clean_yardage(df: pl.DataFrame) -> pl.DataFrame:
 
     return df
 
+@profiled
 def correct_posteam(df: pl.DataFrame) -> pl.DataFrame:
 
     df = df.with_columns(posteam_helper = pl.concat_str(pl.col("game_id"),pl.lit("_"),pl.col("drive_id")))
 
-    filter_drive = df.select(pl.col('posteam_helper').filter(pl.col('def_touchdown')==1)).unique()
+    # Drives mit Defensive Touchdown als Window statt als separat gesammelter Frame (bleibt lazy)
+    filter_drive = (pl.col("def_touchdown") == 1).any().over("posteam_helper")
     
     df = (df
           .with_columns(
@@ -318,9 +623,9 @@ def correct_posteam(df: pl.DataFrame) -> pl.DataFrame:
                 .when(pl.col("posteam_id") == pl.col("away_team")).then(pl.col("home_team"))
                 .otherwise(pl.lit(None))
               )
-          .with_columns(posteam_helper_2 = pl.when((pl.col("posteam_helper")).is_in(filter_drive)).then(pl.col("play_id")).otherwise(pl.lit(None)))
-          .with_columns(posteam_helper_3 = pl.when((pl.col("posteam_helper")).is_in(filter_drive)).then(pl.col("posteam_helper")).otherwise(pl.lit(None)))
-          .with_columns(posteam_helper_max = pl.when(((pl.col("play_id"))==(pl.col("posteam_helper_2")))&pl.col("def_touchdown")==1).then(pl.col("posteam_helper")).otherwise(pl.lit(None)))
+          .with_columns(posteam_helper_2 = pl.when(filter_drive).then(pl.col("play_id")).otherwise(pl.lit(None)))
+          .with_columns(posteam_helper_3 = pl.when(filter_drive).then(pl.col("posteam_helper")).otherwise(pl.lit(None)))
+          .with_columns(posteam_helper_max = pl.when(((pl.col("play_id"))==(pl.col("posteam_helper_2"))) & (pl.col("def_touchdown")==1)).then(pl.col("posteam_helper")).otherwise(pl.lit(None)))
           .with_columns(posteam_helper_max = pl.col("posteam_helper_max").backward_fill())
           .with_columns(posteam = pl.when((pl.col("posteam_helper_3"))==(pl.col("posteam_helper_max"))).then(pl.col("defteam_id")).otherwise(pl.col("posteam_id")))
           .with_columns(
@@ -330,12 +635,13 @@ def correct_posteam(df: pl.DataFrame) -> pl.DataFrame:
                 .otherwise(pl.lit(None))
               )
           .drop(["posteam_helper","posteam_helper_2","posteam_helper_3","posteam_helper_max","posteam_id","defteam_id"])
-          .with_columns(posteam_after = pl.col("posteam").shift(-1))
-          .with_columns(defteam_after = pl.col("defteam").shift(-1))
+          .with_columns(posteam_after = pl.col("posteam").shift(-1).over("game_id"))
+          .with_columns(defteam_after = pl.col("defteam").shift(-1).over("game_id"))
           )
     
     return df
 
+@profiled
 def clean_play_ids(df: pl.DataFrame) -> pl.DataFrame:
     """
     Computes the 'play_id', 'drive_id' and 'half_end' columns based on the sorted index outputs of the clean_sort function.
@@ -374,6 +680,7 @@ def clean_play_ids(df: pl.DataFrame) -> pl.DataFrame:
     )
     return df
 
+@profiled
 def add_event_columns(df: pl.DataFrame) -> pl.DataFrame:
     """
     Computes the event columns mainly based on the 'summary', 'play_result' and 'penalty' columns.
@@ -434,61 +741,7 @@ def add_event_columns(df: pl.DataFrame) -> pl.DataFrame:
     )
     return df
 
-def add_scoring_play_team(df: pl.DataFrame) -> pl.DataFrame:
-    df = df.with_columns(
-        scoring_play_team =
-            pl.when((pl.col('scoring_play') == 1) & (pl.col("touchdown") | pl.col("one_point_conv_success") | pl.col("two_point_conv_success") == 1)).then(pl.col("posteam"))
-            .when((pl.col('scoring_play') == 1) & (pl.col("def_touchdown") | pl.col("defensive_two_point_conv") | pl.col("safety") == 1)).then(pl.col("defteam"))
-            .otherwise(pl.lit(None))
-            .alias('scoring_play_team')
-        )
-    
-    return df
-
-def add_team_points(df: pl.DataFrame) -> pl.DataFrame:
-    df = (df
-          .with_columns(
-              home_team_points = pl.when(pl.col("play_id")==1).then(pl.lit(0))
-              .when(pl.col('home_team')==pl.col("scoring_play_team"))
-              .then(
-                  pl.when(touchdown=1).then(pl.lit(6))
-                  .when(def_touchdown=1).then(pl.lit(6))
-                  .when(one_point_conv_success=1).then(pl.lit(1))
-                  .when(two_point_conv_success=1).then(pl.lit(2))
-                  .when(defensive_two_point_conv=1).then(pl.lit(2))
-                  .when(safety=1).then(pl.lit(2))
-                .otherwise(pl.lit(None))
-                ),
-              away_team_points = pl.when(pl.col("play_id")==1).then(pl.lit(0))
-              .when(pl.col('away_team')==pl.col("scoring_play_team")).then(
-                  pl.when(touchdown=1).then(pl.lit(6))
-                  .when(def_touchdown=1).then(pl.lit(6))
-                  .when(one_point_conv_success=1).then(pl.lit(1))
-                  .when(two_point_conv_success=1).then(pl.lit(2))
-                  .when(defensive_two_point_conv=1).then(pl.lit(2))
-                  .when(safety=1).then(pl.lit(2))
-                .otherwise(pl.lit(None))
-                )
-                )
-                .with_columns(
-                    home_team_score = pl.col('home_team_points').cum_sum().over(["game_id","home_team"]),
-                    away_team_score = pl.col('away_team_points').cum_sum().over(["game_id","away_team"])
-                )
-                .with_columns(
-                        home_team_score = pl.col("home_team_score").forward_fill(),
-                        away_team_score = pl.col("away_team_score").forward_fill()
-                    )
-                .with_columns(
-                    posteam_score = pl.when(pl.col("posteam") == pl.col("home_team")).then(pl.col('home_team_score'))
-                        .when(pl.col("posteam") == pl.col("away_team")).then(pl.col('away_team_score')),
-                    defteam_score = pl.when(pl.col("defteam") == pl.col("home_team")).then(pl.col('home_team_score'))
-                        .when(pl.col("defteam") == pl.col("away_team")).then(pl.col('away_team_score'))
-                    )
-                .with_columns(score_differential = pl.col("posteam_score") - pl.col("defteam_score"))
-          )
-    
-    return df
-
+@profiled
 def drop_cols(df: pl.DataFrame) -> pl.DataFrame:
     cols_to_drop = ["drive_id_half","play_id_drive","posteam_abb","yards","start_yard_line","start_yard_line_team_half_id","end_yard_line","end_yard_line_team_half_id"]
 
@@ -496,3 +749,60 @@ def drop_cols(df: pl.DataFrame) -> pl.DataFrame:
 
     return df
 
+@profiled
+def clean_games_lazy(df: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Chains the cleaning steps from extract_players_from_summary_pl to clean_yardage, the output has the
+    canonical columns of helper_pbp_sources (the 'sportappfi' adapter) before the shared scoring stages.
+    
+    Parameters:
+    df (pl.LazyFrame): The raw plays, e.g. process_games_pl(...).lazy().
+    
+    Returns:
+    pl.LazyFrame: The query plan of the cleaned plays.
+    """
+    df = extract_players_from_summary_pl(df)
+    df = clean_sort(df)
+    df = clean_play_ids(df)
+    df = add_event_columns(df)
+    df = correct_posteam(df)
+    df = clean_yardage(df)
+    return df
+
+@profiled
+def transform_games_lazy(df: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Chains the cleaning steps from extract_players_from_summary_pl to drop_cols into one lazy query,
+    so Polars can optimize the whole pipeline as a single plan.
+    
+    Parameters:
+    df (pl.LazyFrame): The raw plays, e.g. process_games_pl(...).lazy() or pl.scan_parquet(...).
+    
+    Returns:
+    pl.LazyFrame: The query plan of the cleaned play-by-play data.
+    """
+    df = clean_games_lazy(df)
+    df = add_scoring_play_team(df)
+    df = add_team_points(df)
+    df = drop_cols(df)
+    return df
+
+@profiled
+def transform_games(df, streaming: bool = False) -> pl.DataFrame:
+    """
+    Runs the whole cleaning chain from extract_players_from_summary to drop_cols on the raw plays
+    as one lazy plan with a single collect.
+    
+    Parameters:
+    df (pd.DataFrame, pl.DataFrame, pl.LazyFrame or str): The raw plays as returned by process_games or
+        process_games_pl, a LazyFrame or the path of a Parquet file with raw plays.
+    streaming (bool): Collect with the streaming engine for data larger than memory.
+    
+    Returns:
+    pl.DataFrame: The cleaned play-by-play data.
+    """
+    if isinstance(df, pd.DataFrame):
+        df = convert_to_polars(df)
+    if isinstance(df, str):
+        df = pl.scan_parquet(df)
+    return transform_games_lazy(df.lazy()).collect(streaming=streaming)
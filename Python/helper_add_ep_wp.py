@@ -1,10 +1,68 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import polars as pl
 
+from helper_add_hudl_mutations import add_period_ends
+from pipeline_profiler import profiled
+
+# Class order of the EP model (see make_ep_model_mutations) and the points of each class
+EP_LABELS = ["Touchdown_Prob", "Opp_Touchdown_Prob", "Safety_Prob", "Opp_Safety_Prob", "No_Score_Prob"]
+EP_POINTS = [6, -6, 2, -2, 0]
+
+# Conditionally assigned epa, the first matching rule wins (highest precedence first).
+# Plays matching none of them keep the difference of the home ep before and after the play.
+EPA_RULES = [
+    # game end epa
+    (pl.col("game_end") == 1, pl.lit(None)),
+    # half end epa
+    ((pl.col("half_end") == 1) & (pl.col("half") == 1), pl.lit(None)),
+    # Change epa for plays occurring at end of half with no scoring
+    # plays to be just the difference between 0 and starting ep:
+    ((pl.col("half_end") == 1) & (pl.col("scoring_play") == 0) & (pl.col("play_type").is_not_null()), 0 - pl.col("ep")),
+    # Safety:
+    ((pl.col("scoring_play_team").is_not_null()) & (pl.col("scoring_play_team") == pl.col("posteam")) & (pl.col("safety") == 1), 2 - pl.col("ep")),
+    ((pl.col("scoring_play_team").is_not_null()) & (pl.col("scoring_play_team") == pl.col("defteam")) & (pl.col("safety") == 1), -2 - pl.col("ep")),
+    # Opponent scores defensive 2 point:
+    (pl.col("defensive_two_point_conv") == 1, -2 - pl.col("ep")),
+    # Failed PAT (2):
+    ((pl.col("down") == 0) & (pl.col("yards_to_go") > 5) & (pl.col("two_point_conv_success") == 0), # Annahme: Über 5 ist 2Pt.
+     0 - pl.lit(0.92)), # Tries von der 10 Yard Linie sind zu 46% gut (2 * 0.46 = 0.92).
+    # Failed PAT (1):
+    ((pl.col("down") == 0) & (pl.col("yards_to_go") <= 5) & (pl.col("one_point_conv_success") == 0), # Annahme: Unter 5 ist 1Pt.
+     0 - pl.lit(0.5)), # Tries von der 5 Yard Linie sind zu 50% gut (1 * 0.5 = 0.5).
+    # Offense two-point conversion:
+    (pl.col("two_point_conv_success") == 1, 2 - pl.lit(0.92)),
+    # Offense extra-point:
+    (pl.col("one_point_conv_success") == 1, 1 - pl.lit(0.5)),
+    # td
+    ((pl.col("scoring_play_team").is_not_null()) & (pl.col("touchdown") == 1),
+     pl.when(pl.col("scoring_play_team") == pl.col("posteam")).then(6 - pl.col("ep")).otherwise(-6 - pl.col("ep"))),
+]
+
+def epa_rules_expr(default: pl.Expr, rules: list = EPA_RULES) -> pl.Expr:
+    """Folds the rules into a single when/then chain, evaluated in one pass instead of one column per rule.
+
+    Args:
+        default (pl.Expr): The epa of plays no rule applies to.
+        rules (list, optional): (condition, epa) pairs in order of precedence.
+
+    Returns:
+        pl.Expr: The epa expression.
+    """
+    condition, value = rules[0]
+    expr = pl.when(condition).then(value)
+    for condition, value in rules[1:]:
+        expr = expr.when(condition).then(value)
+    return expr.otherwise(default)
+
+@profiled
 def add_ep_variables(df: pl.DataFrame):
     """This function adds all needed variables for Expected Points to calculate them in a correct way (e.g. TD not substracted by ep_after, but real TD points). 
 
     Args:
-        df (pl.DataFrame): Expects a Polars DataFrame with all raw datas and the corresponding probabilities from the ep-Model.
+        df (pl.DataFrame): Expects a Polars DataFrame with all raw datas and the corresponding probabilities from the ep-Model. All fills and look-aheads run per game_id,
+            so the games of a concatenated frame don't influence each other.
 
     Returns:
         _type_: Polars DataFrame with Expected Points Columns
@@ -28,105 +86,26 @@ def add_ep_variables(df: pl.DataFrame):
                         tmp_posteam = pl.col("posteam")                      
                   )
                   .with_columns(
-                        ep = pl.col("ep").backward_fill(),
-                        tmp_posteam = pl.col("tmp_posteam").backward_fill()
+                        ep = pl.col("ep").backward_fill().over("game_id"),
+                        tmp_posteam = pl.col("tmp_posteam").backward_fill().over("game_id")
                   )
                   # get epa for non-scoring plays
                   .with_columns(home_ep = pl.when(pl.col("tmp_posteam") == pl.col("home_team")).then(pl.col("ep")).otherwise(-pl.col("ep")))
-                  .with_columns(home_ep_after = pl.col("home_ep").shift(-1))
+                  .with_columns(home_ep_after = pl.col("home_ep").shift(-1).over("game_id"))
                   .with_columns(home_epa = 
                                 pl.when(pl.col("interception") == 1)
                                 .then(- (pl.col("home_ep_after") - pl.col("home_ep")))
                                 .otherwise(pl.col("home_ep_after") - pl.col("home_ep"))
                   )
-                  .with_columns(epa = pl.when(pl.col("tmp_posteam") == pl.col("home_team")).then(pl.col("home_epa")).otherwise(-pl.col("home_epa")))
-                  # td
-                  .with_columns(
-                        epa = 
-                        pl.when((pl.col("scoring_play_team").is_not_null()) & (pl.col("touchdown") == 1))
-                        .then(
-                              pl.when(pl.col("scoring_play_team") == pl.col("posteam"))
-                              .then(6 - pl.col("ep"))
-                              .otherwise(-6 - pl.col("ep"))
-                              )
-                              .otherwise(pl.col("epa")))
-                  # Offense extra-point:
-                  .with_columns(
-                        epa = 
-                        pl.when(pl.col("one_point_conv_success") == 1)
-                        .then(1 - pl.lit(0.5)) # Tries von der 5 Yard Linie sind zu 50% gut (1 * 0.5 = 0.5).
-                        .otherwise(pl.col("epa"))
-                  )
-                  # Offense two-point conversion:
-                  .with_columns(
-                        epa = 
-                        pl.when(pl.col("two_point_conv_success") == 1)
-                        .then(2 - pl.lit(0.92)) # Tries von der 10 Yard Linie sind zu 46% gut (2 * 0.46 = 0.92). 
-                        .otherwise(pl.col("epa"))
-                  )
-                  # Failed PAT (1):
                   .with_columns(
-                        epa = 
-                        pl.when((pl.col("down") == 0) & (pl.col("yards_to_go") <= 5) & ((pl.col("one_point_conv_success") == 0))) # Annahme: Unter 5 ist 1Pt.
-                        .then(0 - pl.lit(0.5)) # Tries von der 5 Yard Linie sind zu 50% gut (1 * 0.5 = 0.5).
-                        .otherwise(pl.col("epa"))
+                        epa = epa_rules_expr(
+                              pl.when(pl.col("tmp_posteam") == pl.col("home_team")).then(pl.col("home_epa")).otherwise(-pl.col("home_epa"))
+                        )
                   )
-                # Failed PAT (2):
                   .with_columns(
-                        epa = 
-                        pl.when((pl.col("down") == 0) & (pl.col("yards_to_go") > 5) & ((pl.col("two_point_conv_success") == 0))) # Annahme: Über 5 ist 2Pt.
-                        .then(0 - pl.lit(0.92)) # Tries von der 10 Yard Linie sind zu 46% gut (2 * 0.46 = 0.92). 
-                        .otherwise(pl.col("epa"))
-                  )
-                  # Opponent scores defensive 2 point:
-                  .with_columns(
-                        epa = 
-                        pl.when(pl.col("defensive_two_point_conv") == 1)
-                        .then(-2 - pl.col("ep"))
-                        .otherwise(pl.col("epa"))
-                  )
-                  # Safety:
-                  .with_columns(
-                        epa = 
-                        pl.when((pl.col("scoring_play_team").is_not_null()) & (pl.col("scoring_play_team") == pl.col("posteam")) & (pl.col("safety") == 1))
-                        .then(2 - pl.col("ep"))
-                        .when((pl.col("scoring_play_team").is_not_null()) & (pl.col("scoring_play_team") == pl.col("defteam")) & (pl.col("safety") == 1))
-                        .then(-2 - pl.col("ep"))
-                        .otherwise(pl.col("epa"))
-                  )
-                  # Create columns with cumulative epa totals for both teams:
-                  .with_columns(
-                      # Change epa for plays occurring at end of half with no scoring
-                      # plays to be just the difference between 0 and starting ep:
-                      epa = pl.when((pl.col("half_end") == 1) & (pl.col("scoring_play") == 0) & (pl.col("play_type").is_not_null()))
-                      .then(0 - pl.col("ep"))
-                      .otherwise(pl.col("epa"))
-                  )
-                  .with_columns(
-                      # half end epa
-                      epa =
-                      pl.when((pl.col("half_end") == 1) & (pl.col("half") == 1))
-                      .then(pl.lit(None))
-                      .otherwise(pl.col("epa"))
-                  )
-                  .with_columns(
-                      # game end epa
-                      epa =
-                      pl.when(pl.col("game_end") == 1)
-                      .then(pl.lit(None))
-                      .otherwise(pl.col("epa"))
-                  )
-                  .with_columns(
-                      # half end ep
+                      # half end and game end ep
                       ep =
-                      pl.when((pl.col("half_end") == 1) & (pl.col("half") == 1))
-                      .then(pl.lit(None))
-                      .otherwise(pl.col("ep"))
-                  )
-                  .with_columns(
-                      # game end ep
-                      ep =
-                      pl.when(pl.col("game_end") == 1)
+                      pl.when(((pl.col("half_end") == 1) & (pl.col("half") == 1)) | (pl.col("game_end") == 1))
                       .then(pl.lit(None))
                       .otherwise(pl.col("ep"))
                   )
@@ -184,11 +163,13 @@ def add_ep_variables(df: pl.DataFrame):
     )
     return df
 
+@profiled
 def add_wp_variables(df: pl.DataFrame):
     """This function adds all needed variables for Win Probability to calculate them in a correct way. 
 
     Args:
-        df (pl.DataFrame): Expects a Polars DataFrame with all raw datas and the corresponding probabilities from the wp-Model.
+        df (pl.DataFrame): Expects a Polars DataFrame with all raw datas and the corresponding probabilities from the wp-Model. All fills and look-aheads run per game_id,
+            so the games of a concatenated frame don't influence each other.
 
     Returns:
         _type_: Polars DataFrame with Win Probability Columns
@@ -197,8 +178,8 @@ def add_wp_variables(df: pl.DataFrame):
         df
         .with_columns(tmp_posteam = pl.col("posteam"))
         .with_columns(
-            wp = pl.col("wp").backward_fill(),
-            tmp_posteam = pl.col("tmp_posteam").backward_fill()
+            wp = pl.col("wp").backward_fill().over("game_id"),
+            tmp_posteam = pl.col("tmp_posteam").backward_fill().over("game_id")
         )
         .with_columns(home_wp = pl.when(pl.col("tmp_posteam") == pl.col("home_team")).then(pl.col("wp")).otherwise(1 - pl.col("wp")))
         # convenience for marking home win prob on last line
@@ -216,7 +197,7 @@ def add_wp_variables(df: pl.DataFrame):
         .with_columns(away_wp = 1 - pl.col("home_wp"))
         .with_columns(def_wp = 1 - pl.col("wp"))
         # home wpa isn't saved but needed for next line
-        .with_columns(home_wp_after = pl.col("home_wp").shift(-1))
+        .with_columns(home_wp_after = pl.col("home_wp").shift(-1).over("game_id"))
         .with_columns(home_wpa = pl.col("home_wp_after") - pl.col("home_wp"))
         .with_columns(wpa = pl.when(pl.col("tmp_posteam") == pl.col("home_team")).then(pl.col("home_wpa")).otherwise(-pl.col("home_wpa")))
         .with_columns(wpa = pl.when(game_end = 1).then(pl.lit(None)).otherwise(pl.col("wpa")))
@@ -242,4 +223,95 @@ def add_wp_variables(df: pl.DataFrame):
         )
         )
     return(df)
-                  
\ No newline at end of file
+                  
+def _append_incremental(df: pl.DataFrame, new_plays: pl.DataFrame, enrich, anchor: pl.Expr, totals: list):
+    # Nur der Teil eines Spiels ab der letzten Anker-Zeile haengt von den neuen Plays ab (backward_fill, shift(-1),
+    # half_end/game_end), alles davor bleibt stehen. Die kumulierten Summen des Rests werden um den Kopf versetzt.
+    n_rows = df.height
+    games = new_plays["game_id"].unique()
+    df = df.with_columns(_row = pl.int_range(pl.len(), dtype=pl.Int64), _anchor = anchor)
+    start = pl.when(pl.col("_anchor")).then(pl.col("_row")).max().over("game_id").fill_null(-1)
+    df = df.with_columns(_tail = pl.col("game_id").is_in(games) & (pl.col("_row") >= start)).drop("_anchor")
+    head = df.filter(~pl.col("_tail")).drop("_tail")
+    tail = df.filter(pl.col("_tail")).drop("_tail")
+
+    new_plays = new_plays.with_columns(_row = pl.int_range(pl.len(), dtype=pl.Int64) + n_rows)
+    combined = pl.concat([tail, new_plays], how="diagonal_relaxed")
+    # half_end/game_end nach der Zeilenfolge (_row), der index neuer Plays beginnt oft wieder bei 1
+    periods = add_period_ends(combined.select("game_id", "half", index = pl.col("_row")))
+    recomputed = enrich(combined.with_columns(periods["half_end"], periods["game_end"]))
+
+    offsets = head.filter(pl.col("game_id").is_in(games)).group_by("game_id").agg(pl.col(totals).last())
+    recomputed = recomputed.with_columns(
+        (pl.col(total) + pl.col("game_id").replace_strict(offsets["game_id"], offsets[total], default=0)).cast(head.schema[total])
+        for total in totals
+    )
+
+    # Spiele bleiben an ihrer Position, neue Spiele kommen ans Ende
+    output = pl.concat([head, recomputed.select(head.columns)], how="vertical_relaxed")
+    return (output
+            .sort([pl.col("_row").min().over("game_id"), "_row"])
+            .drop("_row")
+    )
+
+@profiled
+def add_ep_variables_incremental(df: pl.DataFrame, new_plays: pl.DataFrame):
+    """Appends new plays to a frame that already went through add_ep_variables and recomputes only the affected tail
+    of their games: the plays from the last one with its own ExpPts on (ep is backward filled and epa looks one play ahead),
+    half_end/game_end and the running epa totals. Equals add_ep_variables over the whole frame for appended plays.
+
+    Args:
+        df (pl.DataFrame): Output of add_ep_variables.
+        new_plays (pl.DataFrame): New plays of the same form as the input of add_ep_variables (with the ep-Model probabilities).
+
+    Returns:
+        _type_: Polars DataFrame with Expected Points Columns
+    """
+    return _append_incremental(df, new_plays, add_ep_variables, pl.col("ExpPts").is_not_null(),
+                               ["total_home_epa", "total_away_epa"])
+
+@profiled
+def add_wp_variables_incremental(df: pl.DataFrame, new_plays: pl.DataFrame):
+    """Appends new plays to a frame that already went through add_wp_variables and recomputes only the last two existing plays
+    of their games (the last one may have carried the final result as game_end, the wpa of the one before depends on it),
+    the new plays, half_end/game_end and the running totals. Expects wp on every play like score_wp returns it.
+
+    Args:
+        df (pl.DataFrame): Output of add_wp_variables.
+        new_plays (pl.DataFrame): New plays of the same form as the input of add_wp_variables (with the wp-Model probability).
+
+    Returns:
+        _type_: Polars DataFrame with Win Probability Columns
+    """
+    second_to_last = pl.int_range(pl.len()).over("game_id") == pl.len().over("game_id") - 2
+    return _append_incremental(df, new_plays, add_wp_variables, second_to_last,
+                               ["total_home_wp", "total_away_wp", "total_home_wpa", "total_away_wpa"])
+
+@profiled
+def enrich_by_game(df: pl.DataFrame, enrich=add_ep_variables, workers: int = None, games_per_task: int = None):
+    """Runs an enrichment function (add_ep_variables, add_wp_variables or a composition of both) on batches of whole games
+    in a thread pool (Polars releases the GIL while it computes) and stitches the results back in the original row order.
+    As every window of the enrichment is per game_id, the result equals enrich(df) regardless of workers and batching.
+
+    Args:
+        df (pl.DataFrame): Input of enrich, any number of concatenated games.
+        enrich (function, optional): Function from a DataFrame to a DataFrame that only looks within a game.
+        workers (int, optional): Number of threads, defaults to the number of CPUs.
+        games_per_task (int, optional): Games per batch, defaults to an even split into four batches per worker.
+
+    Returns:
+        _type_: The enriched Polars DataFrame in the row order of df.
+    """
+    workers = workers or os.cpu_count() or 1
+    games = df["game_id"].n_unique()
+    games_per_task = games_per_task or max(1, -(-games // (4 * workers)))
+    if workers == 1 or games <= games_per_task:
+        return enrich(df)
+    # Ganze Spiele je Batch, die Zeilennummer stellt die Reihenfolge nach dem Zusammenfuegen wieder her
+    batches = (df
+               .with_columns(_row = pl.int_range(pl.len(), dtype=pl.Int64),
+                             _batch = (pl.col("game_id").rank("dense") - 1) // games_per_task)
+               .partition_by("_batch", maintain_order=True, include_key=False))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(enrich, batches))
+    return pl.concat(parts, how="vertical_relaxed").sort("_row").drop("_row")
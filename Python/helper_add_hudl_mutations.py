@@ -1,6 +1,10 @@
 import polars as pl 
 import numpy as np
 
+from helper_pbp_sources import ADAPTERS, apply_scoring_stages
+from pipeline_profiler import profiled
+
+@profiled
 def get_games(df: pl.DataFrame):
     games = (
         df.melt(id_vars="game_id", value_vars="posteam")
@@ -11,326 +15,67 @@ def get_games(df: pl.DataFrame):
           )
     return(games)
 
-def make_hudl_mutations(df: pl.DataFrame):
-    """_summary_
+# Columns make_hudl_mutations and make_dsfootball_mutations add to the raw columns, in their order
+HUDL_COLUMNS = ["home_team", "away_team", "defteam", "down", "yards_to_go", "yardline", "yardline_50_simple", "yards_to_go_simple",
+                "yardline_50_after", "posteam_after", "play_type", "sack", "interception", "complete_pass", "touchdown", "def_touchdown",
+                "penalty", "safety", "one_point_conv_success", "two_point_conv_success", "defensive_two_point_conv", "scoring_play",
+                "scoring_play_team", "home_team_points", "away_team_points", "home_team_score", "away_team_score", "posteam_score",
+                "defteam_score", "score_differential", "yards_gained", "first_down"]
+DSFOOTBALL_COLUMNS = ["home_team", "away_team", "defteam", "down", "yards_to_go", "yardline_50", "drive_id", "half", "yardline_50_simple",
+                      "yards_to_go_simple", "yardline_50_after", "posteam_after", "def_touchdown", "safety", "one_point_conv_success",
+                      "two_point_conv_success", "defensive_two_point_conv", "scoring_play", "scoring_play_team", "home_team_points",
+                      "away_team_points", "home_team_score", "away_team_score", "posteam_score", "defteam_score", "score_differential",
+                      "yards_gained", "first_down"]
 
-    Args:
-        df (pl.DataFrame): _description_
-        games (pl.DataFrame): _description_
-    """
+def _make_mutations(df: pl.DataFrame, source: str, columns: list):
     output = (
-        df.join(get_games(df), on="game_id")
-        .with_columns(defteam =
-                    pl.when(pl.col("posteam") == pl.col("home_team")).then(pl.col("away_team"))
-                    .when(pl.col("posteam") == pl.col("away_team")).then(pl.col("home_team"))
-                    .otherwise(pl.lit(None))
-                    )
-        .with_columns([
-        pl.col("DN").cast(pl.Int32()).alias("down"),
-        pl.col("DIST").cast(pl.Int32()).alias("yards_to_go"),
-        pl.col("YARD LN").cast(pl.Int32()).alias("yardline"),
-        pl.col(["yardline_50","game_id","play_id","drive_id","half"]).cast(pl.Int32())
-        ])
-        .with_columns(
-            yardline_50_simple = pl.when(pl.col("yardline_50") < 25).then(pl.lit(0)).otherwise(pl.lit(1)),
-            yards_to_go_simple = 
-            pl.when(pl.col("yards_to_go") <= 5).then(pl.lit(1))
-            .when((pl.col("yards_to_go") > 5) & (pl.col("yards_to_go") <= 10)).then(pl.lit(2))
-            .when((pl.col("yards_to_go") > 10) & (pl.col("yards_to_go") <= 15)).then(pl.lit(3))
-            .when((pl.col("yards_to_go") > 15) & (pl.col("yards_to_go") <= 20)).then(pl.lit(4))
-            .when(pl.col("yards_to_go") > 20).then(pl.lit(5))
-            .otherwise(pl.lit(0))
-        )
-        .with_columns(
-            yardline_50_after = pl.col("yardline_50").shift(-1),
-            posteam_after = pl.col("posteam").shift(-1)
-        )
-        .with_columns(
-            pl.when(pl.col('RESULT').str.contains("Rush")).then(pl.lit("run"))
-            .when(pl.col('RESULT').str.contains("Penalty")).then(pl.lit("no_play"))
-            .when(pl.col('RESULT').str.contains("KNEEL")).then(pl.lit("qb_kneel"))
-            .when(pl.col('down') == 0).then(pl.lit("extra_point"))
-            .otherwise(pl.lit("pass"))
-            .alias('play_type')
-        )
-        .with_columns(
-            pl.when(pl.col('RESULT').str.contains("Sack")).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('sack')
-        )
-        .with_columns(
-            pl.when(pl.col('RESULT').str.contains("Interception")).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('interception')
-        )
-        .with_columns(
-            complete_pass = 
-            pl.when((pl.col("play_type").is_in(["pass","extra_point","no_play"])) & (pl.col("RESULT").str.contains("Complete"))).then(pl.lit(1))
-            .when((pl.col("play_type").is_in(["pass","extra_point","no_play"])) & (pl.col("RESULT") == "Incomplete")).then(pl.lit(0))
-            .when((pl.col("yardline_50") != pl.col("yardline_50_after")) & (pl.col("posteam") == pl.col("posteam_after"))).then(pl.lit(1))
-            .when((pl.col("down")==4) & (pl.col("posteam") != pl.col("posteam_after"))).then(pl.lit(0))
-            .otherwise(pl.lit(0))        
-        )
-        .with_columns(
-            pl.when((pl.col('RESULT').str.contains("TD")) & (pl.col('RESULT').str.contains("Def").not_())).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('touchdown')
-        )
-        .with_columns(
-            pl.when(pl.col('RESULT').str.contains("Def TD")).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('def_touchdown')
-        )
-        .with_columns(
-            pl.when(pl.col('RESULT').str.contains("Penalty")).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('penalty')
-        )
-        .with_columns(
-            pl.when(pl.col('RESULT').str.contains("Safety")).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('safety')
-        )
-        .with_columns(
-            pl.when((pl.col('RESULT') == "Good") & (pl.col("down") == 0) & (pl.col("yardline_50") == 45)).then(pl.lit(1))
-            .when((pl.col("down") == 0) & (pl.col("yardline_50") != 45)).then(pl.lit(0))
-            .when(pl.col("down") != 0).then(pl.lit(0))
-            .otherwise(pl.lit(0))
-            .alias('one_point_conv_success')
-        )
-        .with_columns(
-            pl.when((pl.col('RESULT') == "Good") & (pl.col("down") == 0) & (pl.col("yardline_50") == 40)).then(pl.lit(1))
-            .when((pl.col("down") == 0) & (pl.col("yardline_50") != 40)).then(pl.lit(0))
-            .when(pl.col("down") != 0).then(pl.lit(0))
-            .otherwise(pl.lit(0))
-            .alias('two_point_conv_success')
-        )
-        .with_columns(
-            pl.when((pl.col('RESULT').str.contains("Def TD")) & (pl.col("down") == 0)).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('defensive_two_point_conv')
-        )
-        .with_columns(
-            pl.when(
-                pl.col('touchdown') |
-                pl.col('def_touchdown') |
-                pl.col('one_point_conv_success') |
-                pl.col('two_point_conv_success') |
-                pl.col('defensive_two_point_conv') |
-                pl.col('safety') 
-                == 1).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('scoring_play')
-        )
-        .with_columns(
-            pl.when((pl.col('scoring_play') == 1) & (pl.col("touchdown") | pl.col("one_point_conv_success") | pl.col("two_point_conv_success") == 1)).then(pl.col("posteam"))
-            .otherwise(pl.lit(None))
-            .alias('scoring_play_team')
-        )
-        .with_columns(
-            home_team_points = pl.when(pl.col("play_id")==1).then(pl.lit(0))
-                .when(pl.col('home_team')==pl.col("scoring_play_team")).then(
-                    pl.when(touchdown=1).then(pl.lit(6))
-                    .when(def_touchdown=1).then(pl.lit(6))
-                    .when(one_point_conv_success=1).then(pl.lit(1))
-                    .when(two_point_conv_success=1).then(pl.lit(2))
-                    .when(defensive_two_point_conv=1).then(pl.lit(2))
-                    .when(safety=1).then(pl.lit(2))
-                .otherwise(pl.lit(None))
-            ),
-            away_team_points = pl.when(pl.col("play_id")==1).then(pl.lit(0))
-                .when(pl.col('away_team')==pl.col("scoring_play_team")).then(
-                    pl.when(touchdown=1).then(pl.lit(6))
-                    .when(def_touchdown=1).then(pl.lit(6))
-                    .when(one_point_conv_success=1).then(pl.lit(1))
-                    .when(two_point_conv_success=1).then(pl.lit(2))
-                    .when(defensive_two_point_conv=1).then(pl.lit(2))
-                    .when(safety=1).then(pl.lit(2))
-                .otherwise(pl.lit(None))
-            )
-        )
-        .with_columns(
-            home_team_score = pl.col('home_team_points').cum_sum().over(["game_id","home_team"]),
-            away_team_score = pl.col('away_team_points').cum_sum().over(["game_id","away_team"])
-        )
-        .with_columns(
-                home_team_score = pl.col("home_team_score").forward_fill(),
-                away_team_score = pl.col("away_team_score").forward_fill()
-            )
-        .with_columns(
-            posteam_score = pl.when(pl.col("posteam") == pl.col("home_team")).then(pl.col('home_team_score'))
-                .when(pl.col("posteam") == pl.col("away_team")).then(pl.col('away_team_score')),
-            defteam_score = pl.when(pl.col("defteam") == pl.col("home_team")).then(pl.col('home_team_score'))
-                .when(pl.col("defteam") == pl.col("away_team")).then(pl.col('away_team_score'))
-            )
-        .with_columns(score_differential = pl.col("posteam_score") - pl.col("defteam_score"))
-        .with_columns(
-            yards_gained = 
-            pl.when(down = 0).then(pl.lit(0))
-            .when(down=4,complete_pass=0).then(pl.lit(0))
-            # .when((pl.col("down") == 4) & (pl.col("interception") == 0) & (pl.col("sack") == 0) & (pl.col("def_touchdown") == 0) & (pl.col("penalty") == 0) & (pl.col("safety") == 0)).then(pl.lit(0))
-            .when(down = 4, safety= 1).then(pl.lit(0))
-            .otherwise(pl.col("yardline_50_after") - pl.col("yardline_50"))
-        )
-        .with_columns(
-            pl.when((pl.col('yardline_50') < 25) & (pl.col("yards_gained") > pl.col("yards_to_go"))).then(pl.lit(1))
-            .otherwise(pl.lit(0))
-            .alias('first_down')
-        )
+        apply_scoring_stages(ADAPTERS[source]["to_canonical"](df.lazy()), credit_defensive_scores=ADAPTERS[source]["credit_defensive_scores"])
         .with_row_index(offset=1)
+        .select(["index", *df.columns, *(col for col in columns if col not in df.columns)])
     )
-    return(output)
+    return output.collect()
 
+@profiled
+def make_hudl_mutations(df: pl.DataFrame):
+    """Maps a Hudl export (data_raw.csv) with the 'hudl' adapter and adds the shared scoring columns (see helper_pbp_sources).
+
+    Args:
+        df (pl.DataFrame): The raw Hudl export.
+
+    Returns:
+        _type_: The raw columns plus HUDL_COLUMNS and an 'index'.
+    """
+    return _make_mutations(df, "hudl", HUDL_COLUMNS)
+
+@profiled
 def make_dsfootball_mutations(df: pl.DataFrame):
-    output = (df
-                .join(get_games(df), on="game_id")
-                .with_columns(defteam =
-                    pl.when(pl.col("posteam") == pl.col("home_team")).then(pl.col("away_team"))
-                    .when(pl.col("posteam") == pl.col("away_team")).then(pl.col("home_team"))
-                    .otherwise(pl.lit(None))
-                    )
-                .with_columns([
-                    pl.col("play_id").cast(pl.Int32()),
-                    pl.col("complete_pass").cast(pl.Int32()),
-                    pl.col("interception").cast(pl.Int32()),
-                    pl.col("touchdown").cast(pl.Int32()),
-                    pl.col("point_after").cast(pl.Int32()),
-                    pl.col("Down").cast(pl.Int32()).alias("down"),
-                    pl.col("Distance").cast(pl.Int32()).alias("yards_to_go"),
-                    pl.col("Spot").cast(pl.Int32()).alias("yardline_50"),
-                    pl.col("Drive").cast(pl.Int32()).alias("drive_id"),
-                    pl.col("Quarter").cast(pl.Int32()).alias("half")
-                    ])
-                .with_columns(pl.col("point_after_success").str.replace("NA", "0"))
-                .with_columns(pl.col("point_after_success").cast(pl.Int32()))
-                .with_columns(
-                    yardline_50_simple = pl.when(pl.col("yardline_50") < 25).then(pl.lit(0)).otherwise(pl.lit(1)),
-                    yards_to_go_simple = 
-                    pl.when(pl.col("yards_to_go") <= 5).then(pl.lit(1))
-                    .when((pl.col("yards_to_go") > 5) & (pl.col("yards_to_go") <= 10)).then(pl.lit(2))
-                    .when((pl.col("yards_to_go") > 10) & (pl.col("yards_to_go") <= 15)).then(pl.lit(3))
-                    .when((pl.col("yards_to_go") > 15) & (pl.col("yards_to_go") <= 20)).then(pl.lit(4))
-                    .when(pl.col("yards_to_go") > 20).then(pl.lit(5))
-                    .otherwise(pl.lit(0))
-                )
-                .with_columns(
-                    yardline_50_after = pl.col("yardline_50").shift(-1),
-                    posteam_after = pl.col("posteam").shift(-1)
-                )
-                .with_columns(
-                    pl.when((pl.col('interception') == 1) & (pl.col("touchdown")==1)).then(pl.lit(1))
-                    .otherwise(pl.lit(0))
-                    .alias('def_touchdown')
-                )
-                .with_columns(
-                    pl.when(pl.col('IsSafety') == True).then(pl.lit(1))
-                    .otherwise(pl.lit(0))
-                    .alias('safety')
-                )
-                .with_columns(
-                    pl.when((pl.col('point_after_success') == 1) & (pl.col('point_after') == 1) & (pl.col("yardline_50") == 45)).then(pl.lit(1))
-                    .when((pl.col("down") == 0) & (pl.col("yardline_50") != 45)).then(pl.lit(0))
-                    .when(pl.col("down") != 0).then(pl.lit(0))
-                    .otherwise(pl.lit(0))
-                    .alias('one_point_conv_success')
-                )
-                .with_columns(
-                    pl.when((pl.col('point_after_success') == 1) & (pl.col('point_after') == 1) & (pl.col("yardline_50") == 40)).then(pl.lit(1))
-                    .when((pl.col("down") == 0) & (pl.col("yardline_50") != 40)).then(pl.lit(0))
-                    .when(pl.col("down") != 0).then(pl.lit(0))
-                    .otherwise(pl.lit(0))
-                    .alias('two_point_conv_success')
-                )
-                .with_columns(
-                    pl.when((pl.col('point_after') == 1) & (pl.col("interception") == 1) & (pl.col("touchdown") == 1)).then(pl.lit(1))
-                    .otherwise(pl.lit(0))
-                    .alias('defensive_two_point_conv')
-                )
-                .with_columns(
-                    pl.when(
-                        pl.col('touchdown') |
-                        pl.col('def_touchdown') |
-                        pl.col('one_point_conv_success') |
-                        pl.col('two_point_conv_success') |
-                        pl.col('defensive_two_point_conv') |
-                        pl.col('safety') 
-                        == 1).then(pl.lit(1))
-                    .otherwise(pl.lit(0))
-                    .alias('scoring_play')
-                )
-                .with_columns(
-                    pl.when((pl.col('scoring_play') == 1) & (pl.col("touchdown") | pl.col("one_point_conv_success") | pl.col("two_point_conv_success") == 1)).then(pl.col("posteam"))
-                    .when((pl.col('scoring_play') == 1) & (pl.col("def_touchdown") | pl.col("defensive_two_point_conv") | pl.col("safety") == 1)).then(pl.col("defteam"))
-                    .otherwise(pl.lit(None))
-                    .alias('scoring_play_team')
-                )
-                .with_columns(
-                    home_team_points = pl.when(pl.col("play_id")==1).then(pl.lit(0))
-                        .when(pl.col('home_team')==pl.col("scoring_play_team")).then(
-                            pl.when(touchdown=1).then(pl.lit(6))
-                            .when(def_touchdown=1).then(pl.lit(6))
-                            .when(one_point_conv_success=1).then(pl.lit(1))
-                            .when(two_point_conv_success=1).then(pl.lit(2))
-                            .when(defensive_two_point_conv=1).then(pl.lit(2))
-                            .when(safety=1).then(pl.lit(2))
-                        .otherwise(pl.lit(None))
-                    ),
-                    away_team_points = pl.when(pl.col("play_id")==1).then(pl.lit(0))
-                        .when(pl.col('away_team')==pl.col("scoring_play_team")).then(
-                            pl.when(touchdown=1).then(pl.lit(6))
-                            .when(def_touchdown=1).then(pl.lit(6))
-                            .when(one_point_conv_success=1).then(pl.lit(1))
-                            .when(two_point_conv_success=1).then(pl.lit(2))
-                            .when(defensive_two_point_conv=1).then(pl.lit(2))
-                            .when(safety=1).then(pl.lit(2))
-                        .otherwise(pl.lit(None))
-                    )
-                )
-                .with_columns(
-                    home_team_score = pl.col('home_team_points').cum_sum().over(["game_id","home_team"]),
-                    away_team_score = pl.col('away_team_points').cum_sum().over(["game_id","away_team"])
-                )
-                .with_columns(
-                        home_team_score = pl.col("home_team_score").forward_fill(),
-                        away_team_score = pl.col("away_team_score").forward_fill()
-                    )
-                .with_columns(
-                    posteam_score = pl.when(pl.col("posteam") == pl.col("home_team")).then(pl.col('home_team_score'))
-                        .when(pl.col("posteam") == pl.col("away_team")).then(pl.col('away_team_score')),
-                    defteam_score = pl.when(pl.col("defteam") == pl.col("home_team")).then(pl.col('home_team_score'))
-                        .when(pl.col("defteam") == pl.col("away_team")).then(pl.col('away_team_score'))
-                    )
-                .with_columns(score_differential = pl.col("posteam_score") - pl.col("defteam_score"))
-                .with_columns(
-                    yards_gained = 
-                    pl.when(down = 0).then(pl.lit(0))
-                    .when(down=4,complete_pass=0).then(pl.lit(0))
-                    # .when((pl.col("down") == 4) & (pl.col("interception") == 0) & (pl.col("sack") == 0) & (pl.col("def_touchdown") == 0) & (pl.col("penalty") == 0) & (pl.col("safety") == 0)).then(pl.lit(0))
-                    .when(down = 4, safety= 1).then(pl.lit(0))
-                    .otherwise(pl.col("yardline_50_after") - pl.col("yardline_50"))
-                )
-                .with_columns(
-                    pl.when((pl.col('yardline_50') < 25) & (pl.col("yards_gained") > pl.col("yards_to_go"))).then(pl.lit(1))
-                    .otherwise(pl.lit(0))
-                    .alias('first_down')
-                )
-                .with_row_index(offset=1)
-            )
-    return(output)
+    """Maps a DS-Football export with the 'dsfootball' adapter and adds the shared scoring columns (see helper_pbp_sources).
 
-def prepare_ep_data(df: pl.DataFrame):
+    Args:
+        df (pl.DataFrame): The raw DS-Football export.
+
+    Returns:
+        _type_: The raw columns plus DSFOOTBALL_COLUMNS and an 'index'.
+    """
+    return _make_mutations(df, "dsfootball", DSFOOTBALL_COLUMNS)
+
+@profiled
+def add_period_ends(df):
+    """Marks the last play of every half (half_end) and of the game (game_end, last play of the second half).
+
+    Args:
+        df (pl.DataFrame or pl.LazyFrame): Plays with 'index', 'game_id' and 'half'.
+
+    Returns:
+        _type_: df with 'half_end' and 'game_end'.
+    """
+    return (df
+            .with_columns(half_end = (pl.col("index") == pl.col("index").max().over(["game_id", "half"])).cast(pl.Int32))
+            .with_columns(game_end = pl.when((pl.col("half_end") == 1 ) & (pl.col("half") == 2)).then(1).otherwise(0))
+    )
+
+def _add_ep_columns(df):
     output = (df
-              .with_columns(
-                  half_end = 
-                  pl.when(pl.col("index")
-                          .is_in(df
-                                 .select(["index", "game_id", "half"])
-                                 .unique(subset=["game_id","half"], keep="last")
-                                 .select("index")
-                                 .to_dicts())).then(pl.lit(1))
-                                 .otherwise(pl.lit(0))
-                )
-                .with_columns(game_end = pl.when((pl.col("half_end") == 1 ) & (pl.col("half") == 2)).then(1).otherwise(0))
                 .with_columns(
                     pl.when(pl.col("touchdown") == 1).then(pl.lit("Touchdown"))
                     .when(pl.col("def_touchdown") == 1).then(pl.lit("Touchdown"))
@@ -381,19 +126,8 @@ def prepare_ep_data(df: pl.DataFrame):
             )
     return(output)
 
-def prepare_wp_data(df: pl.DataFrame):
+def _add_wp_columns(df):
     output = (df
-              .with_columns(
-                  half_end = 
-                  pl.when(pl.col("index")
-                          .is_in(df
-                                 .select(["index", "game_id", "half"])
-                                 .unique(subset=["game_id","half"], keep="last")
-                                 .select("index")
-                                 .to_dicts())).then(pl.lit(1))
-                                 .otherwise(pl.lit(0))
-                )
-                .with_columns(game_end = pl.when((pl.col("half_end") == 1 ) & (pl.col("half") == 2)).then(1).otherwise(0))
                 .with_columns(helper_one = pl.lit(1))
                 .with_columns(play_id_half = pl.col("helper_one").cum_sum().over(["game_id","half"]))
                 .with_columns(play_time = pl.when(play_id_half=1).then(0).otherwise(1200 / pl.col('play_id_half').max()).over(['game_id', 'half']))
@@ -403,5 +137,29 @@ def prepare_wp_data(df: pl.DataFrame):
                 .with_columns(Diff_Time_Ratio = (pl.col("score_differential")) / (np.exp(-4 * pl.col("elapsed_share"))))
                 .with_columns(start_posteam = pl.when(pl.col("play_id") == 1).then(pl.col("posteam")).otherwise(pl.lit(None)))
                 .with_columns(receive_2h_ko = pl.when(pl.col("start_posteam") == pl.col("posteam")).then(0).otherwise(1))
-              ) 
+            )
     return(output)
+
+def _run_lazy(df, transform):
+    output = transform(df.lazy())
+    return output if isinstance(df, pl.LazyFrame) else output.collect()
+
+@profiled
+def prepare_ep_data(df: pl.DataFrame):
+    return _run_lazy(df, lambda lf: _add_ep_columns(add_period_ends(lf)))
+
+@profiled
+def prepare_wp_data(df: pl.DataFrame):
+    return _run_lazy(df, lambda lf: _add_wp_columns(add_period_ends(lf)))
+
+@profiled
+def prepare_model_data(df: pl.DataFrame):
+    """Adds the EP and the WP preparation in one pass over the data, equals prepare_ep_data(prepare_wp_data(df)).
+
+    Args:
+        df (pl.DataFrame or pl.LazyFrame): Output of make_hudl_mutations or make_dsfootball_mutations.
+
+    Returns:
+        _type_: Polars DataFrame (or LazyFrame) with the columns of both preparations.
+    """
+    return _run_lazy(df, lambda lf: _add_ep_columns(_add_wp_columns(add_period_ends(lf))))
@@ -1,6 +1,9 @@
 import polars as pl 
 import xgboost as xgb
 
+from pipeline_profiler import profiled
+
+@profiled
 def make_ep_model_mutations(df: pl.DataFrame, selected_columns):
     """Adds the needed 'label' column for the model and select only needed ones.
 
@@ -47,6 +50,7 @@ def make_ep_model_mutations(df: pl.DataFrame, selected_columns):
                         )
     return model_data
 
+@profiled
 def make_wp_model_mutations(df: pl.DataFrame, selected_columns):
     """Adds the needed 'label' column for the model and select only needed ones.
 
@@ -0,0 +1,190 @@
+import hashlib
+import math
+import os
+
+import numpy as np
+import polars as pl
+
+from helper_add_ep_wp import EP_LABELS, EP_POINTS
+from helper_tree_arrays import model_json
+
+DOWNS = np.arange(5)
+
+def model_hash(model_path: str) -> str:
+    """sha256 of the model file, ties a lookup table to the exact model it was computed from."""
+    with open(model_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def lookup_path(model_path: str) -> str:
+    """Default location of the lookup table of a model, e.g. 'models/ep_model.lookup.npz'."""
+    return os.path.splitext(model_path)[0] + ".lookup.npz"
+
+def split_axes(booster) -> dict:
+    """Collects the integer grid of every non-down feature from the split thresholds of the booster.
+    A tree goes left if x < threshold, so all integers between two neighbouring thresholds get the same
+    prediction. The grid covers one value below the smallest and the first value above the largest threshold,
+    clipping any integer input onto it therefore gives exactly the prediction of the model.
+
+    Args:
+        booster (xgb.Booster): The EP model.
+
+    Returns:
+        dict: Feature name -> np.ndarray of the grid values (int64), in booster feature order.
+    """
+    model = model_json(booster)
+    thresholds = {}
+    for tree in model["learner"]["gradient_booster"]["model"]["trees"]:
+        for left, index, condition in zip(tree["left_children"], tree["split_indices"], tree["split_conditions"]):
+            if left != -1:
+                thresholds.setdefault(index, set()).add(condition)
+
+    axes = {}
+    for index, feature in enumerate(booster.feature_names):
+        if feature.startswith("down") and feature[4:].isdigit():
+            continue
+        if index not in thresholds:
+            # Feature wird von keinem Baum genutzt
+            axes[feature] = np.zeros(1, dtype=np.int64)
+            continue
+        low = math.ceil(min(thresholds[index])) - 1
+        high = math.ceil(max(thresholds[index]))
+        axes[feature] = np.arange(low, high + 1, dtype=np.int64)
+    return axes
+
+def state_grid(booster) -> tuple:
+    """Every (down, feature 1, feature 2) state of the grid of the EP model (see split_axes) as a feature matrix.
+
+    Args:
+        booster (xgb.Booster): The EP model.
+
+    Returns:
+        tuple: (axes of split_axes, float32 feature matrix in booster feature order, grid shape (downs, *axes)).
+    """
+    from helper_model_scoring import model_feature_exprs
+
+    axes = split_axes(booster)
+    grid = pl.DataFrame(
+        np.stack([a.ravel() for a in np.meshgrid(DOWNS, *axes.values(), indexing="ij")], axis=1),
+        schema=["down", *axes],
+        orient="row",
+    )
+    X = grid.select(model_feature_exprs(booster.feature_names)).to_numpy()
+    return axes, X, (len(DOWNS), *(len(a) for a in axes.values()))
+
+def build_ep_lookup(model_path: str = "models/ep_model.ubj", out_path: str = None) -> str:
+    """Evaluates the EP model once on every (down, feature 1, feature 2) state of its grid (see split_axes)
+    and stores the class probabilities and the expected points as a NumPy archive next to the model.
+    The archive carries the sha256 of the model file, load_ep_lookup refuses tables of another model.
+
+    Args:
+        model_path (str, optional): Path of the native EP model (see export_model).
+        out_path (str, optional): Target path. Defaults to lookup_path(model_path).
+
+    Returns:
+        str: The path of the lookup table.
+    """
+    from helper_model_scoring import load_booster
+
+    booster = load_booster(model_path)
+    axes, X, shape = state_grid(booster)
+    probs = booster.inplace_predict(X).reshape(*shape, len(EP_LABELS)).astype(np.float32)
+
+    out_path = out_path or lookup_path(model_path)
+    np.savez_compressed(
+        out_path,
+        probs=probs,
+        ep=probs @ np.asarray(EP_POINTS, dtype=np.float32),
+        features=np.array(list(axes)),
+        lows=np.array([a[0] for a in axes.values()]),
+        model_sha256=np.array(model_hash(model_path)),
+    )
+    return out_path
+
+def _load_table(path: str, model_path: str, builder: str) -> dict:
+    with np.load(path, allow_pickle=False) as archive:
+        table = {key: archive[key] for key in archive.files}
+    table["model_sha256"] = str(table["model_sha256"])
+    if model_path is not None and model_hash(model_path) != table["model_sha256"]:
+        raise ValueError(f"{path} was built from another version of {model_path}, rebuild it with {builder}")
+    return table
+
+def load_ep_lookup(path: str = "models/ep_model.lookup.npz", model_path: str = None) -> dict:
+    """Loads a lookup table, needs NumPy only.
+
+    Args:
+        path (str, optional): Path of the table (see build_ep_lookup).
+        model_path (str, optional): If given, the table must have been built from exactly this model file.
+
+    Raises:
+        ValueError: If the table belongs to another version of the model.
+
+    Returns:
+        dict: The arrays of the table ('probs', 'ep', 'features', 'lows', 'model_sha256').
+    """
+    return _load_table(path, model_path, "build_ep_lookup")
+
+def grid_index(table: dict, down, feature_1, feature_2) -> tuple:
+    """Indexes states, scalars or arrays, into the state grid of a table (see split_axes): the features are
+    clipped onto their grid, states with a missing value (NaN) or a down outside 0-4 are invalid.
+
+    Args:
+        table (dict): A table over the state grid with 'lows' and 'ep' (see load_ep_lookup).
+        down: The down.
+        feature_1: First feature, e.g. yardline_50.
+        feature_2: Second feature, e.g. yards_to_go.
+
+    Returns:
+        tuple: (index tuple into the grid axes, boolean mask of the valid states).
+    """
+    values = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (down, feature_1, feature_2)))
+    valid = ~np.isnan(values[0]) & ~np.isnan(values[1]) & ~np.isnan(values[2])
+    valid &= (values[0] >= 0) & (values[0] < table["ep"].shape[0])
+
+    index = [np.where(valid, values[0], 0).astype(np.intp)]
+    for axis, (value, low) in enumerate(zip(values[1:], table["lows"]), start=1):
+        value = np.where(valid, value, low)
+        index.append(np.clip(value - low, 0, table["ep"].shape[axis] - 1).astype(np.intp))
+    return tuple(index), valid
+
+def lookup_ep(table: dict, down, feature_1, feature_2) -> tuple:
+    """Looks up the EP class probabilities and the expected points of states, scalars or arrays.
+    The features are the two non-down features in table['features'] order (yardline_50 and yards_to_go
+    for the EP model). States with a missing value (NaN) or a down outside 0-4 get NaN.
+
+    Args:
+        table (dict): The lookup table (see load_ep_lookup).
+        down: The down.
+        feature_1: First feature, e.g. yardline_50.
+        feature_2: Second feature, e.g. yards_to_go.
+
+    Returns:
+        tuple: (probs with shape (..., 5), ep with shape (...)).
+    """
+    index, valid = grid_index(table, down, feature_1, feature_2)
+    probs = table["probs"][index]
+    ep = table["ep"][index]
+    if not valid.all():
+        probs = np.where(valid[..., None], probs, np.nan)
+        ep = np.where(valid, ep, np.nan)
+    return probs, ep
+
+def score_ep_lookup(df: pl.DataFrame, table="models/ep_model.lookup.npz") -> pl.DataFrame:
+    """Same output as score_ep, but from the precomputed table instead of the tree ensemble.
+
+    Args:
+        df (pl.DataFrame): Plays with 'down' and the two non-down features of the table.
+        table (str or dict, optional): Path of the lookup table or a loaded table.
+
+    Returns:
+        pl.DataFrame: df with the probability columns and 'ep'.
+    """
+    if isinstance(table, str):
+        table = load_ep_lookup(table)
+    columns = ["down", *table["features"]]
+    values = [df[col].cast(pl.Float64).fill_null(np.nan).to_numpy() for col in columns]
+    probs, ep = lookup_ep(table, *values)
+    return df.hstack(
+        pl.DataFrame(probs.reshape(-1, len(EP_LABELS)), schema=EP_LABELS)
+        .with_columns(ep = pl.Series(ep))
+        .fill_nan(None)
+    )
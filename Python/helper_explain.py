@@ -0,0 +1,155 @@
+import os
+
+import numpy as np
+import polars as pl
+import xgboost as xgb
+
+from helper_add_ep_wp import EP_LABELS, EP_POINTS
+from helper_ep_lookup import _load_table, grid_index, model_hash, state_grid
+from helper_model_scoring import _booster, load_booster, model_feature_exprs
+from pipeline_profiler import profiled
+
+def explanations_path(model_path: str) -> str:
+    """Default location of the explanation table of a model, e.g. 'models/ep_model.shap.npz'."""
+    return os.path.splitext(model_path)[0] + ".shap.npz"
+
+def contribution_columns(features: list, labels: list = None) -> list:
+    """Column names of the contributions: 'shap_<feature>' and 'shap_bias', for multi-class models
+    'shap_<label>_<feature>' and 'shap_<label>_bias' per label."""
+    names = [*features, "bias"]
+    if labels is None:
+        return [f"shap_{name}" for name in names]
+    return [f"shap_{label}_{name}" for label in labels for name in names]
+
+def _contribs(booster: xgb.Booster, X: np.ndarray) -> np.ndarray:
+    dmatrix = xgb.DMatrix(X, missing=np.nan, feature_names=booster.feature_names)
+    return booster.predict(dmatrix, pred_contribs=True)
+
+@profiled
+def predict_contribs(df: pl.DataFrame, model, batch_size: int = 100_000, mask_missing: bool = False) -> np.ndarray:
+    """SHAP values of every row from XGBoost's native TreeSHAP (pred_contribs), in batches of batch_size rows like
+    predict_batches. The values are in margin space (log-odds, per class for the EP model) and add up to the
+    margin of the row together with the bias; as for pred_contribs they are path dependent, no background data is used.
+
+    Args:
+        df (pl.DataFrame): Data containing the model features (or 'down' for the one-hot downs).
+        model (str or xgb.Booster): Path of a native model or a loaded booster.
+        batch_size (int, optional): Rows per batch.
+        mask_missing (bool, optional): Return NaN instead of values for rows with missing features.
+
+    Returns:
+        np.ndarray: Shape (n_rows, n_features + 1) or (n_rows, n_classes, n_features + 1), the bias last.
+    """
+    booster = _booster(model)
+    features = df.lazy().select(model_feature_exprs(booster.feature_names)).collect()
+    contribs = []
+    for offset in range(0, features.height, batch_size):
+        X = features.slice(offset, batch_size).to_numpy()
+        values = _contribs(booster, X)
+        if mask_missing:
+            values[np.isnan(X).any(axis=1)] = np.nan
+        contribs.append(values)
+    if not contribs:
+        return _contribs(booster, np.empty((0, len(booster.feature_names)), dtype=np.float32))
+    return np.concatenate(contribs)
+
+def _hstack(df: pl.DataFrame, contribs: np.ndarray, columns: list) -> pl.DataFrame:
+    return df.hstack(pl.DataFrame(contribs.reshape(len(df), len(columns)), schema=columns).fill_nan(None))
+
+@profiled
+def explain_ep(df: pl.DataFrame, model="models/ep_model.ubj", batch_size: int = 100_000) -> pl.DataFrame:
+    """Adds the SHAP values of all five EP classes (see predict_contribs) to every play, plays score_ep
+    leaves without probabilities get nulls.
+
+    Args:
+        df (pl.DataFrame): Plays with the EP features.
+        model (str or xgb.Booster, optional): The EP model.
+        batch_size (int, optional): Rows per batch.
+
+    Returns:
+        pl.DataFrame: df with the columns of contribution_columns(features, EP_LABELS).
+    """
+    booster = _booster(model)
+    contribs = predict_contribs(df, booster, batch_size, mask_missing=True)
+    return _hstack(df, contribs, contribution_columns(booster.feature_names, EP_LABELS))
+
+@profiled
+def explain_wp(df: pl.DataFrame, model="models/wp_model.ubj", batch_size: int = 100_000) -> pl.DataFrame:
+    """Adds the SHAP values of the WP model (see predict_contribs) to every play.
+
+    Args:
+        df (pl.DataFrame): Plays with the WP features (see prepare_wp_data).
+        model (str or xgb.Booster, optional): The WP model.
+        batch_size (int, optional): Rows per batch.
+
+    Returns:
+        pl.DataFrame: df with the columns of contribution_columns(features).
+    """
+    booster = _booster(model)
+    contribs = predict_contribs(df, booster, batch_size)
+    return _hstack(df, contribs, contribution_columns(booster.feature_names))
+
+def build_ep_explanations(model_path: str = "models/ep_model.ubj", out_path: str = None) -> str:
+    """Computes the SHAP values of the EP model once for every state of its grid (see state_grid) and stores them
+    with the class probabilities and the expected points as a NumPy archive next to the model. Every integer state
+    within a grid cell takes the same path through every tree, so its values are exactly the ones of the cell.
+
+    Args:
+        model_path (str, optional): Path of the native EP model (see export_model).
+        out_path (str, optional): Target path. Defaults to explanations_path(model_path).
+
+    Returns:
+        str: The path of the explanation table.
+    """
+    booster = load_booster(model_path)
+    axes, X, shape = state_grid(booster)
+    contribs = _contribs(booster, X).reshape(*shape, len(EP_LABELS), len(booster.feature_names) + 1).astype(np.float32)
+    probs = booster.inplace_predict(X).reshape(*shape, len(EP_LABELS)).astype(np.float32)
+
+    out_path = out_path or explanations_path(model_path)
+    np.savez_compressed(
+        out_path,
+        contribs=contribs,
+        probs=probs,
+        ep=probs @ np.asarray(EP_POINTS, dtype=np.float32),
+        columns=np.array(contribution_columns(booster.feature_names, EP_LABELS)),
+        features=np.array(list(axes)),
+        lows=np.array([a[0] for a in axes.values()]),
+        model_sha256=np.array(model_hash(model_path)),
+    )
+    return out_path
+
+def load_ep_explanations(path: str = "models/ep_model.shap.npz", model_path: str = None) -> dict:
+    """Loads an explanation table, needs NumPy only.
+
+    Args:
+        path (str, optional): Path of the table (see build_ep_explanations).
+        model_path (str, optional): If given, the table must have been built from exactly this model file.
+
+    Raises:
+        ValueError: If the table belongs to another version of the model.
+
+    Returns:
+        dict: The arrays of the table ('contribs', 'probs', 'ep', 'columns', 'features', 'lows', 'model_sha256').
+    """
+    return _load_table(path, model_path, "build_ep_explanations")
+
+@profiled
+def explain_ep_lookup(df: pl.DataFrame, table="models/ep_model.shap.npz") -> pl.DataFrame:
+    """Same output as explain_ep, but from the precomputed table instead of TreeSHAP over the ensemble.
+
+    Args:
+        df (pl.DataFrame): Plays with 'down' and the two non-down features of the table.
+        table (str or dict, optional): Path of the explanation table or a loaded table.
+
+    Returns:
+        pl.DataFrame: df with the columns of contribution_columns(features, EP_LABELS).
+    """
+    if isinstance(table, str):
+        table = load_ep_explanations(table)
+    values = [df[col].cast(pl.Float64).fill_null(np.nan).to_numpy() for col in ["down", *table["features"]]]
+    index, valid = grid_index(table, *values)
+    contribs = table["contribs"][index]
+    if not valid.all():
+        contribs = np.where(valid[:, None, None], contribs, np.nan)
+    return _hstack(df, contribs, table["columns"].tolist())
@@ -0,0 +1,145 @@
+import functools
+import glob
+import os
+import pickle
+
+import numpy as np
+import polars as pl
+import xgboost as xgb
+
+from helper_add_ep_wp import EP_LABELS, EP_POINTS
+from helper_tree_arrays import load_tree_arrays, predict_trees
+from pipeline_profiler import profiled
+
+def export_model(pickle_path: str, out_path: str = None) -> str:
+    """Converts a pickled XGBRegressor into XGBoost's native model format, which keeps the feature names
+    and can be loaded without scikit-learn or unpickling.
+
+    Args:
+        pickle_path (str): Path of the pickled model, e.g. 'models/ep_model.pkl'.
+        out_path (str, optional): Target path, '.ubj' (binary) or '.json'. Defaults to the pickle path with '.ubj'.
+
+    Returns:
+        str: The path of the exported model.
+    """
+    out_path = out_path or os.path.splitext(pickle_path)[0] + ".ubj"
+    with open(pickle_path, "rb") as f:
+        model = pickle.load(f)
+    model.get_booster().save_model(out_path)
+    return out_path
+
+def export_models(models_dir: str = "models") -> list:
+    """Exports every pickled model in models_dir, see export_model."""
+    return [export_model(path) for path in sorted(glob.glob(os.path.join(models_dir, "*.pkl")))]
+
+@functools.lru_cache(maxsize=None)
+def load_booster(path: str) -> xgb.Booster:
+    """Loads a native XGBoost model once per path and process.
+
+    Args:
+        path (str): Path of a '.ubj' or '.json' model.
+
+    Returns:
+        xgb.Booster: The booster.
+    """
+    booster = xgb.Booster()
+    booster.load_model(path)
+    return booster
+
+def _booster(model) -> xgb.Booster:
+    return load_booster(model) if isinstance(model, str) else model
+
+_cached_tree_arrays = functools.lru_cache(maxsize=None)(load_tree_arrays)
+
+def _predictor(model) -> tuple:
+    # (Featurenamen, Funktion X -> Vorhersage) fuer Booster und Baum-Arrays (siehe helper_tree_arrays)
+    if isinstance(model, str) and model.endswith(".trees.npz"):
+        model = _cached_tree_arrays(model)
+    if isinstance(model, dict):
+        return model["features"], functools.partial(predict_trees, model)
+    booster = _booster(model)
+    return booster.feature_names, functools.partial(booster.inplace_predict, missing=np.nan)
+
+def model_feature_exprs(features: list) -> list:
+    """Builds the model features as expressions, the one-hot downs (down0..down4) are derived from 'down'
+    like in make_ep_model_mutations, all other features are taken as they are.
+
+    Args:
+        features (list): Feature names of the booster.
+
+    Returns:
+        list: One Float32 expression per feature.
+    """
+    exprs = []
+    for feature in features:
+        if feature.startswith("down") and feature[4:].isdigit():
+            expr = pl.when(pl.col("down").is_null()).then(pl.lit(None)).when(pl.col("down") == int(feature[4:])).then(pl.lit(1)).otherwise(pl.lit(0))
+        else:
+            expr = pl.col(feature)
+        exprs.append(expr.cast(pl.Float32).alias(feature))
+    return exprs
+
+@profiled
+def predict_batches(df: pl.DataFrame, model, batch_size: int = 100_000, mask_missing: bool = False) -> np.ndarray:
+    """Predicts in batches of batch_size rows. The features are built per batch, so besides df only the
+    batch's feature frame and its float32 matrix (each batch_size x n_features) are held at a time.
+    Missing features are passed to XGBoost as NaN.
+
+    Args:
+        df (pl.DataFrame): Data containing the model features (or 'down' for the one-hot downs).
+        model (str, xgb.Booster or dict): Path of a native model or of tree arrays ('.trees.npz'), a loaded booster
+            or loaded tree arrays (see load_tree_arrays).
+        batch_size (int, optional): Rows per batch.
+        mask_missing (bool, optional): Return NaN instead of a prediction for rows with missing features.
+
+    Returns:
+        np.ndarray: The predictions, shape (n_rows,) or (n_rows, n_classes).
+    """
+    feature_names, predict = _predictor(model)
+    exprs = model_feature_exprs(feature_names)
+    predictions = []
+    for offset in range(0, max(df.height, 1), batch_size):
+        X = df.lazy().slice(offset, batch_size).select(exprs).collect().to_numpy()
+        pred = predict(X)
+        if mask_missing:
+            pred[np.isnan(X).any(axis=1)] = np.nan
+        predictions.append(pred)
+    return np.concatenate(predictions) if df.height else np.empty((0,))
+
+@profiled
+def score_ep(df: pl.DataFrame, model="models/ep_model.ubj", batch_size: int = 100_000) -> pl.DataFrame:
+    """Adds the EP class probabilities (EP_LABELS) and the expected points 'ep' to every play,
+    the output can be passed to add_ep_variables directly. Plays without yardline, distance or down
+    (filtered out by make_ep_model_mutations) get nulls.
+
+    Args:
+        df (pl.DataFrame): Plays with the EP features.
+        model (str, xgb.Booster or dict, optional): The EP model, see predict_batches.
+        batch_size (int, optional): Rows per batch.
+
+    Returns:
+        pl.DataFrame: df with the probability columns and 'ep'.
+    """
+    probs = predict_batches(df, model, batch_size, mask_missing=True).reshape(-1, len(EP_LABELS))
+    probs = pl.DataFrame(probs, schema=EP_LABELS).fill_nan(None)
+    return (
+        df.hstack(probs)
+        .with_columns(ep = pl.sum_horizontal([points * pl.col(label) for label, points in zip(EP_LABELS, EP_POINTS)]))
+        .with_columns(ep = pl.when(pl.col(EP_LABELS[0]).is_null()).then(pl.lit(None)).otherwise(pl.col("ep")))
+    )
+
+@profiled
+def score_wp(df: pl.DataFrame, model="models/wp_model.ubj", batch_size: int = 100_000) -> pl.DataFrame:
+    """Adds the win probability of the possession team 'wp' to every play,
+    the output can be passed to add_wp_variables directly.
+
+    Args:
+        df (pl.DataFrame): Plays with the WP features (see prepare_wp_data).
+        model (str, xgb.Booster or dict, optional): The WP model, see predict_batches.
+        batch_size (int, optional): Rows per batch.
+
+    Returns:
+        pl.DataFrame: df with the 'wp' column.
+    """
+    wp = predict_batches(df, model, batch_size)
+    return df.with_columns(wp = pl.Series(wp, dtype=pl.Float32).fill_nan(None))
@@ -0,0 +1,191 @@
+import os
+
+import polars as pl
+
+from pipeline_profiler import profiled
+
+# Feinste Koernung, alle Rollups werden daraus durch Summieren gebildet
+BASE_KEYS = ["season", "competition_id", "game_id", "team", "role", "player", "play_type", "down"]
+
+# Spielerrollen der Offense, die EPA/WPA eines Plays gutgeschrieben bekommen
+PLAYER_ROLES = ["passer", "receiver", "rusher"]
+
+# Rollup -> Gruppierung. Rollups ohne 'player' zaehlen jeden Play einmal fuer das Team (role 'team'),
+# Rollups mit 'player' einmal je beteiligtem Spieler und Rolle.
+ROLLUPS = {
+    "team": ["season", "competition_id", "team"],
+    "team_play_type": ["season", "competition_id", "team", "play_type"],
+    "team_down": ["season", "competition_id", "team", "down"],
+    "team_game": ["season", "competition_id", "game_id", "team"],
+    "player": ["season", "competition_id", "team", "role", "player"],
+    "player_play_type": ["season", "competition_id", "team", "role", "player", "play_type"],
+    "player_down": ["season", "competition_id", "team", "role", "player", "down"],
+}
+
+# Additive Kennzahlen, die abgeleiteten (EPA per Play, Success Rate, ...) berechnet rollup_metrics beim Abfragen
+MEASURES = {
+    "plays": pl.Int64,
+    "epa_plays": pl.Int64,
+    "epa": pl.Float64,
+    "successes": pl.Int64,
+    "wpa_plays": pl.Int64,
+    "wpa": pl.Float64,
+}
+
+def _column_expr(columns: list, column: str, dtype, name: str = None) -> pl.Expr:
+    # Hudl-Daten haben z.B. keine season und competition_id, fehlende Spalten bleiben leer
+    return (pl.col(column) if column in columns else pl.lit(None)).cast(dtype).alias(name or column)
+
+def _player_expr(columns: list, role: str) -> pl.Expr:
+    # Aufgeloeste Spieler-IDs (resolve_players) haben Vorrang vor den Rueckennummern
+    column = f"{role}_player_id" if f"{role}_player_id" in columns else role
+    return pl.col(column).cast(pl.String) if column in columns else pl.lit(None, dtype=pl.String)
+
+@profiled
+def play_facts(plays) -> pl.DataFrame:
+    """Aggregates enriched plays (add_ep_variables and add_wp_variables) into the base table of the rollups:
+    the additive measures per BASE_KEYS, one row set with role 'team' (every play of the possession team)
+    and one per PLAYER_ROLES for the plays with that player. A play is a success if its epa is positive.
+
+    Args:
+        plays (pl.DataFrame or pl.LazyFrame): Enriched plays with 'epa' and 'wpa' (missing ones count as null).
+
+    Returns:
+        pl.DataFrame: The base table.
+    """
+    lazy = plays.lazy()
+    columns = lazy.collect_schema().names()
+    keys = [
+        _column_expr(columns, "season", pl.String),
+        _column_expr(columns, "competition_id", pl.Int64),
+        _column_expr(columns, "game_id", pl.Int64),
+        _column_expr(columns, "posteam", pl.String, "team"),
+        _column_expr(columns, "play_type", pl.String),
+        _column_expr(columns, "down", pl.Int64),
+    ]
+    values = [_column_expr(columns, "epa", pl.Float64), _column_expr(columns, "wpa", pl.Float64)]
+    team = lazy.select(*keys, *values, role=pl.lit("team"), player=pl.lit(None, dtype=pl.String))
+    players = [
+        lazy.select(*keys, *values, role=pl.lit(role), player=_player_expr(columns, role))
+        .filter(pl.col("player").is_not_null())
+        for role in PLAYER_ROLES
+    ]
+    return (
+        pl.concat([team, *players])
+        .group_by(BASE_KEYS)
+        .agg(
+            plays = pl.len().cast(pl.Int64),
+            epa_plays = pl.col("epa").count().cast(pl.Int64),
+            epa = pl.col("epa").sum(),
+            successes = (pl.col("epa") > 0).sum().cast(pl.Int64),
+            wpa_plays = pl.col("wpa").count().cast(pl.Int64),
+            wpa = pl.col("wpa").sum(),
+        )
+        .sort(BASE_KEYS, nulls_last=True)
+        .collect()
+    )
+
+def _roll(facts: pl.DataFrame, keys: list) -> pl.DataFrame:
+    role = pl.col("role") != "team" if "player" in keys else pl.col("role") == "team"
+    return (
+        facts.lazy()
+        .filter(role)
+        .group_by(keys)
+        .agg(pl.col(list(MEASURES)).sum())
+        .collect()
+    )
+
+def _finish(table: pl.DataFrame, keys: list) -> pl.DataFrame:
+    return (
+        table
+        .group_by(keys)
+        .agg(pl.col(list(MEASURES)).sum())
+        # Gruppen ohne Plays (z.B. ein Team, dessen einziges Spiel ersetzt wurde) fallen weg
+        .filter(pl.col("plays") > 0)
+        .with_columns(pl.col(measure).cast(dtype) for measure, dtype in MEASURES.items())
+        .sort(keys, nulls_last=True)
+    )
+
+@profiled
+def build_rollups(plays, rollups: dict = ROLLUPS) -> dict:
+    """Materializes the base table (see play_facts) and every rollup of ROLLUPS.
+
+    Args:
+        plays (pl.DataFrame or pl.LazyFrame): Enriched plays of any number of games.
+        rollups (dict, optional): Rollup name -> grouping columns (subset of BASE_KEYS).
+
+    Returns:
+        dict: 'base' and one DataFrame per rollup with the grouping columns and the MEASURES.
+    """
+    facts = play_facts(plays)
+    tables = {"base": facts}
+    for name, keys in rollups.items():
+        tables[name] = _finish(_roll(facts, keys), keys)
+    return tables
+
+@profiled
+def update_rollups(tables: dict, plays, rollups: dict = ROLLUPS) -> dict:
+    """Updates materialized rollups with new or re-enriched games. The games in plays replace their previous
+    version completely (pass whole games, the epa of a play depends on the next one): their old rows of the
+    base table are subtracted from every rollup and the new ones added, all other games are not touched.
+    Equals build_rollups over all games up to float rounding of the sums.
+
+    Args:
+        tables (dict): Output of build_rollups, update_rollups or read_rollups.
+        plays (pl.DataFrame or pl.LazyFrame): Enriched plays of the new games.
+        rollups (dict, optional): Rollup name -> grouping columns.
+
+    Returns:
+        dict: The updated tables.
+    """
+    new = play_facts(plays)
+    games = new["game_id"].unique()
+    affected = pl.col("game_id").is_in(games)
+    old = tables["base"].filter(affected)
+    removed = old.with_columns(-pl.col(list(MEASURES)))
+
+    updated = {"base": pl.concat([tables["base"].filter(~affected), new], how="vertical_relaxed").sort(BASE_KEYS, nulls_last=True)}
+    for name, keys in rollups.items():
+        delta = pl.concat([_roll(new, keys), _roll(removed, keys)], how="vertical_relaxed")
+        updated[name] = _finish(pl.concat([tables[name], delta], how="vertical_relaxed"), keys)
+    return updated
+
+def rollup_metrics(table) -> pl.DataFrame:
+    """Adds the derived metrics to a rollup: epa_per_play, success_rate (of the plays with an epa) and wpa_per_play."""
+    return table.with_columns(
+        epa_per_play = pl.col("epa") / pl.col("epa_plays"),
+        success_rate = pl.col("successes") / pl.col("epa_plays"),
+        wpa_per_play = pl.col("wpa") / pl.col("wpa_plays"),
+    )
+
+def query_rollup(tables: dict, name: str, **filters) -> pl.DataFrame:
+    """Answers a dashboard query from a materialized rollup.
+
+    Example:
+        query_rollup(tables, "player_play_type", season="2024", play_type=["pass", "rush"])
+
+    Args:
+        tables (dict): The materialized rollups.
+        name (str): Name of the rollup.
+        **filters: Column -> value or list of values.
+
+    Returns:
+        pl.DataFrame: The matching rows with the MEASURES and the metrics of rollup_metrics.
+    """
+    table = tables[name]
+    for column, value in filters.items():
+        table = table.filter(pl.col(column).is_in(value) if isinstance(value, (list, tuple, set)) else pl.col(column) == value)
+    return rollup_metrics(table)
+
+def write_rollups(tables: dict, root: str):
+    """Writes every table as root/<name>.parquet, each file is replaced atomically."""
+    os.makedirs(root, exist_ok=True)
+    for name, table in tables.items():
+        path = os.path.join(root, f"{name}.parquet")
+        table.write_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+def read_rollups(root: str, names: list = None) -> dict:
+    """Reads the tables written by write_rollups, by default the base table and all of ROLLUPS."""
+    names = names or ["base", *ROLLUPS]
+    return {name: pl.read_parquet(os.path.join(root, f"{name}.parquet")) for name in names}
@@ -0,0 +1,345 @@
+import polars as pl
+
+from helper_pbp_store import cast_to_schema
+from pipeline_profiler import profiled
+
+# Columns every adapter delivers, the shared scoring stages derive everything else from them
+CANONICAL_SCHEMA = {
+    "source": pl.String,
+    "game_id": pl.Int64,
+    "half": pl.Int32,
+    "drive_id": pl.Int32,
+    "play_id": pl.Int32,
+    "home_team": pl.String,
+    "away_team": pl.String,
+    "posteam": pl.String,
+    "defteam": pl.String,
+    "posteam_after": pl.String,
+    "down": pl.Int32,
+    "yards_to_go": pl.Int32,
+    "yardline_50": pl.Int32,
+    "yardline_50_after": pl.Int32,
+    "yards_gained": pl.Int32,
+    "play_type": pl.String,
+    "complete_pass": pl.Int32,
+    "interception": pl.Int32,
+    "touchdown": pl.Int32,
+    "def_touchdown": pl.Int32,
+    "penalty": pl.Int32,
+    "safety": pl.Int32,
+    "one_point_conv_success": pl.Int32,
+    "two_point_conv_success": pl.Int32,
+    "defensive_two_point_conv": pl.Int32,
+}
+
+ADAPTERS = {}
+
+# build_plays: game_id = source_id * GAME_ID_BLOCK + game_id der Quelle, stabil ueber alle Aufrufe
+GAME_ID_BLOCK = 10**9
+
+def register_adapter(name: str, source_id: int, credit_defensive_scores: bool = True):
+    """Registers a function mapping the raw plays of a source onto the columns of CANONICAL_SCHEMA.
+    The function gets and returns a LazyFrame, columns it does not deliver are added as nulls.
+
+    Args:
+        name (str): Name of the source, also stored in the 'source' column.
+        source_id (int): Fixed number of the source, its games get the game_ids
+            source_id * GAME_ID_BLOCK + game_id in build_plays. Must never change once plays were stored.
+        credit_defensive_scores (bool, optional): Whether def TDs, defensive 2pt conversions and safeties are
+            credited to the defense. The Hudl exports only ever credit the offense.
+    """
+    taken = {adapter["source_id"]: other for other, adapter in ADAPTERS.items() if other != name}
+    if source_id in taken:
+        raise ValueError(f"source_id {source_id} is already used by '{taken[source_id]}'")
+
+    def decorator(func):
+        ADAPTERS[name] = {"to_canonical": func, "source_id": source_id, "credit_defensive_scores": credit_defensive_scores}
+        return func
+    return decorator
+
+# Shared stages
+
+@profiled
+def add_simple_yardage(df):
+    return df.with_columns(
+        yardline_50_simple = pl.when(pl.col("yardline_50") < 25).then(pl.lit(0)).otherwise(pl.lit(1)),
+        yards_to_go_simple =
+        pl.when(pl.col("yards_to_go") <= 5).then(pl.lit(1))
+        .when((pl.col("yards_to_go") > 5) & (pl.col("yards_to_go") <= 10)).then(pl.lit(2))
+        .when((pl.col("yards_to_go") > 10) & (pl.col("yards_to_go") <= 15)).then(pl.lit(3))
+        .when((pl.col("yards_to_go") > 15) & (pl.col("yards_to_go") <= 20)).then(pl.lit(4))
+        .when(pl.col("yards_to_go") > 20).then(pl.lit(5))
+        .otherwise(pl.lit(0))
+    )
+
+@profiled
+def add_scoring_play(df):
+    return df.with_columns(
+        pl.when(
+            pl.col('touchdown') |
+            pl.col('def_touchdown') |
+            pl.col('one_point_conv_success') |
+            pl.col('two_point_conv_success') |
+            pl.col('defensive_two_point_conv') |
+            pl.col('safety')
+            == 1).then(pl.lit(1))
+        .otherwise(pl.lit(0))
+        .alias('scoring_play')
+    )
+
+@profiled
+def add_scoring_play_team(df, credit_defensive_scores=True):
+    """Adds the team that scored on the play.
+
+    Args:
+        df (pl.DataFrame or pl.LazyFrame): Plays with the event columns and 'scoring_play'.
+        credit_defensive_scores (bool or pl.Expr, optional): Credit defensive scores to the defense, a boolean
+            expression decides it per play (e.g. per source).
+
+    Returns:
+        _type_: df with 'scoring_play_team'.
+    """
+    if not isinstance(credit_defensive_scores, pl.Expr):
+        credit_defensive_scores = pl.lit(credit_defensive_scores)
+    return df.with_columns(
+        pl.when((pl.col('scoring_play') == 1) & (pl.col("touchdown") | pl.col("one_point_conv_success") | pl.col("two_point_conv_success") == 1)).then(pl.col("posteam"))
+        .when(credit_defensive_scores & (pl.col('scoring_play') == 1) & (pl.col("def_touchdown") | pl.col("defensive_two_point_conv") | pl.col("safety") == 1)).then(pl.col("defteam"))
+        .otherwise(pl.lit(None))
+        .alias('scoring_play_team')
+    )
+
+def _team_points(team: str) -> pl.Expr:
+    return (pl.when(pl.col("play_id")==1).then(pl.lit(0))
+            .when(pl.col(team)==pl.col("scoring_play_team")).then(
+                pl.when(touchdown=1).then(pl.lit(6))
+                .when(def_touchdown=1).then(pl.lit(6))
+                .when(one_point_conv_success=1).then(pl.lit(1))
+                .when(two_point_conv_success=1).then(pl.lit(2))
+                .when(defensive_two_point_conv=1).then(pl.lit(2))
+                .when(safety=1).then(pl.lit(2))
+            .otherwise(pl.lit(None))
+            )
+    )
+
+@profiled
+def add_team_points(df, keys: list = ["game_id"]):
+    """Adds the points of every play, the running scores of both teams and the score differential of the possession team.
+
+    Args:
+        df (pl.DataFrame or pl.LazyFrame): Plays with 'scoring_play_team'.
+        keys (list, optional): Columns identifying a game, e.g. ["source", "game_id"] for mixed sources.
+
+    Returns:
+        _type_: df with the points, score and 'score_differential' columns.
+    """
+    return (df
+            .with_columns(home_team_points = _team_points("home_team"), away_team_points = _team_points("away_team"))
+            .with_columns(
+                home_team_score = pl.col('home_team_points').cum_sum().over([*keys, "home_team"]),
+                away_team_score = pl.col('away_team_points').cum_sum().over([*keys, "away_team"])
+            )
+            .with_columns(
+                home_team_score = pl.col("home_team_score").forward_fill(),
+                away_team_score = pl.col("away_team_score").forward_fill()
+            )
+            .with_columns(
+                posteam_score = pl.when(pl.col("posteam") == pl.col("home_team")).then(pl.col('home_team_score'))
+                    .when(pl.col("posteam") == pl.col("away_team")).then(pl.col('away_team_score')),
+                defteam_score = pl.when(pl.col("defteam") == pl.col("home_team")).then(pl.col('home_team_score'))
+                    .when(pl.col("defteam") == pl.col("away_team")).then(pl.col('away_team_score'))
+            )
+            .with_columns(score_differential = pl.col("posteam_score") - pl.col("defteam_score"))
+    )
+
+@profiled
+def add_first_down(df):
+    return df.with_columns(
+        pl.when((pl.col('yardline_50') < 25) & (pl.col("yards_gained") > pl.col("yards_to_go"))).then(pl.lit(1))
+        .otherwise(pl.lit(0))
+        .alias('first_down')
+    )
+
+@profiled
+def apply_scoring_stages(df, keys: list = ["game_id"], credit_defensive_scores=True):
+    """Runs all shared stages on plays with the canonical columns."""
+    df = add_simple_yardage(df)
+    df = add_scoring_play(df)
+    df = add_scoring_play_team(df, credit_defensive_scores)
+    df = add_team_points(df, keys)
+    df = add_first_down(df)
+    return df
+
+# Adapters
+
+@profiled
+def add_home_away_teams(df):
+    # Annahme: Das Team, welches den ersten Drive hat ist "home_team" (wie get_games, nur als Window)
+    return df.with_columns(
+        home_team = pl.col("posteam").unique(maintain_order=True).first().over("game_id"),
+        away_team = pl.col("posteam").unique(maintain_order=True).slice(1, 1).first().over("game_id")
+    )
+
+@profiled
+def add_defteam(df):
+    return df.with_columns(defteam =
+                pl.when(pl.col("posteam") == pl.col("home_team")).then(pl.col("away_team"))
+                .when(pl.col("posteam") == pl.col("away_team")).then(pl.col("home_team"))
+                .otherwise(pl.lit(None))
+                )
+
+# Ohne erfolgreichen Pass ist ein 4th Down ein Punt bzw. Turnover on Downs, der Raumgewinn zählt nicht
+FIELD_YARDS_GAINED = (
+    pl.when(down = 0).then(pl.lit(0))
+    .when(down=4,complete_pass=0).then(pl.lit(0))
+    # .when((pl.col("down") == 4) & (pl.col("interception") == 0) & (pl.col("sack") == 0) & (pl.col("def_touchdown") == 0) & (pl.col("penalty") == 0) & (pl.col("safety") == 0)).then(pl.lit(0))
+    .when(down = 4, safety= 1).then(pl.lit(0))
+    .otherwise(pl.col("yardline_50_after") - pl.col("yardline_50"))
+)
+
+@register_adapter("hudl", source_id=1, credit_defensive_scores=False)
+@profiled
+def hudl_to_canonical(df: pl.LazyFrame) -> pl.LazyFrame:
+    """Hudl exports (data_raw.csv), the events are parsed from the 'RESULT' column."""
+    return (add_defteam(add_home_away_teams(df))
+        .with_columns([
+        pl.col("DN").cast(pl.Int32()).alias("down"),
+        pl.col("DIST").cast(pl.Int32()).alias("yards_to_go"),
+        pl.col("YARD LN").cast(pl.Int32()).alias("yardline"),
+        pl.col(["yardline_50","game_id","play_id","drive_id","half"]).cast(pl.Int32())
+        ])
+        .with_columns(
+            yardline_50_after = pl.col("yardline_50").shift(-1),
+            posteam_after = pl.col("posteam").shift(-1)
+        )
+        .with_columns(
+            pl.when(pl.col('RESULT').str.contains("Rush")).then(pl.lit("run"))
+            .when(pl.col('RESULT').str.contains("Penalty")).then(pl.lit("no_play"))
+            .when(pl.col('RESULT').str.contains("KNEEL")).then(pl.lit("qb_kneel"))
+            .when(pl.col('down') == 0).then(pl.lit("extra_point"))
+            .otherwise(pl.lit("pass"))
+            .alias('play_type')
+        )
+        .with_columns(
+            sack = pl.when(pl.col('RESULT').str.contains("Sack")).then(pl.lit(1)).otherwise(pl.lit(0)),
+            interception = pl.when(pl.col('RESULT').str.contains("Interception")).then(pl.lit(1)).otherwise(pl.lit(0))
+        )
+        .with_columns(
+            complete_pass =
+            pl.when((pl.col("play_type").is_in(["pass","extra_point","no_play"])) & (pl.col("RESULT").str.contains("Complete"))).then(pl.lit(1))
+            .when((pl.col("play_type").is_in(["pass","extra_point","no_play"])) & (pl.col("RESULT") == "Incomplete")).then(pl.lit(0))
+            .when((pl.col("yardline_50") != pl.col("yardline_50_after")) & (pl.col("posteam") == pl.col("posteam_after"))).then(pl.lit(1))
+            .when((pl.col("down")==4) & (pl.col("posteam") != pl.col("posteam_after"))).then(pl.lit(0))
+            .otherwise(pl.lit(0))
+        )
+        .with_columns(
+            touchdown = pl.when((pl.col('RESULT').str.contains("TD")) & (pl.col('RESULT').str.contains("Def").not_())).then(pl.lit(1)).otherwise(pl.lit(0)),
+            def_touchdown = pl.when(pl.col('RESULT').str.contains("Def TD")).then(pl.lit(1)).otherwise(pl.lit(0)),
+            penalty = pl.when(pl.col('RESULT').str.contains("Penalty")).then(pl.lit(1)).otherwise(pl.lit(0)),
+            safety = pl.when(pl.col('RESULT').str.contains("Safety")).then(pl.lit(1)).otherwise(pl.lit(0)),
+            one_point_conv_success =
+            pl.when((pl.col('RESULT') == "Good") & (pl.col("down") == 0) & (pl.col("yardline_50") == 45)).then(pl.lit(1))
+            .otherwise(pl.lit(0)),
+            two_point_conv_success =
+            pl.when((pl.col('RESULT') == "Good") & (pl.col("down") == 0) & (pl.col("yardline_50") == 40)).then(pl.lit(1))
+            .otherwise(pl.lit(0)),
+            defensive_two_point_conv = pl.when((pl.col('RESULT').str.contains("Def TD")) & (pl.col("down") == 0)).then(pl.lit(1)).otherwise(pl.lit(0))
+        )
+        .with_columns(yards_gained = FIELD_YARDS_GAINED)
+    )
+
+@register_adapter("dsfootball", source_id=2)
+@profiled
+def dsfootball_to_canonical(df: pl.LazyFrame) -> pl.LazyFrame:
+    """DS-Football exports, the events come as flag columns."""
+    return (add_defteam(add_home_away_teams(df))
+                .with_columns([
+                    pl.col("play_id").cast(pl.Int32()),
+                    pl.col("complete_pass").cast(pl.Int32()),
+                    pl.col("interception").cast(pl.Int32()),
+                    pl.col("touchdown").cast(pl.Int32()),
+                    pl.col("point_after").cast(pl.Int32()),
+                    pl.col("Down").cast(pl.Int32()).alias("down"),
+                    pl.col("Distance").cast(pl.Int32()).alias("yards_to_go"),
+                    pl.col("Spot").cast(pl.Int32()).alias("yardline_50"),
+                    pl.col("Drive").cast(pl.Int32()).alias("drive_id"),
+                    pl.col("Quarter").cast(pl.Int32()).alias("half")
+                    ])
+                .with_columns(pl.col("point_after_success").str.replace("NA", "0"))
+                .with_columns(pl.col("point_after_success").cast(pl.Int32()))
+                .with_columns(
+                    yardline_50_after = pl.col("yardline_50").shift(-1),
+                    posteam_after = pl.col("posteam").shift(-1)
+                )
+                .with_columns(
+                    def_touchdown = pl.when((pl.col('interception') == 1) & (pl.col("touchdown")==1)).then(pl.lit(1)).otherwise(pl.lit(0)),
+                    safety = pl.when(pl.col('IsSafety') == True).then(pl.lit(1)).otherwise(pl.lit(0)),
+                    one_point_conv_success =
+                    pl.when((pl.col('point_after_success') == 1) & (pl.col('point_after') == 1) & (pl.col("yardline_50") == 45)).then(pl.lit(1))
+                    .otherwise(pl.lit(0)),
+                    two_point_conv_success =
+                    pl.when((pl.col('point_after_success') == 1) & (pl.col('point_after') == 1) & (pl.col("yardline_50") == 40)).then(pl.lit(1))
+                    .otherwise(pl.lit(0)),
+                    defensive_two_point_conv =
+                    pl.when((pl.col('point_after') == 1) & (pl.col("interception") == 1) & (pl.col("touchdown") == 1)).then(pl.lit(1))
+                    .otherwise(pl.lit(0))
+                )
+                .with_columns(yards_gained = FIELD_YARDS_GAINED)
+    )
+
+@register_adapter("sportappfi", source_id=3)
+@profiled
+def sportappfi_to_canonical(df: pl.LazyFrame) -> pl.LazyFrame:
+    """Raw sportapp.fi plays (process_games_pl), cleaned with the steps of transform_games before the scoring."""
+    from fetch_sportappfi_api import clean_games_lazy
+
+    return clean_games_lazy(df).with_columns(pl.col(["home_team", "away_team", "posteam", "defteam", "posteam_after"]).cast(pl.String))
+
+@profiled
+def to_canonical(name: str, df) -> pl.LazyFrame:
+    """Maps the raw plays of one source onto CANONICAL_SCHEMA, lazily.
+
+    Args:
+        name (str): A registered source, see ADAPTERS.
+        df (pl.DataFrame or pl.LazyFrame): The raw plays of the source.
+
+    Returns:
+        pl.LazyFrame: The plays in the canonical schema with 'source' set to name.
+    """
+    if name not in ADAPTERS:
+        raise KeyError(f"No adapter registered for '{name}', known sources: {sorted(ADAPTERS)}")
+    return cast_to_schema(ADAPTERS[name]["to_canonical"](df.lazy()).with_columns(source = pl.lit(name)), CANONICAL_SCHEMA)
+
+@profiled
+def build_plays(sources: dict, lazy: bool = False):
+    """Builds one play-by-play table from several sources: every source is mapped onto the canonical schema
+    by its adapter and the shared scoring stages run once over the union, all in one lazy plan.
+    The game_ids of the sources only have to be unique within a source (Hudl and DS-Football both count from 1),
+    so every game gets the game_id source_id * GAME_ID_BLOCK + its game_id (see register_adapter), the same
+    in every call, and keeps the original one as 'source_game_id'. All later steps window on game_id alone.
+
+    Args:
+        sources (dict): Source name -> raw plays (DataFrame, LazyFrame or a list of them).
+        lazy (bool, optional): Return the LazyFrame instead of collecting it.
+
+    Returns:
+        _type_: The plays with the canonical and the scoring columns, 'source_game_id' and an 'index',
+        ready for prepare_model_data.
+    """
+    frames = []
+    for name, raw in sources.items():
+        for df in raw if isinstance(raw, (list, tuple)) else [raw]:
+            frames.append(
+                to_canonical(name, df)
+                .with_columns(
+                    source_game_id = pl.col("game_id"),
+                    game_id = pl.col("game_id") + ADAPTERS[name]["source_id"] * GAME_ID_BLOCK,
+                    credit_defensive_scores = pl.lit(ADAPTERS[name]["credit_defensive_scores"]),
+                )
+            )
+    plays = pl.concat(frames, how="vertical")
+    output = (
+        apply_scoring_stages(plays, credit_defensive_scores=pl.col("credit_defensive_scores"))
+        .drop("credit_defensive_scores")
+        .with_row_index(offset=1)
+    )
+    return output if lazy else output.collect()
@@ -0,0 +1,214 @@
+import os
+import shutil
+
+import polars as pl
+import pyarrow.dataset as ds
+
+PARTITION_COLS = ["season", "competition_id", "game_id"]
+
+# Schema of the cleaned sportapp.fi play-by-play table (output of transform_games)
+PLAY_SCHEMA = {
+    "index": pl.UInt32,
+    "season": pl.String,
+    "competition_id": pl.Int64,
+    "competition_name": pl.String,
+    "competition_league": pl.String,
+    "gender": pl.Int64,
+    "game_id": pl.Int64,
+    "game_type": pl.String,
+    "game_group_id": pl.Int64,
+    "game_group": pl.String,
+    "half": pl.Int64,
+    "summary": pl.String,
+    "action_title": pl.String,
+    "down": pl.Int64,
+    "down_desc": pl.String,
+    "down_after": pl.Int64,
+    "down_after_desc": pl.String,
+    "yards_to_go": pl.Int64,
+    "yards_to_go_after": pl.Int64,
+    "possession_time": pl.String,
+    "home_team": pl.Int64,
+    "away_team": pl.Int64,
+    "home_score": pl.Int64,
+    "away_score": pl.Int64,
+    "stream_url": pl.String,
+    "passer": pl.String,
+    "receiver": pl.String,
+    "rusher": pl.String,
+    "tackle_player": pl.String,
+    "interception_player": pl.String,
+    "sack_player": pl.String,
+    "play_result": pl.String,
+    "penalty": pl.Int32,
+    "safety": pl.Int32,
+    "drive_id": pl.UInt32,
+    "play_id": pl.UInt32,
+    "half_end": pl.Int32,
+    "play_type": pl.String,
+    "complete_pass": pl.Int32,
+    "interception": pl.Int32,
+    "touchdown": pl.Int32,
+    "point_after": pl.Int32,
+    "point_after_success": pl.Int32,
+    "def_touchdown": pl.Int32,
+    "one_point_conv_success": pl.Int32,
+    "two_point_conv_success": pl.Int32,
+    "defensive_two_point_conv": pl.Int32,
+    "scoring_play": pl.Int32,
+    "posteam": pl.Int64,
+    "defteam": pl.Int64,
+    "posteam_after": pl.Int64,
+    "defteam_after": pl.Int64,
+    "yardline_50": pl.Int64,
+    "yardline_50_after": pl.Int64,
+    "yards_gained": pl.Int64,
+    "yards_to_go_simple": pl.Int32,
+    "first_down": pl.Int32,
+    "scoring_play_team": pl.Int64,
+    "home_team_points": pl.Int32,
+    "away_team_points": pl.Int32,
+    "home_team_score": pl.Int32,
+    "away_team_score": pl.Int32,
+    "posteam_score": pl.Int32,
+    "defteam_score": pl.Int32,
+    "score_differential": pl.Int32,
+}
+
+# Schema of the Hudl exports (data_raw.csv), the numeric columns are the ones make_hudl_mutations casts
+HUDL_RAW_SCHEMA = {
+    "PLAY #": pl.String,
+    "ODK": pl.String,
+    "OFF FORM": pl.String,
+    "Off Str": pl.String,
+    "OFF PLAY": pl.String,
+    "DN": pl.Int32,
+    "DIST": pl.Int32,
+    "YARD LN": pl.Int32,
+    "RESULT": pl.String,
+    "Drive Success": pl.Int32,
+    "TARGET ROUTE": pl.String,
+    "RECEIVED BY": pl.String,
+    "GN/LS": pl.Int32,
+    "Thrown By": pl.String,
+    "YAC": pl.String,
+    "QB": pl.String,
+    "C": pl.String,
+    "X/H": pl.String,
+    "Y/CAT": pl.String,
+    "Z": pl.String,
+    "Target": pl.String,
+    "Drop": pl.String,
+    "B": pl.String,
+    "yardline_50": pl.Int32,
+    "game_id": pl.Int32,
+    "play_id": pl.Int32,
+    "drive_id": pl.Int32,
+    "half": pl.Int32,
+    "posteam": pl.String,
+}
+
+def cast_to_schema(df, schema: dict):
+    """Selects the columns of schema in its order and casts them, missing columns are added as nulls.
+
+    Args:
+        df (pl.DataFrame or pl.LazyFrame): The data to cast.
+        schema (dict): Column name -> Polars dtype.
+
+    Returns:
+        _type_: The DataFrame or LazyFrame with exactly the schema.
+    """
+    columns = df.collect_schema().names() if isinstance(df, pl.LazyFrame) else df.columns
+    return df.select(
+        pl.col(name).cast(dtype) if name in columns else pl.lit(None, dtype=dtype).alias(name)
+        for name, dtype in schema.items()
+    )
+
+def delete_pbp_games(root: str, game_ids) -> int:
+    """Removes every game_id=<id> partition of the games from the dataset, whatever season and competition
+    they are stored under, and the partition directories left empty.
+
+    Args:
+        root (str): Root directory of the dataset.
+        game_ids (iterable): The games to remove.
+
+    Returns:
+        int: Number of removed game partitions.
+    """
+    names = {f"game_id={game_id}" for game_id in game_ids}
+    removed = 0
+    # Von unten nach oben, damit leer gewordene Season-/Competition-Ordner mit entfernt werden
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for dirname in dirnames:
+            path = os.path.join(dirpath, dirname)
+            if dirname in names:
+                shutil.rmtree(path)
+                removed += 1
+            elif os.path.isdir(path) and not os.listdir(path):
+                os.rmdir(path)
+    return removed
+
+def write_pbp_store(df: pl.DataFrame, root: str, schema: dict = None, partition_by=PARTITION_COLS):
+    """Writes plays into a Hive-partitioned Parquet dataset (root/season=../competition_id=../game_id=../).
+    The games contained in df are replaced completely, also if their season or competition changed,
+    all other partitions stay untouched.
+
+    Args:
+        df (pl.DataFrame): The plays to write.
+        root (str): Root directory of the dataset.
+        schema (dict, optional): Schema to cast to before writing, e.g. PLAY_SCHEMA.
+        partition_by (list, optional): Partition columns, the ones missing in df are skipped.
+    """
+    if schema is not None:
+        df = cast_to_schema(df, schema)
+    partition_cols = [col for col in partition_by if col in df.columns]
+    if "game_id" in partition_cols and os.path.isdir(root):
+        delete_pbp_games(root, df["game_id"].unique().to_list())
+    ds.write_dataset(
+        df.to_arrow(),
+        root,
+        format="parquet",
+        partitioning=partition_cols or None,
+        partitioning_flavor="hive" if partition_cols else None,
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+
+def scan_pbp_store(root: str, schema: dict = None, sort: bool = True) -> pl.LazyFrame:
+    """Scans the Parquet dataset lazily, filters like pl.col("game_id") != 37 are pushed down
+    to the partitions and row groups.
+
+    Args:
+        root (str): Root directory of the dataset.
+        schema (dict, optional): Schema the dataset was written with, fixes the partition column types and column order.
+        sort (bool, optional): Restore the game order of the plays, the files are read in path order (game_id=10 before game_id=2).
+            An 'index' column is renumbered from 1 in that order like merge_games does for the CSV and
+            Parquet stores, every batch written by write_pbp_store starts its own numbering at 1.
+
+    Returns:
+        pl.LazyFrame: The plays of the dataset.
+    """
+    hive_schema = None
+    if schema is not None:
+        hive_schema = {col: dtype for col, dtype in schema.items() if col in PARTITION_COLS}
+    lf = pl.scan_parquet(os.path.join(root, "**", "*.parquet"), hive_partitioning=True, hive_schema=hive_schema)
+    if schema is not None:
+        lf = lf.select(list(schema))
+    if sort:
+        lf = lf.sort("game_id", maintain_order=True)
+        columns = lf.collect_schema().names()
+        if "index" in columns:
+            lf = lf.drop("index").with_row_index(offset=1).select(columns)
+    return lf
+
+def csv_to_pbp_store(csv_path: str, root: str, schema: dict, separator: str = ";"):
+    """Converts one of the semicolon CSVs (e.g. data_raw.csv with HUDL_RAW_SCHEMA) into the Parquet dataset.
+
+    Args:
+        csv_path (str): Path of the CSV file.
+        root (str): Root directory of the dataset.
+        schema (dict): Schema of the CSV file.
+        separator (str, optional): Field separator of the CSV file.
+    """
+    df = pl.read_csv(csv_path, separator=separator, infer_schema_length=0)
+    write_pbp_store(cast_to_schema(df, schema), root)
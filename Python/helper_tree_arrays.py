@@ -0,0 +1,213 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Zellen (Zeilen x Baeume) je Batch der Auswertung, haelt die Indexmatrizen bei ca. 16 MB
+BATCH_CELLS = 1 << 22
+
+# Objective -> Transformation des Margins, wie XGBoost sie bei predict anwendet
+OBJECTIVES = {
+    "multi:softprob": "softmax",
+    "binary:logistic": "sigmoid",
+    "reg:logistic": "sigmoid",
+    "reg:squarederror": "identity",
+}
+
+def model_json(booster) -> dict:
+    """The model of a booster as parsed JSON (booster.save_raw('json')).
+
+    Args:
+        booster (xgb.Booster): The booster.
+
+    Returns:
+        dict: The JSON model, trees under ['learner']['gradient_booster']['model']['trees'].
+    """
+    return json.loads(booster.save_raw("json"))
+
+def tree_arrays_path(model_path: str) -> str:
+    """Default location of the tree arrays of a model, e.g. 'models/ep_model.trees.npz'."""
+    return os.path.splitext(model_path)[0] + ".trees.npz"
+
+def _load_model(model_path: str):
+    # Pickles (XGBRegressor) brauchen xgboost und scikit-learn, native Modelle nur xgboost
+    if model_path.endswith(".pkl"):
+        import pickle
+        with open(model_path, "rb") as f:
+            return pickle.load(f).get_booster()
+    from helper_model_scoring import load_booster
+    return load_booster(model_path)
+
+def flatten_trees(booster) -> dict:
+    """Flattens the trees of a booster into contiguous arrays, node i of the ensemble is described by
+    feature[i], threshold[i], left[i], right[i] (global node indices, -1 for leaves), default_left[i] and
+    value[i] (output of a leaf). A node sends x to left if x < threshold, a missing x (NaN) to left if default_left.
+    Trees that consist of a single leaf are constant and are folded into base_margin.
+
+    Args:
+        booster (xgb.Booster): A gbtree model with numerical splits.
+
+    Raises:
+        ValueError: For objectives or boosters the evaluator does not reproduce.
+
+    Returns:
+        dict: The node arrays, 'roots' and 'group' (class) per tree, 'base_margin' per class, 'objective' (str),
+        'num_class' (int) and 'features' (list), like load_tree_arrays returns them.
+    """
+    model = model_json(booster)
+    learner = model["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Objective '{objective}' is not supported, expected one of {list(OBJECTIVES)}")
+    if learner["gradient_booster"]["name"] != "gbtree":
+        raise ValueError(f"Booster '{learner['gradient_booster']['name']}' is not supported, expected gbtree")
+    trees = learner["gradient_booster"]["model"]["trees"]
+    if any(tree["categories_nodes"] for tree in trees):
+        raise ValueError("Categorical splits are not supported")
+
+    params = learner["learner_model_param"]
+    num_class = max(int(params["num_class"]), 1)
+    base_score = float(params["base_score"].strip("[]"))
+    if OBJECTIVES[objective] == "sigmoid":
+        # base_score steht im Wahrscheinlichkeitsraum, der Margin beginnt beim Logit
+        base_score = float(np.log(base_score / (1 - base_score)))
+    base_margin = np.full(num_class, base_score)
+
+    groups = learner["gradient_booster"]["model"]["tree_info"]
+    kept = []
+    for tree, group in zip(trees, groups):
+        if len(tree["left_children"]) == 1:
+            base_margin[group] += np.float32(tree["split_conditions"][0])
+        else:
+            kept.append((tree, group))
+
+    sizes = np.array([len(tree["left_children"]) for tree, _ in kept], dtype=np.int64)
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+    offset = np.repeat(roots, sizes)
+    nodes = {key: np.concatenate([tree[key] for tree, _ in kept] or [[]])
+             for key in ("left_children", "right_children", "split_indices", "split_conditions", "default_left")}
+    leaf = nodes["left_children"] == -1
+    conditions = nodes["split_conditions"].astype(np.float32)
+    return {
+        "feature": np.where(leaf, 0, nodes["split_indices"]).astype(np.int32),
+        "threshold": np.where(leaf, np.float32(0), conditions),
+        # Lokale Kinderindizes auf globale umrechnen
+        "left": np.where(leaf, -1, nodes["left_children"] + offset).astype(np.int32),
+        "right": np.where(leaf, -1, nodes["right_children"] + offset).astype(np.int32),
+        "default_left": nodes["default_left"].astype(bool),
+        "value": np.where(leaf, conditions, np.float32(0)),
+        "roots": roots,
+        "group": np.array([group for _, group in kept], dtype=np.int32),
+        "base_margin": base_margin,
+        "objective": objective,
+        "num_class": num_class,
+        "features": list(booster.feature_names),
+    }
+
+def export_tree_arrays(model_path: str = "models/ep_model.pkl", out_path: str = None) -> str:
+    """Exports a trained model (pickled XGBRegressor or native model) as tree arrays (see flatten_trees),
+    which predict_trees evaluates with NumPy only. The archive carries the sha256 of the model file.
+
+    Args:
+        model_path (str, optional): Path of the model, '.pkl', '.ubj' or '.json'.
+        out_path (str, optional): Target path. Defaults to tree_arrays_path(model_path).
+
+    Returns:
+        str: The path of the tree arrays.
+    """
+    from helper_ep_lookup import model_hash
+
+    arrays = flatten_trees(_load_model(model_path))
+    out_path = out_path or tree_arrays_path(model_path)
+    # npz speichert nur Arrays, load_tree_arrays wandelt sie zurueck
+    for key in ("objective", "num_class", "features"):
+        arrays[key] = np.array(arrays[key])
+    np.savez_compressed(out_path, **arrays, model_sha256=np.array(model_hash(model_path)))
+    return out_path
+
+def export_all_tree_arrays(models_dir: str = "models") -> list:
+    """Exports the EP and WP models (and their _simple variants) of models_dir, see export_tree_arrays."""
+    names = ["ep_model", "ep_model_simple", "wp_model", "wp_model_simple"]
+    return [export_tree_arrays(os.path.join(models_dir, name + ".pkl")) for name in names
+            if os.path.exists(os.path.join(models_dir, name + ".pkl"))]
+
+def load_tree_arrays(path: str = "models/ep_model.trees.npz", model_path: str = None) -> dict:
+    """Loads tree arrays, needs NumPy only.
+
+    Args:
+        path (str, optional): Path of the arrays (see export_tree_arrays).
+        model_path (str, optional): If given, the arrays must have been exported from exactly this model file.
+
+    Raises:
+        ValueError: If the arrays belong to another version of the model.
+
+    Returns:
+        dict: The arrays, 'objective' and 'model_sha256' as str, 'num_class' as int and 'features' as list.
+    """
+    with np.load(path, allow_pickle=False) as archive:
+        trees = {key: archive[key] for key in archive.files}
+    trees["objective"] = str(trees["objective"])
+    trees["model_sha256"] = str(trees["model_sha256"])
+    trees["num_class"] = int(trees["num_class"])
+    trees["features"] = trees["features"].tolist()
+    if model_path is not None:
+        from helper_ep_lookup import model_hash
+        if model_hash(model_path) != trees["model_sha256"]:
+            raise ValueError(f"{path} was exported from another version of {model_path}, export it again with export_tree_arrays")
+    return trees
+
+def _margin(trees: dict, X: np.ndarray) -> np.ndarray:
+    # Alle (Zeile, Baum)-Paare gehen gemeinsam eine Ebene tiefer, Paare in einem Blatt scheiden aus
+    n_rows, n_features = X.shape
+    n_trees, num_class = trees["roots"].size, trees["num_class"]
+    X = X.ravel()
+    node = np.tile(trees["roots"], n_rows)
+    row = np.repeat(np.arange(n_rows, dtype=np.int64), n_trees)
+    group = np.tile(trees["group"], n_rows)
+    keys, values = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.float32)]
+    while node.size:
+        x = X[row * n_features + trees["feature"][node]]
+        go_left = (x < trees["threshold"][node]) | (np.isnan(x) & trees["default_left"][node])
+        node = np.where(go_left, trees["left"][node], trees["right"][node])
+        leaf = trees["left"][node] == -1
+        keys.append(row[leaf] * num_class + group[leaf])
+        values.append(trees["value"][node[leaf]])
+        node, row, group = node[~leaf], row[~leaf], group[~leaf]
+    margin = np.bincount(np.concatenate(keys), np.concatenate(values).astype(np.float64), minlength=n_rows * num_class)
+    return margin.reshape(n_rows, num_class) + trees["base_margin"]
+
+def predict_trees(trees: dict, X: np.ndarray, workers: int = None, margin: bool = False) -> np.ndarray:
+    """Evaluates the tree arrays on a feature matrix like booster.inplace_predict(X, missing=np.nan): all trees
+    are walked at once, level by level, for batches of rows that are spread over a thread pool.
+
+    Args:
+        trees (dict): The tree arrays (see load_tree_arrays or flatten_trees).
+        X (np.ndarray): Features in trees['features'] order, NaN for missing values.
+        workers (int, optional): Number of threads, defaults to the number of CPUs.
+        margin (bool, optional): Return the raw margin instead of the transformed prediction.
+
+    Returns:
+        np.ndarray: float32 predictions, shape (n_rows,) or (n_rows, num_class) for multi-class models.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X[None, :]
+    batch_size = max(1, BATCH_CELLS // max(trees["roots"].size, 1))
+    batches = [X[offset:offset + batch_size] for offset in range(0, X.shape[0], batch_size)]
+    if len(batches) > 1 and (workers or os.cpu_count() or 1) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(lambda batch: _margin(trees, batch), batches))
+    else:
+        parts = [_margin(trees, batch) for batch in batches]
+    result = np.concatenate(parts) if parts else np.empty((0, trees["num_class"]))
+
+    transform = OBJECTIVES[trees["objective"]]
+    if not margin and transform == "softmax":
+        result = np.exp(result - result.max(axis=1, keepdims=True))
+        result /= result.sum(axis=1, keepdims=True)
+    elif not margin and transform == "sigmoid":
+        result = 1 / (1 + np.exp(-result))
+    if trees["num_class"] == 1:
+        result = result[:, 0]
+    return result.astype(np.float32)
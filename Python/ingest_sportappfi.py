@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+
+import polars as pl
+
+from fetch_sportappfi_api import BASE_URL, build_game_frame, fetch_games, iter_drive_plays, transform_games
+from helper_pbp_store import PLAY_SCHEMA, delete_pbp_games, write_pbp_store
+
+def payload_hash(drives_data, match_data) -> str:
+    """
+    Hashes the raw payloads of a game independent of key order and whitespace.
+
+    Returns:
+    str: sha256 hex digest.
+    """
+    canonical = json.dumps([drives_data, match_data], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def load_manifest(manifest_path: str) -> dict:
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict, manifest_path: str) -> None:
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def is_dataset_store(store_path: str) -> bool:
+    # Alles ohne .csv/.parquet-Endung ist ein partitioniertes Parquet-Dataset (helper_pbp_store)
+    return not store_path.endswith((".csv", ".parquet"))
+
+def read_store(store_path: str) -> pl.DataFrame:
+    if store_path.endswith(".parquet"):
+        return pl.read_parquet(store_path)
+    return pl.read_csv(store_path, infer_schema_length=None)
+
+def write_store(df: pl.DataFrame, store_path: str) -> None:
+    if store_path.endswith(".parquet"):
+        df.write_parquet(store_path)
+    else:
+        df.write_csv(store_path)
+
+def merge_games(store: pl.DataFrame, games: pl.DataFrame, game_ids=None) -> pl.DataFrame:
+    """
+    Replaces all plays of the changed games inside 'store' and renumbers the 'index' column,
+    so the result equals a full rebuild over the union of both.
+
+    Parameters:
+    store (pl.DataFrame): The existing play-by-play data.
+    games (pl.DataFrame): The freshly transformed plays of new or changed games.
+    game_ids (iterable): All changed games, including the ones that have no plays anymore and are
+        therefore missing in 'games'. Defaults to the game_ids of 'games'.
+
+    Returns:
+    pl.DataFrame: The merged play-by-play data sorted by game_id.
+    """
+    game_ids = games["game_id"].unique() if game_ids is None else pl.Series(list(game_ids), dtype=store.schema["game_id"])
+    merged = (
+        pl.concat(
+            [store.filter(pl.col("game_id").is_in(game_ids).not_()), games],
+            how="diagonal_relaxed"
+        )
+        .sort("game_id", maintain_order=True)
+        .drop("index")
+        .with_row_index(offset=1)
+    )
+    return merged
+
+def ingest_games_incremental(game_ids, api_key, store_path="games_plays.csv", manifest_path="games_manifest.json",
+                             max_workers=1, requests_per_second=None, base_url=BASE_URL, cache=None, force=False):
+    """
+    Fetches the games, transforms only those whose payload hash differs from the manifest and merges
+    them into the play-by-play store. Games passed to the ResponseCache as final_games cost no network
+    round-trip once cached.
+
+    Parameters:
+    game_ids (iterable): The game ids to check.
+    api_key (str): The sportapp.fi API key.
+    store_path (str): The play-by-play store, '.parquet', CSV or the directory of a partitioned Parquet dataset.
+    manifest_path (str): JSON file mapping processed game_ids to their payload hash.
+    max_workers (int): Number of games fetched in parallel.
+    requests_per_second (float): Optional upper bound for requests per second and host.
+    base_url (str): Base URL of the public API.
+    cache (ResponseCache): Optional on-disk cache for the raw payloads.
+    force (bool): Rebuild all fetched games regardless of the manifest.
+
+    Returns:
+    list: The game_ids that were (re)built, including changed games without plays, which are removed from the store.
+    """
+    manifest = load_manifest(manifest_path)
+
+    changed_ids = []
+    hashes = {}
+    frames = []
+    for game_id, payloads in fetch_games(game_ids, api_key, max_workers, requests_per_second, base_url, cache):
+        if payloads is None:
+            continue
+        game_hash = payload_hash(*payloads)
+        if not force and manifest.get(str(game_id)) == game_hash:
+            continue
+        drives_data, match_data = payloads
+        game_frame = build_game_frame(game_id, iter_drive_plays(drives_data), match_data)
+        hashes[str(game_id)] = game_hash
+        # Auch Spiele ohne Plays zählen als geändert, ihre alten Plays müssen aus dem Store
+        changed_ids.append(game_id)
+        if game_frame is not None:
+            frames.append(game_frame)
+
+    games = transform_games(pl.concat(frames, how="vertical_relaxed", rechunk=True)) if frames else None
+    if is_dataset_store(store_path):
+        # Nur die Partitionen der geänderten Spiele werden ersetzt, Spiele ohne Plays fallen ganz heraus
+        if changed_ids and os.path.isdir(store_path):
+            delete_pbp_games(store_path, changed_ids)
+        if games is not None:
+            write_pbp_store(games, store_path, PLAY_SCHEMA)
+    elif changed_ids:
+        if os.path.exists(store_path):
+            store = read_store(store_path)
+            games = merge_games(store, store.clear() if games is None else games, changed_ids)
+        if games is not None:
+            write_store(games, store_path)
+
+    # Manifest erst nach dem Store schreiben, damit ein Abbruch keine Spiele als verarbeitet markiert
+    if hashes:
+        manifest.update(hashes)
+        save_manifest(manifest, manifest_path)
+
+    return changed_ids
@@ -0,0 +1,104 @@
+import codecs
+import json
+
+class JSONStreamReader:
+    """
+    Incremental JSON reader over an iterable of byte chunks (e.g. response.iter_content()), a small
+    stdlib replacement for ijson. The caller walks the containers it is interested in with items() and
+    keys() and decodes everything else as complete values with value(); only the unread rest of the
+    current chunk and the value being decoded are held in memory.
+
+    Parameters:
+    chunks (iterable): bytes (UTF-8) or str chunks of one JSON document.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._text.decode(b"", final=True)
+        else:
+            text = chunk if isinstance(chunk, str) else self._text.decode(chunk)
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return chunk is not None or bool(text)
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of the JSON document")
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found}' in the JSON document")
+        self._pos += 1
+
+    def value(self):
+        """Decodes the next complete value (object, array, string, number or literal)."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Eine Zahl am Ende des Puffers kann noch weitergehen
+            if end == len(self._buf) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def items(self):
+        """Walks an array: yields once per element, the caller has to consume the element before the next step.
+        A null is walked like an empty array."""
+        if self._peek() == "n":
+            self.value()
+            return
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield
+            separator = self._peek()
+            self._pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' but found '{separator}' in the JSON document")
+
+    def keys(self):
+        """Walks an object: yields every key, the caller has to consume its value before the next step.
+        A null is walked like an empty object."""
+        if self._peek() == "n":
+            self.value()
+            return
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            separator = self._peek()
+            self._pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or '}}' but found '{separator}' in the JSON document")
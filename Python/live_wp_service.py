@@ -0,0 +1,311 @@
+import argparse
+import json
+import math
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from helper_ep_lookup import load_ep_lookup, lookup_ep
+from helper_model_scoring import load_booster
+
+HALF_SECONDS = 1200
+GAME_SECONDS = 2400
+# Median number of plays per half in data_raw.csv, prepare_wp_data derives the play clock from the real count
+DEFAULT_PLAYS_PER_HALF = 40
+
+class LiveGame:
+    """Running state of one game, fed one play at a time.
+
+    The WP features are derived like prepare_wp_data, with one difference: the batch pipeline spreads the
+    1200 seconds of a half over the number of plays the half finally had, live that number is unknown and
+    plays_per_half is used instead (or the plays so far, once the half runs longer).
+
+    Args:
+        game_id: The id of the game.
+        home_team: The home team, compared with the 'posteam' of the plays.
+        away_team: The away team.
+        plays_per_half (int, optional): Expected number of plays per half.
+    """
+    def __init__(self, game_id, home_team, away_team, plays_per_half: int = DEFAULT_PLAYS_PER_HALF):
+        self.game_id = game_id
+        self.home_team = home_team
+        self.away_team = away_team
+        self.plays_per_half = plays_per_half
+        self.lock = threading.Lock()
+        self.half = None
+        self.play_count = 0
+        self.play_id_half = 0
+        self.home_score = 0
+        self.away_score = 0
+        self.last = None
+        self.total_home_wpa = 0.0
+        self.total_away_wpa = 0.0
+        self.final = False
+
+    def wp_features(self, play: dict) -> dict:
+        """Advances the play count and clock and returns the WP features of the play (see prepare_wp_data).
+
+        Args:
+            play (dict): The play event, 'posteam', 'half', 'down', 'yards_to_go', 'yardline_50' and the
+                scoreboard 'home_score'/'away_score' after the play; 'play_id' defaults to the play count.
+
+        Returns:
+            dict: The features of the play.
+        """
+        half = play.get("half", self.half or 1)
+        self.play_count += 1
+        self.play_id_half = self.play_id_half + 1 if half == self.half else 1
+        self.half = half
+        self.home_score = play.get("home_score", self.home_score)
+        self.away_score = play.get("away_score", self.away_score)
+
+        # Erster Play der Halbzeit hat keine Spielzeit, danach 1200 / Plays der Halbzeit
+        plays = max(self.plays_per_half, self.play_id_half)
+        half_seconds_remaining = HALF_SECONDS - (self.play_id_half - 1) * HALF_SECONDS / plays
+        # Wie prepare_wp_data: in Halbzeit 1 bleibt die zweite Halbzeit komplett uebrig
+        game_seconds_remaining = half_seconds_remaining if half == 2 else HALF_SECONDS + half_seconds_remaining
+
+        posteam = play["posteam"]
+        if posteam == self.home_team:
+            score_differential = self.home_score - self.away_score
+        else:
+            score_differential = self.away_score - self.home_score
+        elapsed_share = (GAME_SECONDS - game_seconds_remaining) / GAME_SECONDS
+        # start_posteam ist in prepare_wp_data nur auf play_id 1 gesetzt
+        play_id = play.get("play_id", self.play_count)
+
+        return {
+            "receive_2h_ko": 0 if play_id == 1 else 1,
+            "half_seconds_remaining": half_seconds_remaining,
+            "game_seconds_remaining": game_seconds_remaining,
+            "Diff_Time_Ratio": score_differential / math.exp(-4 * elapsed_share),
+            "score_differential": score_differential,
+            "down": play.get("down"),
+            "yards_to_go": play.get("yards_to_go"),
+            "yardline_50": play.get("yardline_50"),
+        }
+
+def _feature_row(features: list, values: dict) -> np.ndarray:
+    row = np.empty((1, len(features)), dtype=np.float32)
+    for i, feature in enumerate(features):
+        if feature.startswith("down") and feature[4:].isdigit():
+            value = None if values.get("down") is None else float(values["down"] == int(feature[4:]))
+        else:
+            value = values.get(feature)
+        row[0, i] = np.nan if value is None else value
+    return row
+
+def _final_home_wp(home_score, away_score) -> float:
+    return 1.0 if home_score > away_score else 0.0 if home_score < away_score else 0.5
+
+class LiveWPService:
+    """Keeps the LiveGame states and scores every new play with the WP model and the EP lookup table.
+    The wpa of a play is known once the next play arrives, like the home_wp_after - home_wp difference
+    of add_wp_variables. A play with 'game_end' set takes the final result as its home_wp like the
+    game_end row of add_wp_variables; end_game instead closes the last play against the final result.
+
+    Args:
+        wp_model (str, optional): Path of the native WP model.
+        ep_table (str, optional): Path of the EP lookup table (see build_ep_lookup).
+        plays_per_half (int, optional): Expected number of plays per half for new games.
+    """
+    def __init__(self, wp_model: str = "models/wp_model.ubj", ep_table: str = "models/ep_model.lookup.npz",
+                 plays_per_half: int = DEFAULT_PLAYS_PER_HALF):
+        self.booster = load_booster(wp_model)
+        self.ep_table = load_ep_lookup(ep_table)
+        self.plays_per_half = plays_per_half
+        self.games = {}
+        self.lock = threading.Lock()
+
+    def game(self, game_id, home_team=None, away_team=None) -> LiveGame:
+        """Returns the state of a game, new games need home_team and away_team."""
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is None:
+                if home_team is None or away_team is None:
+                    raise KeyError(f"Unknown game {game_id}, the first play needs 'home_team' and 'away_team'")
+                game = self.games[game_id] = LiveGame(game_id, home_team, away_team, self.plays_per_half)
+            return game
+
+    def remove(self, game_id) -> bool:
+        with self.lock:
+            return self.games.pop(game_id, None) is not None
+
+    def _close_last(self, game: LiveGame, home_wp: float):
+        # wpa des vorherigen Plays aus Sicht seines posteam, wie in add_wp_variables
+        if game.last is None:
+            return None
+        home_wpa = home_wp - game.last["home_wp"]
+        game.total_home_wpa += home_wpa
+        game.total_away_wpa -= home_wpa
+        wpa = home_wpa if game.last["posteam"] == game.home_team else -home_wpa
+        return {"play_id": game.last["play_id"], "wpa": wpa}
+
+    def play(self, game_id, play: dict) -> dict:
+        """Adds a play to the game and returns the win probability and expected points of the new state.
+
+        Args:
+            game_id: The id of the game.
+            play (dict): The play event, see LiveGame.wp_features, optionally with 'game_end'.
+
+        Returns:
+            dict: 'wp' and 'ep' of the possession team, 'home_wp', the features, the 'wpa' of the previous
+                play and the cumulative home/away wpa.
+        """
+        if play.get("posteam") is None:
+            raise ValueError("The play needs a 'posteam'")
+        game = self.game(game_id, play.get("home_team"), play.get("away_team"))
+        with game.lock:
+            if game.final:
+                raise ValueError(f"Game {game_id} is already finished")
+            features = game.wp_features(play)
+            wp = float(self.booster.inplace_predict(_feature_row(self.booster.feature_names, features))[0])
+            state = [features.get(feature) for feature in ("down", *self.ep_table["features"])]
+            _, ep = lookup_ep(self.ep_table, *(np.nan if value is None else value for value in state))
+            ep = None if np.isnan(ep) else float(ep)
+
+            home_wp = wp if play["posteam"] == game.home_team else 1 - wp
+            if play.get("game_end"):
+                # Letzter Play des Spiels traegt das Endergebnis (final_value in add_wp_variables)
+                home_wp = _final_home_wp(game.home_score, game.away_score)
+                game.final = True
+            previous = self._close_last(game, home_wp)
+            game.last = {"play_id": play.get("play_id", game.play_count), "posteam": play["posteam"], "home_wp": home_wp}
+            return {
+                "game_id": game_id,
+                "play_id": game.last["play_id"],
+                "posteam": play["posteam"],
+                "wp": wp,
+                "home_wp": home_wp,
+                "away_wp": 1 - home_wp,
+                "ep": ep,
+                "features": features,
+                "previous": previous,
+                "total_home_wpa": game.total_home_wpa,
+                "total_away_wpa": game.total_away_wpa,
+            }
+
+    def end_game(self, game_id, home_score=None, away_score=None) -> dict:
+        """Finishes the game, the home win probability becomes 1, 0 or 0.5 (final_value of add_wp_variables).
+
+        Returns:
+            dict: 'home_wp', the 'wpa' of the last play and the cumulative home/away wpa.
+        """
+        game = self.game(game_id)
+        with game.lock:
+            if game.final:
+                raise ValueError(f"Game {game_id} is already finished")
+            home_score = game.home_score if home_score is None else home_score
+            away_score = game.away_score if away_score is None else away_score
+            home_wp = _final_home_wp(home_score, away_score)
+            previous = self._close_last(game, home_wp)
+            game.final = True
+            return {
+                "game_id": game_id,
+                "home_wp": home_wp,
+                "away_wp": 1 - home_wp,
+                "previous": previous,
+                "total_home_wpa": game.total_home_wpa,
+                "total_away_wpa": game.total_away_wpa,
+            }
+
+    def state(self, game_id) -> dict:
+        game = self.game(game_id)
+        with game.lock:
+            return {
+                "game_id": game_id,
+                "home_team": game.home_team,
+                "away_team": game.away_team,
+                "half": game.half,
+                "plays": game.play_count,
+                "home_score": game.home_score,
+                "away_score": game.away_score,
+                "home_wp": None if game.last is None else game.last["home_wp"],
+                "total_home_wpa": game.total_home_wpa,
+                "total_away_wpa": game.total_away_wpa,
+                "final": game.final,
+            }
+
+ROUTE = re.compile(r"^/games/([^/]+)(?:/(plays|end))?/?$")
+
+def _game_id(value: str):
+    return int(value) if value.isdigit() else value
+
+def make_handler(service: LiveWPService):
+    """Builds the request handler of the HTTP interface:
+
+    POST   /games/<id>/plays  play event as JSON body -> wp/ep of the new state
+    POST   /games/<id>/end    optional final scores   -> final home_wp and the last wpa
+    GET    /games/<id>        current state
+    DELETE /games/<id>        forget the game
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self):
+            match = ROUTE.match(self.path)
+            if match is None:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return None
+            return _game_id(match.group(1)), match.group(2)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length)) if length else {}
+
+        def _handle(self, action):
+            route = self._route()
+            if route is None:
+                return
+            try:
+                self._send(200, action(*route))
+            except KeyError as e:
+                self._send(404, {"error": str(e.args[0])})
+            except (ValueError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+
+        def do_POST(self):
+            def action(game_id, resource):
+                body = self._body()
+                if resource == "plays":
+                    return service.play(game_id, body)
+                if resource == "end":
+                    return service.end_game(game_id, body.get("home_score"), body.get("away_score"))
+                raise ValueError("POST needs /plays or /end")
+            self._handle(action)
+
+        def do_GET(self):
+            self._handle(lambda game_id, resource: service.state(game_id))
+
+        def do_DELETE(self):
+            self._handle(lambda game_id, resource: {"game_id": game_id, "removed": service.remove(game_id)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(service: LiveWPService, host: str = "127.0.0.1", port: int = 8050) -> ThreadingHTTPServer:
+    """Creates the HTTP server, run it with serve_forever()."""
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live win probability and expected points service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--wp-model", default="models/wp_model.ubj")
+    parser.add_argument("--ep-table", default="models/ep_model.lookup.npz")
+    parser.add_argument("--plays-per-half", type=int, default=DEFAULT_PLAYS_PER_HALF)
+    args = parser.parse_args()
+
+    server = serve(LiveWPService(args.wp_model, args.ep_table, args.plays_per_half), args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}")
+    server.serve_forever()
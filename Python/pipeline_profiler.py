@@ -0,0 +1,139 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import polars as pl
+
+# Aktiver Profiler, None = Instrumentierung aus (nur ein Attributzugriff pro Aufruf)
+_active = None
+_local = threading.local()
+
+def _frame_info(value) -> dict:
+    if isinstance(value, pl.DataFrame):
+        return {"rows": value.height, "bytes": value.estimated_size()}
+    if isinstance(value, pl.LazyFrame):
+        return {"rows": None, "bytes": None, "lazy": True}
+    if isinstance(value, np.ndarray):
+        return {"rows": value.shape[0] if value.ndim else None, "bytes": value.nbytes}
+    if hasattr(value, "memory_usage") and hasattr(value, "shape"):
+        # pandas DataFrame
+        return {"rows": value.shape[0], "bytes": int(value.memory_usage(deep=False).sum())}
+    return None
+
+class Profiler:
+    """Collects one record per call of an instrumented function: wall time, rows and estimated memory of
+    the first frame argument and of the result and, for LazyFrame results, the optimized query plan.
+    Lazy functions only build plans, their time is the planning time, the work shows up in the
+    function that collects.
+
+    Args:
+        capture_plans (bool, optional): Store the optimized plan of LazyFrame results (costs one optimization per call).
+    """
+    def __init__(self, capture_plans: bool = True):
+        self.capture_plans = capture_plans
+        self.records = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def record(self, func, args, start, end, result, depth):
+        entry = {
+            "name": func.__qualname__,
+            "module": func.__module__,
+            "start": start - self.origin,
+            "seconds": end - start,
+            "depth": depth,
+            "thread": threading.get_ident(),
+            "input": next((info for info in map(_frame_info, args) if info is not None), None),
+            "output": _frame_info(result),
+        }
+        if self.capture_plans and isinstance(result, pl.LazyFrame):
+            entry["plan"] = result.explain(optimized=True)
+        with self.lock:
+            self.records.append(entry)
+
+    def summary(self) -> pl.DataFrame:
+        """Calls, total, mean and max wall time and the processed rows per function, slowest first."""
+        if not self.records:
+            return pl.DataFrame()
+        return (
+            pl.DataFrame([{k: r[k] for k in ("name", "module", "seconds")} | {"rows": (r["output"] or {}).get("rows")}
+                          for r in self.records])
+            .group_by("module", "name")
+            .agg(calls = pl.len(), total_seconds = pl.col("seconds").sum(), mean_seconds = pl.col("seconds").mean(),
+                 max_seconds = pl.col("seconds").max(),
+                 # Lazy Ergebnisse haben keine Zeilenzahl
+                 rows = pl.when(pl.col("rows").is_not_null().any()).then(pl.col("rows").sum()))
+            .sort("total_seconds", descending=True)
+        )
+
+    def to_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.records, f, indent=1)
+
+    def to_chrome_trace(self, path: str):
+        """Writes the calls as complete events of the Chrome trace format (chrome://tracing, Perfetto)."""
+        events = []
+        for r in self.records:
+            args = {"input": r["input"], "output": r["output"]}
+            if "plan" in r:
+                args["plan"] = r["plan"]
+            events.append({"name": r["name"], "cat": r["module"], "ph": "X", "ts": r["start"] * 1e6, "dur": r["seconds"] * 1e6,
+                           "pid": os.getpid(), "tid": r["thread"], "args": args})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+def profiled(func):
+    """Instruments a pipeline function, without an active Profiler the call goes straight through."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _active
+        if profiler is None:
+            return func(*args, **kwargs)
+        depth = getattr(_local, "depth", 0)
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _local.depth = depth
+        profiler.record(func, args, start, time.perf_counter(), result, depth)
+        return result
+    return wrapper
+
+@contextlib.contextmanager
+def profile(capture_plans: bool = True):
+    """Enables the instrumentation for the block.
+
+    Example:
+        with profile() as profiler:
+            transform_games(raw)
+        profiler.to_chrome_trace("trace.json")
+    """
+    global _active
+    previous, _active = _active, Profiler(capture_plans)
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+def _profile_from_env():
+    # PBP_PROFILE=<Pfad> profiliert den ganzen Prozess, '.json' als Records, sonst als Chrome Trace
+    global _active
+    path = os.environ.get("PBP_PROFILE")
+    if not path:
+        return
+    _active = Profiler(capture_plans=os.environ.get("PBP_PROFILE_PLANS", "1") != "0")
+    profiler = _active
+    def dump():
+        if path.endswith(".trace.json") or not path.endswith(".json"):
+            profiler.to_chrome_trace(path)
+        else:
+            profiler.to_json(path)
+    atexit.register(dump)
+
+_profile_from_env()
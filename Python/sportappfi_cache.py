@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_TTL = {
+    "match-drives": 300,
+    "match-v1": 300,
+    "teams-players": 24 * 3600,
+}
+
+# Endpunkte, deren Payloads zu einem Spiel gehoeren (key = game_id)
+GAME_ENDPOINTS = ("match-v1", "match-drives")
+
+# Version 1 hat Spiele schon mit einem Zwischenstand in 'result' als final markiert,
+# solche Eintraege werden wie nicht finale behandelt und wieder validiert
+INDEX_VERSION = 2
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for raw sportapp.fi API payloads.
+
+    Every payload is stored once under objects/<sha256>.json. The index entry of an
+    (endpoint, id) pair in index/<endpoint>/<id>.json points to that digest and keeps the
+    fetch time, the validators (ETag/Last-Modified) and whether the payload is final.
+    Final payloads never expire, all others are re-fetched conditionally once they are older
+    than the TTL of their endpoint. The match-v1 payload has no field telling a finished game from
+    one in progress (both carry a 'result'), so the caller names the finished games: their match-v1
+    and match-drives payloads become final with the next fetch. Entries of older index versions
+    are never final.
+
+    Parameters:
+    root (str): Directory of the cache.
+    ttl (dict): TTL in seconds per endpoint, overrides DEFAULT_TTL.
+    final_games (iterable): Ids of games known to be finished, e.g. those of past seasons.
+    """
+    def __init__(self, root: str = "cache/sportappfi", ttl: dict = None, final_games=None):
+        self.root = root
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.final_games = set()
+        self.mark_final(final_games or ())
+
+    def mark_final(self, game_ids) -> None:
+        """Marks games as finished, their payloads are stored as final from the next fetch on."""
+        self.final_games.update(str(game_id) for game_id in game_ids)
+
+    def is_final_game(self, endpoint, key) -> bool:
+        return endpoint in GAME_ENDPOINTS and str(key) in self.final_games
+
+    @staticmethod
+    def is_final(entry) -> bool:
+        return bool(entry["final"]) and entry.get("version", 1) >= INDEX_VERSION
+
+    def _index_path(self, endpoint, key):
+        return os.path.join(self.root, "index", endpoint, f"{key}.json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.json")
+
+    def _write(self, path, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def entry(self, endpoint, key):
+        """Returns the index entry of (endpoint, key) or None."""
+        try:
+            with open(self._index_path(endpoint, key), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def is_fresh(self, entry) -> bool:
+        if entry is None:
+            return False
+        if self.is_final(entry):
+            return True
+        return time.time() - entry["fetched_at"] < self.ttl.get(entry["endpoint"], 0)
+
+    def _read_object(self, entry) -> bytes:
+        with open(self._object_path(entry["digest"]), "rb") as f:
+            return f.read()
+
+    def load(self, entry):
+        return json.loads(self._read_object(entry))
+
+    def store(self, endpoint, key, content: bytes, final=False, headers=None) -> dict:
+        """
+        Stores a raw payload and points the index entry of (endpoint, key) to it.
+
+        Returns:
+        dict: The new index entry.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            self._write(object_path, content)
+        headers = headers or {}
+        entry = {
+            "endpoint": endpoint,
+            "key": str(key),
+            "digest": digest,
+            "fetched_at": time.time(),
+            "final": bool(final),
+            "version": INDEX_VERSION,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        self._write(self._index_path(endpoint, key), json.dumps(entry).encode())
+        return entry
+
+    def fetch_json(self, endpoint, key, url, get, final=False):
+        """
+        Returns the payload of (endpoint, key) from the cache or fetches it with get(url, headers).
+        Stale entries are re-validated with If-None-Match/If-Modified-Since, a 304 keeps the cached payload.
+
+        Parameters:
+        endpoint (str): API endpoint, e.g. 'match-drives'.
+        key: The id of the game or team.
+        url (str): The full request URL.
+        get (callable): get(url, headers) returning a requests.Response.
+        final (bool or callable): Whether the payload never changes again, or a function of the parsed payload deciding that.
+            Payloads of the games in final_games are final either way.
+
+        Returns:
+        tuple: (status_code, payload); payload is None if the request failed.
+        """
+        entry = self.entry(endpoint, key)
+        if self.is_fresh(entry):
+            return 200, self.load(entry)
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = get(url, headers)
+        if response.status_code == 304 and entry is not None:
+            content = self._read_object(entry)
+            payload = json.loads(content)
+        elif response.status_code == 200:
+            content = response.content
+            payload = response.json()
+        else:
+            return response.status_code, None
+
+        is_final = self.is_final_game(endpoint, key) or (final(payload) if callable(final) else final)
+        self.store(endpoint, key, content, is_final, response.headers)
+        return 200, payload
+
+    def evict(self, max_age: float = None) -> int:
+        """
+        Removes non-final index entries older than max_age seconds (default: their TTL), including
+        the ones older index versions marked final, and every stored payload no index entry points to anymore.
+
+        Returns:
+        int: Number of removed files.
+        """
+        removed = 0
+        referenced = set()
+        now = time.time()
+        index_root = os.path.join(self.root, "index")
+        for dirpath, _, filenames in os.walk(index_root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    with open(path, "r") as f:
+                        entry = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    os.remove(path)
+                    removed += 1
+                    continue
+                limit = self.ttl.get(entry["endpoint"], 0) if max_age is None else max_age
+                if not self.is_final(entry) and now - entry["fetched_at"] >= limit:
+                    os.remove(path)
+                    removed += 1
+                else:
+                    referenced.add(entry["digest"])
+
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "objects")):
+            for filename in filenames:
+                if filename[:-len(".json")] not in referenced:
+                    os.remove(os.path.join(dirpath, filename))
+                    removed += 1
+        return removed
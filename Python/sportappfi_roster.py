@@ -0,0 +1,113 @@
+import functools
+
+import polars as pl
+
+from pipeline_profiler import profiled
+
+# Spielerspalten von extract_players_from_summary_pl -> Team, dem die Rückennummer gehört
+PLAYER_ROLES = {
+    "passer": "posteam",
+    "receiver": "posteam",
+    "rusher": "posteam",
+    "tackle_player": "defteam",
+    "interception_player": "defteam",
+    "sack_player": "defteam",
+}
+
+ROSTER_KEY = ["team_id", "player_jersey", "season"]
+
+def player_column(role: str, field: str = "id") -> str:
+    """Name of a resolved column of a role, e.g. 'passer' -> 'passer_player_id', 'tackle_player' -> 'tackle_player_id'."""
+    return f"{role.removesuffix('_player')}_player_{field}"
+
+def roster_dimension(roster: pl.DataFrame, season=None) -> pl.DataFrame:
+    """
+    Builds the roster dimension from the output of fetch_team_players (or a roster with a 'season' column):
+    one row per (team_id, player_jersey, season). Jerseys worn by more than one player of a team and season
+    are ambiguous and dropped, plays with such a jersey stay unresolved instead of being matched to a guess.
+
+    Parameters:
+    roster (pl.DataFrame): The players with 'team_id', 'player_id', 'player_name' and 'player_jersey'.
+    season (str, optional): The season the roster belongs to, required if the roster has no 'season' column.
+
+    Returns:
+    pl.DataFrame: The columns team_id, player_jersey, season, player_id and player_name, sorted by the key.
+    """
+    if "season" not in roster.columns:
+        if season is None:
+            raise ValueError("The roster has no 'season' column, pass the season it was fetched for")
+        roster = roster.with_columns(season = pl.lit(season))
+    return (
+        roster.lazy()
+        .select(
+            pl.col("team_id").cast(pl.Int64),
+            pl.col("player_jersey").cast(pl.Int64, strict=False),
+            pl.col("season").cast(pl.String),
+            pl.col("player_id").cast(pl.Int64),
+            pl.col("player_name").cast(pl.String),
+        )
+        .drop_nulls(ROSTER_KEY)
+        .unique(subset=ROSTER_KEY + ["player_id"])
+        .filter(pl.len().over(ROSTER_KEY) == 1)
+        .sort(ROSTER_KEY)
+        .collect()
+    )
+
+@functools.lru_cache(maxsize=None)
+def load_roster(path: str = "team_roster.csv", season=None) -> pl.DataFrame:
+    """
+    Reads a roster CSV (e.g. fetch_team_players(...).write_csv('team_roster.csv')) once per path and season
+    and returns its roster dimension, see roster_dimension.
+
+    Parameters:
+    path (str, optional): Path of the roster CSV.
+    season (str, optional): The season of the roster if the CSV has no 'season' column.
+
+    Returns:
+    pl.DataFrame: The roster dimension.
+    """
+    return roster_dimension(pl.read_csv(path), season)
+
+@profiled
+def resolve_players(df, roster: pl.DataFrame, roles: dict = PLAYER_ROLES, names: bool = False):
+    """
+    Replaces the extracted jersey numbers of all player roles by player ids with a single join against the roster
+    dimension: the jerseys of all roles are stacked into one long frame keyed by (team_id, jersey, season),
+    joined once and spread back per play. Offense roles are looked up in the roster of 'posteam', defense
+    roles in the roster of 'defteam' (see PLAYER_ROLES).
+
+    Parameters:
+    df (pl.DataFrame or pl.LazyFrame): Plays with 'season', the team columns of the roles and the jersey
+        columns (e.g. the output of transform_games).
+    roster (pl.DataFrame): The roster dimension (see load_roster or roster_dimension).
+    roles (dict, optional): Jersey column -> column of the team the player belongs to.
+    names (bool, optional): Also add the player names as '<role>_player_name'.
+
+    Returns:
+    pl.DataFrame or pl.LazyFrame: df with one '<role>_player_id' column per role (see player_column),
+    null where the play has no jersey or the roster has no unambiguous player for it.
+    """
+    lazy = df.lazy().with_row_index("_row")
+    jerseys = pl.concat([
+        lazy.select(
+            "_row",
+            pl.col(team).cast(pl.Int64).alias("team_id"),
+            pl.col(role).cast(pl.Int64, strict=False).alias("player_jersey"),
+            pl.col("season").cast(pl.String),
+            pl.lit(role).alias("_role"),
+        )
+        for role, team in roles.items()
+    ]).drop_nulls(ROSTER_KEY)
+
+    fields = ["id", "name"] if names else ["id"]
+    players = (
+        jerseys.join(roster.lazy().select(*ROSTER_KEY, *(f"player_{field}" for field in fields)), on=ROSTER_KEY, how="inner")
+        .group_by("_row")
+        .agg(
+            pl.col(f"player_{field}").filter(pl.col("_role") == role).first().alias(player_column(role, field))
+            for role in roles for field in fields
+        )
+    )
+    # Der Left Join behaelt die Reihenfolge der Plays
+    result = lazy.join(players, on="_row", how="left").drop("_row")
+    return result if isinstance(df, pl.LazyFrame) else result.collect()
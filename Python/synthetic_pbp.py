@@ -0,0 +1,115 @@
+import random
+
+import polars as pl
+
+from fetch_sportappfi_api import build_game_frame, iter_drive_plays
+
+# Spielzüge je Spiel wie im Schnitt von data_raw.csv (3701 Plays in 47 Spielen)
+PLAYS_PER_GAME = 79
+
+PLAYERS = {"qb": "#12 John Doe", "wr": "#7 Max Muster", "rb": "#4 Run Ner", "db": "#22 Tim Tack", "lb": "#9 Bob Bobs",
+           "cb": "#33 Ivan Inter", "rush": "#55 Sam Sack"}
+
+def synthetic_hudl(scale: int, data_path: str = "data_raw.csv") -> pl.DataFrame:
+    """Hudl-style raw rows at scale times the size of data_raw.csv: the games of the export are repeated
+    with new game_ids, so every copy keeps the real play sequences.
+
+    Args:
+        scale (int): Number of copies, e.g. 10, 100 or 1000.
+        data_path (str, optional): The Hudl export.
+
+    Returns:
+        pl.DataFrame: The raw rows as strings, like pl.read_csv(..., infer_schema_length=0).
+    """
+    base = pl.read_csv(data_path, separator=";", infer_schema_length=0)
+    games = base["game_id"].cast(pl.Int64).max()
+    return pl.concat(
+        base.with_columns((pl.col("game_id").cast(pl.Int64) + copy * games).cast(pl.String))
+        for copy in range(scale)
+    )
+
+def _play(rng: random.Random, down: int, down_label: str, to_go, start: int, team_ids: tuple, kind: str) -> dict:
+    gain = {"run": rng.randint(-2, 12), "complete": rng.randint(0, 20)}.get(kind, 0)
+    summary = {
+        "run": f"{PLAYERS['rb']} rush for {gain} yards, tackled by {PLAYERS['lb']}",
+        "complete": f"{PLAYERS['qb']} pass complete to {PLAYERS['wr']} for {gain} yards, tackled by {PLAYERS['db']}",
+        "incomplete": f"{PLAYERS['qb']} pass incomplete",
+        "sack": f"{PLAYERS['qb']} sacked by {PLAYERS['rush']}",
+        "interception": f"{PLAYERS['qb']} pass intercepted to {PLAYERS['cb']}",
+        "touchdown": f"{PLAYERS['qb']} pass complete to {PLAYERS['wr']} touchdown",
+        "good": f"{PLAYERS['qb']} pass good",
+        "miss": f"{PLAYERS['qb']} pass incomplete miss",
+    }[kind]
+    end = min(start + gain, 50)
+    return {
+        "summary": summary,
+        "actionTitle": "Touchdown" if kind == "touchdown" else "Play",
+        "down": down,
+        "downLabel": down_label,
+        "nextDown": down % 4 + 1,
+        "nextDownLabel": "",
+        "target": to_go,
+        "nextTarget": to_go,
+        # Yardlines aus Sicht der jeweiligen Spielhälfte (0-25), wie im match-drives Payload
+        "startYardLine": {"yardLine": start if start <= 25 else 50 - start, "team": team_ids[start > 25]},
+        "endYardLine": {"yardLine": end if end <= 25 else 50 - end, "team": team_ids[end > 25]},
+    }
+
+def synthetic_game(game_id: int, plays: int = PLAYS_PER_GAME, seed: int = 0) -> tuple:
+    """One synthetic sportapp.fi game: a match-drives payload with about `plays` plays and the match-v1 payload.
+    Drives alternate between the teams, every drive runs until a touchdown (with a PAT), an interception
+    or a turnover on downs.
+
+    Returns:
+        tuple: (drives_data, match_data).
+    """
+    rng = random.Random(seed * 1_000_003 + game_id)
+    home, away = 2 * game_id, 2 * game_id + 1
+    halves, score = [], {home: 0, away: 0}
+    for half in range(2):
+        drives, count = [], 0
+        while count < plays // 2:
+            team = (home, away)[len(drives) % 2]
+            own, other = (team, home + away - team)
+            event_groups, yardline, down = [], 5, 1
+            while True:
+                kind = rng.choices(["run", "complete", "incomplete", "sack", "interception", "touchdown"], [30, 35, 20, 5, 3, 7])[0]
+                if 50 - yardline <= 5 and kind in ("run", "complete"):
+                    kind = "touchdown"
+                event_groups.append(_play(rng, down, ["1st", "2nd", "3rd", "4th"][down - 1], rng.choice([5, 10, 15, "G"]),
+                                          yardline, (own, other), kind))
+                if kind == "touchdown":
+                    pat = rng.choice(["PAT 5 yards", "PAT 10 yards"])
+                    made = rng.random() < 0.6
+                    event_groups.append(_play(rng, 1, pat, "G", 45 if pat == "PAT 5 yards" else 40, (own, other), "good" if made else "miss"))
+                    score[team] += 6 + (made * (1 if pat == "PAT 5 yards" else 2))
+                    break
+                if kind == "interception" or down == 4 or len(event_groups) >= 12:
+                    break
+                yardline = max(min(yardline + {"run": 5, "complete": 8, "sack": -3}.get(kind, 0), 49), 1)
+                down = down + 1
+            drives.append({"team": {"id": team, "threeLetters": f"T{team}"}, "eventGroups": event_groups[::-1],
+                           "yards": sum(1 for _ in event_groups), "timeOfPossession": "02:00"})
+            count += len(event_groups)
+        # match-drives liefert die Drives und Plays einer Halbzeit in umgekehrter Reihenfolge (siehe clean_sort)
+        halves.append({"num": half, "drives": drives[::-1]})
+    match_data = {
+        "series": {"id": 1, "region": "Synthetic", "level": "1", "seasonName": "2024", "phase": "regular", "groupId": 1, "groupName": "A"},
+        "home": {"id": home}, "away": {"id": away}, "streams": [],
+        "result": {"details": {"points_total_home": score[home], "points_total_away": score[away]}},
+    }
+    return halves, match_data
+
+def synthetic_season(scale: int, games: int = 47, seed: int = 0):
+    """Yields (game_id, drives_data, match_data) of scale * games synthetic games, about scale times
+    the number of plays in data_raw.csv."""
+    for game_id in range(1, scale * games + 1):
+        yield (game_id, *synthetic_game(game_id, seed=seed))
+
+def synthetic_raw_plays(scale: int, games: int = 47, seed: int = 0) -> pl.DataFrame:
+    """The raw sportapp.fi plays of synthetic_season, parsed like process_games_pl."""
+    return pl.concat(
+        [build_game_frame(game_id, iter_drive_plays(drives_data), match_data)
+         for game_id, drives_data, match_data in synthetic_season(scale, games, seed)],
+        how="vertical_relaxed", rechunk=True
+    )
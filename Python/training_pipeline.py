@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import polars as pl
+
+from helper_add_hudl_mutations import make_hudl_mutations, prepare_ep_data, prepare_wp_data
+from helper_add_model_mutations import make_ep_model_mutations, make_wp_model_mutations
+
+# Bei Aenderungen an den Stages, die nicht in den gehashten Modulen liegen, hochzaehlen
+TRANSFORM_VERSION = 1
+
+# Features, Ziel und ausgeschlossenes Testspiel wie in models/ep_model.ipynb und models/wp_model.ipynb
+MODEL_CONFIGS = {
+    "ep": {
+        "features": ["yardline_50", "yards_to_go", "down0", "down1", "down2", "down3", "down4"],
+        "weight": "Total_W_Scaled",
+        "prepare": prepare_ep_data,
+        "mutations": make_ep_model_mutations,
+        "exclude_game": 37,
+        "params": {"objective": "multi:softprob", "num_class": 5, "eval_metric": "mlogloss"},
+    },
+    "wp": {
+        "features": ["receive_2h_ko", "half_seconds_remaining", "game_seconds_remaining", "Diff_Time_Ratio",
+                     "score_differential", "down", "yards_to_go", "yardline_50"],
+        "weight": None,
+        "prepare": prepare_wp_data,
+        "mutations": make_wp_model_mutations,
+        "exclude_game": 35,
+        "params": {"objective": "binary:logistic", "eval_metric": "logloss"},
+    },
+}
+
+# Module, deren Code in den Key einer Stage eingeht; __name__ ist dieses Modul mit den build-Funktionen
+# der Stages (auch als Skript, dann '__main__')
+STAGE_MODULES = {
+    "plays": [__name__, "helper_add_hudl_mutations", "helper_pbp_sources"],
+    "labeled": [__name__, "helper_add_hudl_mutations", "helper_add_model_mutations"],
+    "matrix": [__name__],
+}
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def code_hash(stage: str) -> str:
+    """sha256 over the source files of the modules a stage runs (STAGE_MODULES) and TRANSFORM_VERSION."""
+    h = hashlib.sha256(str(TRANSFORM_VERSION).encode())
+    for name in STAGE_MODULES[stage]:
+        with open(sys.modules[name].__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def stage_key(stage: str, *parts) -> str:
+    """Key of a stage output: the code hash of the stage and the parts (input hashes, upstream keys, options)."""
+    return hashlib.sha256(json.dumps([stage, code_hash(stage), *parts]).encode()).hexdigest()
+
+class StageCache:
+    """
+    On-disk cache of the training stages, one file per stage output under <stage>/<key>.<ext> with a
+    <key>.json next to it (name, creation and last use). Every stage key contains the key of its input,
+    a changed CSV or a changed transform therefore invalidates all downstream stages.
+    An output replaces the older outputs of the same stage and name, those are stale and get removed.
+
+    Parameters:
+    root (str): Directory of the cache.
+    """
+    def __init__(self, root: str = "cache/training"):
+        self.root = root
+
+    def _path(self, stage, key, ext):
+        return os.path.join(self.root, stage, f"{key}.{ext}")
+
+    def _write(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _write_meta(self, stage, key, meta):
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(meta, f)
+        self._write(self._path(stage, key, "json"), write)
+
+    def _entries(self, stage):
+        directory = os.path.join(self.root, stage)
+        if not os.path.isdir(directory):
+            return
+        for filename in os.listdir(directory):
+            if filename.endswith(".json"):
+                try:
+                    with open(os.path.join(directory, filename), "r") as f:
+                        yield json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    continue
+
+    def _remove(self, stage, key):
+        removed = 0
+        for ext in ("json", "parquet", "npz"):
+            path = self._path(stage, key, ext)
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def get(self, stage, key, ext):
+        """Returns the path of a cached output or None, a hit counts as use."""
+        path = self._path(stage, key, ext)
+        meta_path = self._path(stage, key, "json")
+        if not (os.path.exists(path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        meta["used_at"] = time.time()
+        self._write_meta(stage, key, meta)
+        return path
+
+    def put(self, stage, key, ext, name, write) -> str:
+        """
+        Stores an output with write(path) and removes the stale outputs of the same stage and name.
+
+        Returns:
+        str: The path of the output.
+        """
+        path = self._path(stage, key, ext)
+        self._write(path, write)
+        now = time.time()
+        self._write_meta(stage, key, {"stage": stage, "key": key, "ext": ext, "name": name, "created_at": now, "used_at": now})
+        for entry in list(self._entries(stage)):
+            if entry.get("name") == name and entry.get("key") != key:
+                self._remove(stage, entry["key"])
+        return path
+
+    def evict(self, max_age: float = 30 * 24 * 3600) -> int:
+        """
+        Removes outputs not used for max_age seconds and files without their metadata.
+
+        Returns:
+        int: Number of removed files.
+        """
+        removed = 0
+        now = time.time()
+        for stage in STAGE_MODULES:
+            directory = os.path.join(self.root, stage)
+            if not os.path.isdir(directory):
+                continue
+            known = set()
+            for entry in list(self._entries(stage)):
+                if now - entry.get("used_at", 0) >= max_age:
+                    removed += self._remove(stage, entry["key"])
+                else:
+                    known.add(entry["key"])
+            for filename in os.listdir(directory):
+                if filename.split(".")[0] not in known:
+                    os.remove(os.path.join(directory, filename))
+                    removed += 1
+        return removed
+
+def _cached_frame(cache, stage, key, name, build) -> pl.DataFrame:
+    if cache is None:
+        return build()
+    path = cache.get(stage, key, "parquet")
+    if path is not None:
+        return pl.read_parquet(path)
+    df = build()
+    cache.put(stage, key, "parquet", name, lambda p: df.write_parquet(p))
+    return df
+
+def _plays_key(data_path, extra_paths) -> str:
+    return stage_key("plays", [file_hash(path) for path in (data_path, *extra_paths)])
+
+def _labeled_columns(kind) -> list:
+    config = MODEL_CONFIGS[kind]
+    return ["game_id", "label", *config["features"], *([config["weight"]] if config["weight"] else [])]
+
+def _labeled_key(kind, data_path, extra_paths) -> str:
+    return stage_key("labeled", _plays_key(data_path, extra_paths), kind, _labeled_columns(kind), MODEL_CONFIGS[kind]["exclude_game"])
+
+def load_plays(data_path: str = "data_raw.csv", extra_paths: list = (), cache: StageCache = None) -> pl.DataFrame:
+    """Stage 'plays': the Hudl export through make_hudl_mutations plus optional already mutated
+    play-by-play files (e.g. data/wc24_pbp.csv), concatenated diagonally.
+    """
+    def build():
+        df = make_hudl_mutations(pl.read_csv(data_path, separator=";", infer_schema_length=0))
+        df = df.with_columns(pl.col(pl.UInt32).cast(pl.Int32).name.keep())
+        for path in extra_paths:
+            extra = pl.read_csv(path, infer_schema_length=None).with_columns(pl.col(pl.Int64).cast(pl.Int32).name.keep())
+            df = pl.concat([df, extra], how="diagonal_relaxed")
+        return df
+
+    return _cached_frame(cache, "plays", _plays_key(data_path, extra_paths), os.path.abspath(data_path), build)
+
+def load_training_data(kind: str, data_path: str = "data_raw.csv", extra_paths: list = (), cache: StageCache = None) -> pl.DataFrame:
+    """Stage 'labeled': prepare_ep_data/prepare_wp_data and the label mutations of the notebooks, without nulls.
+
+    Args:
+        kind (str): 'ep' or 'wp'.
+        data_path (str, optional): The Hudl export.
+        extra_paths (list, optional): CSV files with mutated plays.
+        cache (StageCache, optional): Cache of the stage outputs, None runs every stage.
+
+    Returns:
+        pl.DataFrame: The label, the features and the weight column.
+    """
+    config = MODEL_CONFIGS[kind]
+
+    def build():
+        plays = load_plays(data_path, extra_paths, cache)
+        model_data = config["prepare"](plays).filter(pl.col("game_id") != config["exclude_game"])
+        return config["mutations"](model_data, _labeled_columns(kind)).drop_nulls()
+
+    return _cached_frame(cache, "labeled", _labeled_key(kind, data_path, extra_paths), f"{kind}:{os.path.abspath(data_path)}", build)
+
+def feature_matrix(kind: str, model_data: pl.DataFrame) -> tuple:
+    """Converts the model data into the float32 feature matrix, the labels, the weights (ones without
+    weight column) and the game_id of every row."""
+    config = MODEL_CONFIGS[kind]
+    X = model_data.select(config["features"]).to_numpy().astype(np.float32)
+    y = model_data["label"].to_numpy()
+    weight = model_data[config["weight"]].to_numpy() if config["weight"] else np.ones(len(y))
+    return X, y, weight, model_data["game_id"].to_numpy()
+
+def load_feature_matrix(kind: str, data_path: str = "data_raw.csv", extra_paths: list = (), cache: StageCache = None) -> dict:
+    """Stage 'matrix', the entry point of the training: a re-fit with other hyperparameters only reads
+    the cached matrix, the plays and labels are only rebuilt when the data or the transforms changed.
+
+    Args:
+        kind (str): 'ep' or 'wp'.
+        data_path (str, optional): The Hudl export.
+        extra_paths (list, optional): CSV files with mutated plays.
+        cache (StageCache, optional): Cache of the stage outputs, None runs every stage.
+
+    Returns:
+        dict: 'X', 'y', 'weight', 'groups' (game_id), 'features' and 'key' (identifies the training data).
+    """
+    features = MODEL_CONFIGS[kind]["features"]
+    key = stage_key("matrix", _labeled_key(kind, data_path, extra_paths), features)
+
+    path = cache.get("matrix", key, "npz") if cache is not None else None
+    if path is None:
+        X, y, weight, groups = feature_matrix(kind, load_training_data(kind, data_path, extra_paths, cache))
+        if cache is not None:
+            def write(path):
+                # np.savez haengt an Pfade ohne Endung '.npz' an, daher ueber das Dateiobjekt
+                with open(path, "wb") as f:
+                    np.savez(f, X=X, y=y, weight=weight, groups=groups)
+            cache.put("matrix", key, "npz", f"{kind}:{os.path.abspath(data_path)}", write)
+    else:
+        with np.load(path) as archive:
+            X, y, weight, groups = archive["X"], archive["y"], archive["weight"], archive["groups"]
+    return {"X": X, "y": y, "weight": weight, "groups": groups, "features": features, "key": key}
@@ -0,0 +1,185 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import xgboost as xgb
+from hyperopt import STATUS_OK, Trials, hp, space_eval, tpe
+from hyperopt.base import JOB_STATE_DONE, Domain
+from sklearn.model_selection import train_test_split
+
+from training_pipeline import MODEL_CONFIGS, StageCache, load_feature_matrix
+
+# Suchraum der Notebooks, n_estimators ist nur noch die Obergrenze fuer das Early Stopping
+SEARCH_SPACE = {
+    "max_depth": hp.quniform("max_depth", 3, 18, 1),
+    "gamma": hp.uniform("gamma", 0, 9),
+    "reg_alpha": hp.uniform("reg_alpha", 0, 0.05),
+    "reg_lambda": hp.uniform("reg_lambda", 0, 1),
+    "colsample_bytree": hp.uniform("colsample_bytree", 0.5, 1),
+    "min_child_weight": hp.quniform("min_child_weight", 0, 10, 1),
+    "eta": hp.uniform("eta", 0.01, 0.1),
+}
+INT_PARAMS = ("max_depth", "min_child_weight")
+
+def build_dmatrices(data: dict, test_size: float = 0.2, seed: int = 42) -> tuple:
+    """Splits the training data like the notebooks (train_test_split, random_state 42) and builds the
+    quantised matrices once, every trial trains on the same two matrices.
+
+    Args:
+        data (dict): The output of load_feature_matrix.
+
+    Returns:
+        tuple: (train QuantileDMatrix, validation QuantileDMatrix).
+    """
+    train_X, test_X, train_y, test_y, train_w, _ = train_test_split(
+        data["X"], data["y"], data["weight"], test_size=test_size, random_state=seed)
+    dtrain = xgb.QuantileDMatrix(train_X, train_y, weight=train_w, feature_names=data["features"])
+    dvalid = xgb.QuantileDMatrix(test_X, test_y, ref=dtrain, feature_names=data["features"])
+    return dtrain, dvalid
+
+def trial_params(kind: str, sample: dict, nthread: int = 1) -> dict:
+    """Turns a sample of SEARCH_SPACE into xgb.train parameters, only the integer parameters are cast."""
+    params = {"booster": "gbtree", "tree_method": "hist", "nthread": nthread, "seed": 0, **MODEL_CONFIGS[kind]["params"]}
+    for name, value in sample.items():
+        params[name] = int(value) if name in INT_PARAMS else float(value)
+    return params
+
+def run_trial(kind: str, sample: dict, dtrain, dvalid, max_rounds: int = 1000, early_stopping_rounds: int = 10,
+              nthread: int = 1) -> dict:
+    """Trains one trial with early stopping on the validation matrix.
+
+    Returns:
+        dict: The hyperopt result, 'loss' is the best validation log loss.
+    """
+    params = trial_params(kind, sample, nthread)
+    start = time.perf_counter()
+    booster = xgb.train(params, dtrain, num_boost_round=max_rounds, evals=[(dvalid, "valid")],
+                        early_stopping_rounds=early_stopping_rounds, verbose_eval=False)
+    return {
+        "loss": float(booster.best_score),
+        "status": STATUS_OK,
+        "best_iteration": int(booster.best_iteration),
+        "seconds": time.perf_counter() - start,
+    }
+
+def tune(kind: str, dtrain, dvalid, max_trials: int = 100, max_seconds: float = None, workers: int = None,
+         max_rounds: int = 1000, early_stopping_rounds: int = 10, seed: int = 0, verbose: bool = True) -> Trials:
+    """Runs the TPE search in batches of `workers` trials, a batch trains in parallel threads on the shared
+    matrices (XGBoost releases the GIL while training). TPE gets the results of all finished batches
+    before it suggests the next one. The search stops after max_trials or once max_seconds are used up,
+    a running batch is always finished.
+
+    Args:
+        kind (str): 'ep' or 'wp'.
+        dtrain, dvalid: The matrices of build_dmatrices.
+        max_trials (int, optional): Trial budget.
+        max_seconds (float, optional): Time budget.
+        workers (int, optional): Parallel trials, defaults to the number of cores.
+        max_rounds (int, optional): Upper bound of boosting rounds per trial.
+        early_stopping_rounds (int, optional): Rounds without improvement before a trial stops.
+        seed (int, optional): Seed of the TPE suggestions.
+
+    Returns:
+        Trials: All trials, the results carry 'best_iteration'.
+    """
+    workers = workers or os.cpu_count() or 1
+    nthread = max(1, (os.cpu_count() or 1) // workers)
+    domain = Domain(lambda sample: None, SEARCH_SPACE)
+    trials = Trials()
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while len(trials.trials) < max_trials:
+            if max_seconds is not None and time.perf_counter() - start >= max_seconds:
+                break
+            ids = trials.new_trial_ids(min(workers, max_trials - len(trials.trials)))
+            docs = tpe.suggest(ids, domain, trials, int(rng.integers(2**31 - 1)))
+            samples = [space_eval(SEARCH_SPACE, {k: v[0] for k, v in doc["misc"]["vals"].items() if v}) for doc in docs]
+            results = executor.map(
+                lambda sample: run_trial(kind, sample, dtrain, dvalid, max_rounds, early_stopping_rounds, nthread), samples)
+            for doc, result in zip(docs, results):
+                doc["state"] = JOB_STATE_DONE
+                doc["result"] = result
+            trials.insert_trial_docs(docs)
+            trials.refresh()
+            if verbose:
+                print(f"{len(trials.trials)} trials, best {kind} loss {min(trials.losses()):.5f} "
+                      f"({time.perf_counter() - start:.1f}s)")
+    return trials
+
+def best_sample(trials: Trials) -> dict:
+    """The parameters of the best trial."""
+    return space_eval(SEARCH_SPACE, {k: v[0] for k, v in trials.best_trial["misc"]["vals"].items() if v})
+
+def save_artifact(kind: str, data: dict, trials: Trials, models_dir: str = "models", promote: bool = False) -> str:
+    """Refits the best trial on all training data with the early stopped number of rounds (like model_tune
+    in the notebooks) and saves it as a versioned native model 'models/<kind>_model.<timestamp>.ubj'
+    next to a JSON file with the parameters, the validation loss and the key of the training data.
+
+    Args:
+        kind (str): 'ep' or 'wp'.
+        data (dict): The output of load_feature_matrix.
+        trials (Trials): The output of tune.
+        models_dir (str, optional): Target directory.
+        promote (bool, optional): Also copy the model to 'models/<kind>_model.ubj', the EP lookup table
+            has to be rebuilt afterwards (build_ep_lookup).
+
+    Returns:
+        str: The path of the versioned model.
+    """
+    sample = best_sample(trials)
+    rounds = trials.best_trial["result"]["best_iteration"] + 1
+    params = trial_params(kind, sample, nthread=os.cpu_count() or 1)
+    weight = data["weight"] if MODEL_CONFIGS[kind]["weight"] else None
+    dall = xgb.QuantileDMatrix(data["X"], data["y"], weight=weight, feature_names=data["features"])
+    booster = xgb.train(params, dall, num_boost_round=rounds)
+
+    version = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(models_dir, f"{kind}_model.{version}.ubj")
+    booster.save_model(path)
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump({
+            "model": kind,
+            "version": version,
+            "params": params,
+            "num_boost_round": rounds,
+            "valid_loss": trials.best_trial["result"]["loss"],
+            "trials": len(trials.trials),
+            "rows": len(data["y"]),
+            "data_key": data["key"],
+            "xgboost": xgb.__version__,
+        }, f, indent=2)
+    if promote:
+        shutil.copyfile(path, os.path.join(models_dir, f"{kind}_model.ubj"))
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter search for the EP and WP models")
+    parser.add_argument("model", choices=sorted(MODEL_CONFIGS))
+    parser.add_argument("--data", default="data_raw.csv")
+    parser.add_argument("--extra", nargs="*", default=[], help="Mutated play-by-play CSVs, e.g. data/wc24_pbp.csv")
+    parser.add_argument("--trials", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=None, help="Time budget of the search")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel trials, defaults to the number of cores")
+    parser.add_argument("--max-rounds", type=int, default=1000)
+    parser.add_argument("--early-stopping", type=int, default=10)
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--promote", action="store_true", help="Replace models/<model>_model.ubj with the result")
+    parser.add_argument("--cache-dir", default="cache/training", help="Cache of the feature engineering stages")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else StageCache(args.cache_dir)
+    if cache is not None:
+        cache.evict()
+    data = load_feature_matrix(args.model, args.data, args.extra, cache)
+    dtrain, dvalid = build_dmatrices(data)
+    trials = tune(args.model, dtrain, dvalid, args.trials, args.seconds, args.workers, args.max_rounds, args.early_stopping)
+    print(f"Best parameters: {best_sample(trials)}")
+    print(f"Saved {save_artifact(args.model, data, trials, args.models_dir, args.promote)}")
@@ -0,0 +1,64 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Python"))
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # Modelle und Rohdaten liegen relativ zum Repo, wie in den Notebooks
+    monkeypatch.chdir(ROOT)
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.rsplit("/", 1)[-1]
+        game_id = int(parse_qs(url.query)["id"][0])
+        self.server.requests.append((time.monotonic(), endpoint, game_id))
+        # Unterschiedliche Antwortzeiten, damit parallele Abrufe in anderer Reihenfolge fertig werden
+        time.sleep(random.uniform(0, 0.01))
+        body = self.server.respond(endpoint, game_id)
+        if isinstance(body, int):
+            self.send_response(body)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+@pytest.fixture
+def api_server():
+    """Starts a local stand-in for the sportapp.fi API: start(respond) returns (server, base_url),
+    respond(endpoint, game_id) gives the JSON body or a status code. server.requests records
+    (arrival time, endpoint, game_id) of every request."""
+    servers = []
+
+    def start(respond):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), ApiHandler)
+        server.respond = respond
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/api/v1/public"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,33 @@
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from fetch_sportappfi_api import build_game_frame, iter_drive_plays, process_games_pl
+from synthetic_pbp import synthetic_game
+
+GAME_IDS = list(range(1, 9))
+
+@pytest.fixture
+def api(api_server):
+    return api_server(lambda endpoint, game_id: synthetic_game(game_id, plays=30)[endpoint == "match-v1"])
+
+def test_process_games_pl_is_independent_of_the_number_of_workers(api):
+    _, base_url = api
+    serial = process_games_pl(GAME_IDS, "key", max_workers=1, base_url=base_url)
+    assert serial["game_id"].unique().sort().to_list() == GAME_IDS
+    assert_frame_equal(serial, process_games_pl(GAME_IDS, "key", max_workers=8, base_url=base_url))
+
+def test_yards_to_go_are_strings_even_if_all_missing():
+    drives_data, match_data = synthetic_game(1, plays=30)
+    for drive in drives_data:
+        for event_group in drive["drives"]:
+            for play in event_group["eventGroups"]:
+                play.pop("target", None)
+                play.pop("nextTarget", None)
+    frame = build_game_frame(1, iter_drive_plays(drives_data), match_data)
+    assert frame.schema["yards_to_go"] == frame.schema["yards_to_go_after"] == pl.String
+    assert frame["yards_to_go"].null_count() == frame.height
+
+def test_game_without_plays_has_no_frame():
+    _, match_data = synthetic_game(1, plays=30)
+    assert build_game_frame(1, iter_drive_plays([]), match_data) is None
@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from fetch_sportappfi_api import HostRateLimiter, fetch_game_payloads, process_games
+
+GAME_IDS = list(range(1, 13))
+# Spiel -> Endpunkt, der mit einem Fehler antwortet
+FAILING = {4: "match-v1", 9: "match-drives"}
+
+def _drives(game_id):
+    home, away = 2 * game_id, 2 * game_id + 1
+    play = {"summary": "#12 pass complete to #7 for 8 yards", "actionTitle": "Play", "down": 1, "downLabel": "1st",
+            "nextDown": 2, "nextDownLabel": "2nd", "target": 10, "nextTarget": 2,
+            "startYardLine": {"yardLine": 20, "team": away}, "endYardLine": {"yardLine": 28, "team": away}}
+    return [{"num": half, "drives": [
+        {"team": {"id": team, "threeLetters": f"T{team}"}, "eventGroups": [play] * (game_id % 3 + 1),
+         "yards": 8, "timeOfPossession": "01:00"}
+        for team in (home, away)
+    ]} for half in (0, 1)]
+
+def _match(game_id):
+    return {"series": {"id": 1, "region": "South", "level": "1", "seasonName": "2024", "phase": "regular",
+                       "groupId": 1, "groupName": "A"},
+            "home": {"id": 2 * game_id}, "away": {"id": 2 * game_id + 1}, "streams": [],
+            "result": {"details": {"points_total_home": 7, "points_total_away": 3}}}
+
+def respond(endpoint, game_id):
+    if FAILING.get(game_id) == endpoint:
+        return 500
+    return _drives(game_id) if endpoint == "match-drives" else _match(game_id)
+
+@pytest.fixture
+def api(api_server):
+    return api_server(respond)
+
+def test_process_games_is_independent_of_the_number_of_workers(api):
+    _, base_url = api
+    plays = process_games(GAME_IDS, "key", max_workers=1, base_url=base_url)
+    assert len(plays) > 0
+    assert_frame_equal(plays, process_games(GAME_IDS, "key", max_workers=8, base_url=base_url))
+
+def test_games_with_failing_requests_are_skipped(api):
+    _, base_url = api
+    for game_id in FAILING:
+        assert fetch_game_payloads(game_id, "key", base_url=base_url) is None
+    assert fetch_game_payloads(1, "key", base_url=base_url) == (_drives(1), _match(1))
+
+    plays = process_games(GAME_IDS, "key", max_workers=4, base_url=base_url)
+    assert sorted(plays["game_id"].unique()) == sorted(set(GAME_IDS) - set(FAILING))
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = HostRateLimiter(requests_per_second=50)
+    times = {"a": [], "b": []}
+
+    def request(host):
+        limiter.wait(f"http://{host}/api")
+        times[host].append(time.monotonic())
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(request, ["a", "b"] * 8))
+    for host_times in times.values():
+        gaps = [b - a for a, b in zip(sorted(host_times), sorted(host_times)[1:])]
+        assert min(gaps) >= limiter.interval * 0.9
+    # Zwei Hosts werden unabhaengig voneinander begrenzt
+    assert time.monotonic() - start < 16 * limiter.interval
+
+def test_process_games_respects_requests_per_second(api):
+    server, base_url = api
+    game_ids = [game_id for game_id in GAME_IDS if game_id not in FAILING][:5]
+    process_games(game_ids, "key", max_workers=8, requests_per_second=40, base_url=base_url)
+    arrivals = sorted(arrival for arrival, _, _ in server.requests)
+    assert len(arrivals) == 10
+    # Abstand am Server, etwas Toleranz fuer die Netzwerklatenz
+    assert arrivals[-1] - arrivals[0] >= 9 / 40 * 0.9
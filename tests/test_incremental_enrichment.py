@@ -0,0 +1,36 @@
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from helper_add_ep_wp import add_ep_variables, add_ep_variables_incremental, add_wp_variables, add_wp_variables_incremental
+from helper_add_hudl_mutations import make_hudl_mutations, prepare_ep_data, prepare_wp_data
+from helper_model_scoring import score_ep, score_wp
+
+EP_COLUMNS = ["game_id", "play_id", "half_end", "game_end", "ep", "epa", "home_team_epa", "total_home_epa", "total_away_epa"]
+WP_COLUMNS = ["game_id", "play_id", "half_end", "game_end", "wp", "home_wp", "wpa",
+              "total_home_wp", "total_away_wp", "total_home_wpa", "total_away_wpa"]
+
+@pytest.fixture(scope="module")
+def scored_plays():
+    raw = make_hudl_mutations(pl.read_csv("data_raw.csv", separator=";", infer_schema_length=0))
+    raw = raw.filter(pl.col("game_id").is_in([1, 2, 3]))
+    # Ein paar Plays ohne Modellwahrscheinlichkeit
+    raw = raw.with_columns(yardline_50 = pl.when(pl.col("index") % 13 == 0).then(None).otherwise(pl.col("yardline_50")))
+    return score_wp(score_ep(prepare_wp_data(prepare_ep_data(raw)).drop("ep", strict=False))).drop("half_end", "game_end")
+
+def _split(plays, at):
+    # Neue Plays kommen mit eigenem index, der wieder bei 1 beginnt
+    new_plays = plays.slice(at).with_columns(index = pl.int_range(1, pl.len() + 1).cast(plays.schema["index"]))
+    return plays.head(at), new_plays
+
+@pytest.mark.parametrize("at", [0.5, 0.9])
+def test_incremental_matches_full_recompute(scored_plays, at):
+    prefix, new_plays = _split(scored_plays, int(scored_plays.height * at))
+
+    full_ep = add_ep_variables(prepare_ep_data(scored_plays))
+    incremental_ep = add_ep_variables_incremental(add_ep_variables(prepare_ep_data(prefix)), new_plays)
+    assert_frame_equal(incremental_ep.select(EP_COLUMNS), full_ep.select(EP_COLUMNS), check_dtypes=False)
+
+    full_wp = add_wp_variables(prepare_wp_data(scored_plays))
+    incremental_wp = add_wp_variables_incremental(add_wp_variables(prepare_wp_data(prefix)), new_plays)
+    assert_frame_equal(incremental_wp.select(WP_COLUMNS), full_wp.select(WP_COLUMNS), check_dtypes=False)
@@ -0,0 +1,30 @@
+import pytest
+
+import ingest_sportappfi
+from helper_pbp_store import PLAY_SCHEMA, scan_pbp_store
+from synthetic_pbp import synthetic_game
+
+@pytest.fixture
+def api(monkeypatch):
+    # game_id -> (drives_data, match_data), wie fetch_games sie liefert
+    payloads = {game_id: synthetic_game(game_id, plays=30) for game_id in (1, 2, 3)}
+    monkeypatch.setattr(ingest_sportappfi, "fetch_games",
+                        lambda game_ids, *args: [(game_id, payloads.get(game_id)) for game_id in game_ids])
+    return payloads
+
+def _game_ids(store_path):
+    if ingest_sportappfi.is_dataset_store(store_path):
+        return sorted(scan_pbp_store(store_path, PLAY_SCHEMA).collect()["game_id"].unique())
+    return sorted(ingest_sportappfi.read_store(store_path)["game_id"].unique())
+
+@pytest.mark.parametrize("store_name", ["plays.csv", "plays.parquet", "plays"])
+def test_game_without_plays_is_removed_from_the_store(api, tmp_path, store_name):
+    store_path, manifest_path = str(tmp_path / store_name), str(tmp_path / "manifest.json")
+    assert ingest_sportappfi.ingest_games_incremental([1, 2, 3], "key", store_path, manifest_path) == [1, 2, 3]
+    assert _game_ids(store_path) == [1, 2, 3]
+
+    # Die Plays von Spiel 2 wurden in der API geloescht
+    api[2] = ([], api[2][1])
+    assert ingest_sportappfi.ingest_games_incremental([1, 2, 3], "key", store_path, manifest_path) == [2]
+    assert _game_ids(store_path) == [1, 3]
+    assert ingest_sportappfi.ingest_games_incremental([1, 2, 3], "key", store_path, manifest_path) == []
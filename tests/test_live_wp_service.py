@@ -0,0 +1,17 @@
+from live_wp_service import GAME_SECONDS, HALF_SECONDS, LiveGame
+
+def test_clocks_only_decrease_in_long_halves():
+    game = LiveGame(1, "HOME", "AWAY", plays_per_half=40)
+    plays = [{"half": half, "posteam": "HOME", "down": 1, "yards_to_go": 10, "yardline_50": 25}
+             for half in (1, 2) for _ in range(70)]
+    features = [game.wp_features(play) for play in plays]
+
+    for key in ("half_seconds_remaining", "game_seconds_remaining"):
+        clock = [f[key] for f in features]
+        half_clock = clock[:70], clock[70:]
+        for values in half_clock:
+            assert all(b < a for a, b in zip(values, values[1:]))
+    game_clock = [f["game_seconds_remaining"] for f in features]
+    assert all(b < a for a, b in zip(game_clock, game_clock[1:]))
+    assert game_clock[0] == GAME_SECONDS and min(game_clock[:70]) > HALF_SECONDS
+    assert game_clock[70] == HALF_SECONDS
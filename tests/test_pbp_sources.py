@@ -0,0 +1,30 @@
+import polars as pl
+
+from helper_add_hudl_mutations import add_period_ends
+from helper_pbp_sources import build_plays
+from synthetic_pbp import synthetic_raw_plays
+
+def test_build_plays_gives_every_source_game_its_own_game_id():
+    hudl = pl.read_csv("data_raw.csv", separator=";", infer_schema_length=0)
+    sportappfi = synthetic_raw_plays(1, games=3)
+    plays = build_plays({"hudl": hudl, "sportappfi": sportappfi})
+
+    # Beide Quellen zaehlen ihre Spiele ab 1
+    games = plays.select("source", "source_game_id", "game_id").unique()
+    assert games.height == plays.select("source", "source_game_id").n_unique()
+    assert games["game_id"].n_unique() == games.height
+    assert sorted(games.filter(source="sportappfi")["source_game_id"]) == [1, 2, 3]
+
+    # Schritte, die nur auf game_id fenstern, sehen jedes Spiel einmal
+    ends = add_period_ends(plays).group_by("game_id").agg(pl.col("game_end").sum(), pl.col("source").n_unique())
+    assert (ends["game_end"] <= 1).all() and (ends["source"] == 1).all()
+
+def test_build_plays_game_ids_do_not_depend_on_the_call():
+    hudl = pl.read_csv("data_raw.csv", separator=";", infer_schema_length=0)
+    sportappfi = synthetic_raw_plays(1, games=3)
+    together = build_plays({"hudl": hudl, "sportappfi": sportappfi}).filter(source="sportappfi")
+    # Spaeterer Batch mit nur einem Teil der Spiele
+    alone = build_plays({"sportappfi": sportappfi.filter(pl.col("game_id") == 3)})
+
+    key = ["source_game_id", "game_id"]
+    assert alone.select(key).unique().rows() == together.filter(source_game_id=3).select(key).unique().rows()
@@ -0,0 +1,24 @@
+import polars as pl
+
+from helper_pbp_store import PLAY_SCHEMA, scan_pbp_store, write_pbp_store
+
+def _plays(games: dict, plays_per_game: int = 3) -> pl.DataFrame:
+    # games: game_id -> season, 'index' beginnt wie bei transform_games je Batch bei 1
+    return pl.DataFrame({
+        "season": [season for season in games.values() for _ in range(plays_per_game)],
+        "competition_id": 7,
+        "game_id": [game_id for game_id in games for _ in range(plays_per_game)],
+        "play_id": [play_id for _ in games for play_id in range(1, plays_per_game + 1)],
+    }).with_row_index(offset=1)
+
+def test_batches_replace_games_and_keep_index_unique(tmp_path):
+    root = str(tmp_path / "pbp")
+    write_pbp_store(_plays({1: "2023", 2: "2023"}), root, PLAY_SCHEMA)
+    # Spiel 2 wurde nachtraeglich der Saison 2024 zugeordnet
+    write_pbp_store(_plays({2: "2024", 3: "2024"}), root, PLAY_SCHEMA)
+
+    plays = scan_pbp_store(root, PLAY_SCHEMA).collect()
+    assert plays["index"].to_list() == list(range(1, 10))
+    assert plays.group_by("game_id", maintain_order=True).agg(pl.col("season").unique()).rows() == \
+           [(1, ["2023"]), (2, ["2024"]), (3, ["2024"])]
+    assert not (tmp_path / "pbp" / "season=2023" / "competition_id=7" / "game_id=2").exists()
@@ -0,0 +1,70 @@
+import json
+import os
+
+from sportappfi_cache import ResponseCache
+
+RESULT = {"details": {"points_total_home": 14, "points_total_away": 7}}
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode() if payload is not None else b""
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+class FakeApi:
+    """Answers with the match payload and ETag "v1", a matching If-None-Match with 304."""
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, headers):
+        self.requests.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, {"result": RESULT}, {"ETag": '"v1"'})
+
+def _fetch(cache, api, game_id=1):
+    return cache.fetch_json("match-v1", game_id, f"http://api/match-v1?id={game_id}", api.get)
+
+def test_game_with_result_is_revalidated_after_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl={"match-v1": 0})
+    api = FakeApi()
+    for _ in range(2):
+        assert _fetch(cache, api) == (200, {"result": RESULT})
+    assert api.requests == [{}, {"If-None-Match": '"v1"'}]
+    assert not cache.entry("match-v1", 1)["final"]
+
+def test_games_marked_final_are_not_fetched_again(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl={"match-v1": 0, "teams-players": 0}, final_games=[1])
+    api = FakeApi()
+    for _ in range(3):
+        assert _fetch(cache, api) == (200, {"result": RESULT})
+    assert api.requests == [{}]
+    # Team-IDs teilen sich den Wertebereich der Spiel-IDs, sind aber nie final
+    cache.fetch_json("teams-players", 1, "http://api/teams-players?team=1", api.get)
+    assert not cache.entry("teams-players", 1)["final"]
+
+def _as_old_final_entry(cache, root, game_id):
+    # Eintrag wie ihn die alte Regel (result vorhanden -> final) geschrieben hat
+    entry = cache.entry("match-v1", game_id)
+    entry["final"] = True
+    del entry["version"]
+    with open(os.path.join(root, "index", "match-v1", f"{game_id}.json"), "w") as f:
+        json.dump(entry, f)
+
+def test_entries_of_the_old_index_are_not_final(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl={"match-v1": 0})
+    api = FakeApi()
+    _fetch(cache, api, 1)
+    _fetch(cache, api, 2)
+    _as_old_final_entry(cache, str(tmp_path), 1)
+    _as_old_final_entry(cache, str(tmp_path), 2)
+
+    assert not cache.is_fresh(cache.entry("match-v1", 1))
+    _fetch(cache, api, 1)
+    assert api.requests[-1] == {"If-None-Match": '"v1"'}
+
+    cache.evict()
+    assert cache.entry("match-v1", 2) is None
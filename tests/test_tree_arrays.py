@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from helper_model_scoring import load_booster
+from helper_tree_arrays import export_tree_arrays, flatten_trees, load_tree_arrays, predict_trees
+
+@pytest.mark.parametrize("model", ["models/ep_model.ubj", "models/wp_model.ubj"])
+def test_flattened_and_exported_trees_match_the_booster(model, tmp_path):
+    booster = load_booster(model)
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 50, size=(500, len(booster.feature_names))).astype(np.float32)
+    X[rng.random(X.shape) < 0.05] = np.nan
+    expected = booster.inplace_predict(X, missing=np.nan)
+
+    trees = flatten_trees(booster)
+    np.testing.assert_allclose(predict_trees(trees, X), expected, atol=1e-5)
+
+    path = export_tree_arrays(model, str(tmp_path / "model.trees.npz"))
+    loaded = load_tree_arrays(path, model)
+    assert {key: loaded[key] for key in ("objective", "num_class", "features")} == \
+           {key: trees[key] for key in ("objective", "num_class", "features")}
+    np.testing.assert_allclose(predict_trees(loaded, X), expected, atol=1e-5)